@@ -0,0 +1,5 @@
+#!python3
+if __name__ == '__main__':
+    import sys
+    import floppy.batch
+    sys.exit(floppy.batch.main())
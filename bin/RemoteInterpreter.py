@@ -8,4 +8,4 @@ if __name__ == '__main__':
         print('Error: Last argument must be port number.')
         exit()
     import floppy.runner
-    floppy.runner.spawnRunner(port)
+    floppy.runner.spawnRunner(port, asyncServer='--threaded' not in argv)
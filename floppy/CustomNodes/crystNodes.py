@@ -4,7 +4,9 @@
 from lauescript.cryst.transformations import frac2cart
 from lauescript.types.adp import ADPDataError
 from floppy.node import Node, abstractNode, Input, Output, Tag, ForLoop
-from floppy.FloppyTypes import Atom
+from floppy.FloppyTypes import Atom, Buffer
+from floppy.buffer import iterLines
+from floppy.neighbourSearch import getPairsWithinCutoff
 import subprocess
 import os
 
@@ -64,6 +66,8 @@ class Frac2Cart(CrystNode):
     Input('Position', float, list=True)
     Input('Cell', float, list=True)
     Output('Cart', float, list=True)
+    processSafe = True
+    pure = True
 
     def run(self):
         super(Frac2Cart, self).run()
@@ -82,6 +86,7 @@ class SelectAtom(CrystNode):
 
 
 class PDB2INS(CrystNode):
+    Tag('resource:pdb2ins')
     Input('FileName', str)
     Input('Wavelength', float)
     Input('HKLF', int)
@@ -153,23 +158,75 @@ class PDB2INS(CrystNode):
         return r
 
 
+def parsePDBHeader(lines):
+    """
+    Extracts the PDB code and the R value of the working set from the lines of a PDB file.
+    :param lines: Iterable of strings.
+    :return: Tuple (code, r1).
+    """
+    code = r1 = None
+    for line in lines:
+        if line.startswith('REMARK   3   R VALUE') and '(WORKING SET)' in line:
+            line = [i for i in line[:-1].split() if i]
+            r1 = line[-1]
+        elif line.startswith('HEADER'):
+            line = [i for i in line[:-1].split() if i]
+            code = line[-1]
+    return code, r1
+
+
 class BreakPDB(CrystNode):
     Input('PDB', str)
     Output('Code', str)
     Output('R1', float)
+    processSafe = True
+    pure = True
+
+    def run(self):
+        code, r1 = parsePDBHeader(self._PDB.splitlines())
+        self._Code(code)
+        self._R1(r1)
+
+
+class BreakMappedPDB(CrystNode):
+    """
+    Variant of BreakPDB for PDB files mapped into memory by the MapFile node.
+    Only the lines that contain the requested records are decoded. All other lines are skipped without copying them.
+    """
+    Input('PDB', Buffer)
+    Output('Code', str)
+    Output('R1', float)
 
     def run(self):
-        for line in self._PDB.splitlines():
-            if line.startswith('REMARK   3   R VALUE') and '(WORKING SET)' in line:
-                line = [i for i in line[:-1].split() if i]
-                r1 = line[-1]
-            elif line.startswith('HEADER'):
-                line = [i for i in line[:-1].split() if i]
-                code = line[-1]
+        super(BreakMappedPDB, self).run()
+        lines = (str(line, 'ascii', 'replace') for line in iterLines(self._PDB)
+                 if line[:6] == b'HEADER' or line[:20] == b'REMARK   3   R VALUE')
+        code, r1 = parsePDBHeader(lines)
         self._Code(code)
         self._R1(r1)
 
 
+class AtomPairsWithinCutoff(CrystNode):
+    """
+    Finds all pairs of atoms whose distance does not exceed 'Cutoff' in a single step. Unlike iterating over all pairs
+    with ForEachAtomPair, the search only compares atoms in neighbouring cells of a cell list.
+    The outputs form a table with one row per pair.
+    """
+    Input('Atoms', Atom, list=True)
+    Input('Cutoff', float)
+    Output('Atom1', Atom, list=True)
+    Output('Atom2', Atom, list=True)
+    Output('Distance', float, list=True)
+
+    def run(self):
+        super(AtomPairsWithinCutoff, self).run()
+        atoms = self._Atoms
+        pairs, distances = getPairsWithinCutoff([atom.get_cart() for atom in atoms], self._Cutoff)
+        self._Atom1([atoms[i] for i in pairs[:, 0]])
+        self._Atom2([atoms[j] for j in pairs[:, 1]])
+        self._Distance(distances.tolist())
+
+
 class ForEachAtomPair(ForLoop):
     Input('Start', Atom, list=True)
     Output('Atom1', Atom)
@@ -194,3 +251,14 @@ class ForEachAtomPair(ForLoop):
         if self.x >= self.end:
             self._Final(self._Start)
             self.done = True
+
+    def getState(self):
+        state = super(ForEachAtomPair, self).getState()
+        if not self.fresh:
+            state['pair'] = (self.x, self.y, self.end)
+        return state
+
+    def setState(self, state):
+        super(ForEachAtomPair, self).setState(state)
+        if 'pair' in state:
+            self.x, self.y, self.end = state['pair']
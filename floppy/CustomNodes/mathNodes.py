@@ -1,5 +1,17 @@
 from floppy.node import Node, abstractNode, Input, Output, Tag
+from floppy.FloppyTypes import Array
+from floppy.neighbourSearch import getPairsWithinCutoff
 from math import sin, cos, pi
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def requireNumpy():
+    if numpy is None:
+        raise ImportError('Array nodes require NumPy.')
+    return numpy
 
 
 def norm(v: list):
@@ -10,6 +22,8 @@ def norm(v: list):
 @abstractNode
 class MathNode(Node):
     Tag('Math')
+    processSafe = True
+    pure = True
 
 
 class Add(MathNode):
@@ -20,6 +34,13 @@ class Add(MathNode):
     def run(self):
         self._Sum(self._F1 + self._F2)
 
+    def runBatch(self, batch):
+        if numpy is None:
+            return [{'Sum': float(inputs['F1']) + float(inputs['F2'])} for inputs in batch]
+        f1 = numpy.array([inputs['F1'] for inputs in batch], dtype=float)
+        f2 = numpy.array([inputs['F2'] for inputs in batch], dtype=float)
+        return [{'Sum': value} for value in (f1 + f2).tolist()]
+
 
 
 @abstractNode
@@ -36,7 +57,7 @@ class CrossProduct(VectorNode):
         super(CrossProduct, self).run()
         v1 = self._Vector1
         v2 = self._Vector2
-        self._XProduct(v1[1]*v2[2]-v1[2]*v2[1], v1[2]*v2[0]-v1[0]*v2[2], v1[0]*v2[1]-v1[1]*v2[0])
+        self._XProduct([v1[1]*v2[2]-v1[2]*v2[1], v1[2]*v2[0]-v1[0]*v2[2], v1[0]*v2[1]-v1[1]*v2[0]])
 
 
 class DotProduct(VectorNode):
@@ -63,6 +84,14 @@ class Distance(VectorNode):
         d = (v1[0]-v2[0])**2 + (v1[1]-v2[1])**2 + (v1[2]-v2[2])**2
         self._Distance(d**.5)
 
+    def runBatch(self, batch):
+        if numpy is None:
+            return [{'Distance': sum((a-b)**2 for a, b in zip(inputs['Position1'][:3], inputs['Position2'][:3]))**.5}
+                    for inputs in batch]
+        p1 = numpy.array([inputs['Position1'][:3] for inputs in batch], dtype=float)
+        p2 = numpy.array([inputs['Position2'][:3] for inputs in batch], dtype=float)
+        return [{'Distance': value} for value in numpy.linalg.norm(p1 - p2, axis=1).tolist()]
+
 
 class Difference(VectorNode):
     Input('Vector1', float, list=True)
@@ -118,9 +147,115 @@ class RotateAbout(VectorNode):
         t = angle * (pi/180)
         x, y, z = point[0], point[1], point[2]
         a, b, c = axisOrigin[0], axisOrigin[1], axisOrigin[2]
-        axisDirection /= norm(axisDirection)
+        axisDirection = norm(axisDirection)
         u, v, w = axisDirection[0], axisDirection[1], axisDirection[2]
         xx = (a*(v**2+w**2)-u*(b*v+c*w-u*x-v*y-w*z)) * (1-cos(t)) + x*cos(t) + (-1*c*v+b*w-w*y+v*z) * sin(t)
         yy = (b*(u**2+w**2)-v*(a*u+c*w-u*x-v*y-w*z)) * (1-cos(t)) + y*cos(t) + ( 1*c*u-a*w+w*x-u*z) * sin(t)
         zz = (c*(u**2+v**2)-w*(a*u+b*v-u*x-v*y-w*z)) * (1-cos(t)) + z*cos(t) + (-1*b*u+a*v-v*x+u*y) * sin(t)
         self._RotatedPoint([xx, yy, zz])
+
+
+@abstractNode
+class ArrayNode(MathNode):
+    """
+    Base class for nodes processing many vectors at once. The vectors are passed as the rows of an Nx3 array.
+    """
+    Tag('Array')
+    Tag('Vector')
+
+
+class VectorsToArray(ArrayNode):
+    Input('Vectors', object, list=True)
+    Output('Array', Array)
+
+    def run(self):
+        super(VectorsToArray, self).run()
+        np = requireNumpy()
+        self._Array(np.array(self._Vectors, dtype=float).reshape(-1, 3))
+
+
+class ArrayToVectors(ArrayNode):
+    Input('Array', Array)
+    Output('Vectors', object, list=True)
+
+    def run(self):
+        super(ArrayToVectors, self).run()
+        self._Vectors(self._Array.tolist())
+
+
+class CrossProductArray(ArrayNode):
+    Input('Array1', Array)
+    Input('Array2', Array)
+    Output('XProducts', Array)
+
+    def run(self):
+        super(CrossProductArray, self).run()
+        np = requireNumpy()
+        self._XProducts(np.cross(self._Array1, self._Array2))
+
+
+class DotProductArray(ArrayNode):
+    Input('Array1', Array)
+    Input('Array2', Array)
+    Output('DotProducts', Array)
+
+    def run(self):
+        super(DotProductArray, self).run()
+        np = requireNumpy()
+        self._DotProducts(np.einsum('ij,ij->i', np.atleast_2d(self._Array1), np.atleast_2d(self._Array2)))
+
+
+class NormalizeArray(ArrayNode):
+    Input('Array', Array)
+    Output('NArray', Array)
+
+    def run(self):
+        super(NormalizeArray, self).run()
+        np = requireNumpy()
+        array = np.atleast_2d(self._Array)
+        norms = np.linalg.norm(array, axis=1)
+        zeroRows = np.flatnonzero(norms == 0)
+        if zeroRows.size:
+            # Normalize raises for zero-length vectors as well instead of returning NaN.
+            raise ZeroDivisionError('Cannot normalize zero-length vectors in rows {}.'.format(zeroRows.tolist()))
+        self._NArray(array / norms[:, None])
+
+
+class RotateArrayAbout(ArrayNode):
+    """
+    Rotates all points of an array about the same axis (see RotateAbout).
+    """
+    Input('Points', Array)
+    Input('PointOnAxis', float, list=True)
+    Input('AxisDirection', float, list=True)
+    Input('Degree', float)
+    Output('RotatedPoints', Array)
+
+    def run(self):
+        super(RotateArrayAbout, self).run()
+        np = requireNumpy()
+        t = self._Degree * (pi/180)
+        origin = np.array(self._PointOnAxis, dtype=float)
+        k = np.array(norm(self._AxisDirection), dtype=float)
+        points = np.atleast_2d(self._Points) - origin
+        # Rodrigues' rotation formula applied to all rows at once.
+        rotated = (points * cos(t) + np.cross(k, points) * sin(t) +
+                   np.outer(points.dot(k), k) * (1 - cos(t)))
+        self._RotatedPoints(rotated + origin)
+
+
+class PairsWithinCutoff(ArrayNode):
+    """
+    Finds all pairs of points closer than 'Cutoff' with a cell list search (see getPairsWithinCutoff).
+    'Pairs' holds the row indices of the two points of each pair, 'Distances' the corresponding distances.
+    """
+    Input('Points', Array)
+    Input('Cutoff', float)
+    Output('Pairs', Array)
+    Output('Distances', Array)
+
+    def run(self):
+        super(PairsWithinCutoff, self).run()
+        pairs, distances = getPairsWithinCutoff(self._Points, self._Cutoff)
+        self._Pairs(pairs)
+        self._Distances(distances)
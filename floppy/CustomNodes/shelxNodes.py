@@ -1,7 +1,10 @@
 from floppy.node import Node, Input, Output, Tag, abstractNode
 from floppy.CustomNodes.crystNodes import CrystNode
 import subprocess
+import asyncio
 import os
+import shutil
+import tempfile
 
 @abstractNode
 class ShelxNode(CrystNode):
@@ -9,6 +12,7 @@ class ShelxNode(CrystNode):
 
 
 class RunShelxl(ShelxNode):
+    Tag('resource:shelxl')
     Input('INS', str)
     Input('HKL', str)
     Input('List', int,  optional=True)
@@ -25,41 +29,33 @@ class RunShelxl(ShelxNode):
         self.p = None
         self.stdout = ''
 
-    def run(self):
+    async def run(self):
         super(RunShelxl, self).run()
-        with open('__tmp__.ins', 'w') as fp:
-            fp.write(self._INS)
-        with open('__tmp__.hkl', 'w') as fp:
-            fp.write(self._HKL)
-
-        self.p = subprocess.Popen('shelxl {}'.format('__tmp__'), shell=True, stdout=subprocess.PIPE)
-        while True:
-            line = self.p.stdout.readline()
-            if not line:
-                break
-            self.stdout += str(line)[1:]
-        #os.waitpid(self.p.pid, 0)
-        output = ''
-        with open('__tmp__.res', 'r') as fp:
-            output = fp.read()
-        self._RES(output)
-        with open('__tmp__.lst', 'r') as fp:
-            output = fp.read()
-        for line in output.splitlines():
+        loop = asyncio.get_event_loop()
+        # Every run works in its own directory. Runs executed concurrently by the Async engine would otherwise
+        # overwrite each other's files. The blocking file operations are done by the loop's default executor.
+        directory = await loop.run_in_executor(None, tempfile.mkdtemp, '', 'shelxl-')
+        try:
+            await loop.run_in_executor(None, writeShelxlInput, directory, self._INS, self._HKL)
+            self.p = await asyncio.create_subprocess_exec('shelxl', '__tmp__', stdout=subprocess.PIPE, cwd=directory)
+            while True:
+                line = await self.p.stdout.readline()
+                if not line:
+                    break
+                self.stdout += str(line)[1:]
+            await self.p.wait()
+            res, lst, fcf = await loop.run_in_executor(None, readShelxlOutput, directory)
+        finally:
+            await loop.run_in_executor(None, shutil.rmtree, directory, True)
+        self._RES(res)
+        for line in lst.splitlines():
             if line.startswith(' R1 ='):
                 line = [i for i in line.split() if i]
                 R1 = float(line[2])
                 break
         self._R1(R1)
-        self._LST(output)
-        with open('__tmp__.fcf', 'r') as fp:
-            output = fp.read()
-        self._FCF(output)
-
-
-        for file in os.listdir():
-            if file.startswith('__tmp__'):
-                os.remove(file)
+        self._LST(lst)
+        self._FCF(fcf)
 
     def report(self):
         r = super(RunShelxl, self).report()
@@ -68,4 +64,21 @@ class RunShelxl(ShelxNode):
         return r
 
 
+def writeShelxlInput(directory, ins, hkl):
+    with open(os.path.join(directory, '__tmp__.ins'), 'w') as fp:
+        fp.write(ins)
+    with open(os.path.join(directory, '__tmp__.hkl'), 'w') as fp:
+        fp.write(hkl)
+
 
+def readShelxlOutput(directory):
+    """
+    Reads the result files written by SHELXL.
+    :param directory: Working directory of the SHELXL run.
+    :return: Tuple of the contents of the .res, .lst and .fcf files.
+    """
+    contents = []
+    for extension in ('res', 'lst', 'fcf'):
+        with open(os.path.join(directory, '__tmp__.' + extension), 'r') as fp:
+            contents.append(fp.read())
+    return tuple(contents)
@@ -29,3 +29,52 @@ class Atom(Type):
         return obj.get_name
 
 
+class Array(Type):
+    """
+    Numerical array, e.g. the coordinates of N points as an Nx3 array or pairs of row indices as an Nx2 integer array.
+    Values are numpy.ndarray instances. Numerical and boolean arrays keep their dtype, everything else is converted to
+    float.
+    """
+    color = (255, 153, 51)
+
+    @staticmethod
+    def checkType(instance):
+        import numpy
+        array = numpy.asarray(instance)
+        if not (numpy.issubdtype(array.dtype, numpy.number) or array.dtype == bool):
+            array = array.astype(float)
+        return array
+
+    @staticmethod
+    def debugInfoGetter(obj):
+        return lambda: 'Array{}'.format(obj.shape)
+
+
+class Stream(Type):
+    """
+    Sequence of records produced while it is consumed. Values are floppy.stream.StreamBuffer instances.
+    """
+    color = (51, 204, 204)
+
+    @staticmethod
+    def checkType(instance):
+        return instance
+
+    @staticmethod
+    def debugInfoGetter(obj):
+        return lambda: 'Stream({} records read, {} buffered)'.format(obj.count, len(obj))
+
+
+class Buffer(Type):
+    """
+    Read-only binary data, e.g. the content of a memory mapped file. Values are memoryview instances.
+    """
+    color = (153, 153, 255)
+
+    @staticmethod
+    def checkType(instance):
+        return instance
+
+    @staticmethod
+    def debugInfoGetter(obj):
+        return lambda: 'Buffer({} bytes)'.format(obj.nbytes)
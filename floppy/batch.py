@@ -0,0 +1,167 @@
+"""
+Module implementing a headless batch runner for Floppy graph files.
+Graph files (*.ppy) are loaded with Graph.load and executed by graph interpreters running in a pool of worker
+processes. Neither Qt nor any socket is involved. The result of every graph is collected in a JSON report.
+Threads cannot be killed. Nodes of a graph that timed out therefore keep running, but they are left behind together
+with the interpreter of their process. The next graph is executed by a new interpreter with its own worker pool.
+
+Usage: python BatchFloppy.py [-p PROCESSES] [-t TIMEOUT] [-m MODE] [-w WORKERS] [-o REPORT] FILE [FILE ...]
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+from floppy.graph import Graph
+from floppy.runner import Runner, loadCustomNodes
+
+batchRunner = None
+
+
+def getRunner(mode, workers):
+    """
+    Returns the interpreter of the current process. The interpreter is created on first use and is reused for all
+    graphs executed by the process.
+    :param mode: Execution mode of the interpreter.
+    :param workers: Number of worker threads of the interpreter.
+    :return: Runner instance.
+    """
+    global batchRunner
+    if not batchRunner:
+        batchRunner = Runner(listen=False)
+    batchRunner.configure({'mode': mode, 'framerate': .01, 'workers': workers})
+    return batchRunner
+
+
+def discardRunner():
+    """
+    Stops the interpreter of the current process and drops all nodes waiting in its worker pool. Nodes that are still
+    running finish in the background, but no longer occupy workers needed by the following graphs.
+    :return: None
+    """
+    global batchRunner
+    if batchRunner:
+        batchRunner.kill()
+        batchRunner.workerPool.shutdown()
+        batchRunner = None
+
+
+def runGraphFile(fileName, timeout=20., mode='Event', workers=8):
+    """
+    Loads a graph file and executes it until one of its nodes returns a value or the timeout expired.
+    :param fileName: Path to a *.ppy file.
+    :param timeout: float; maximum execution time in seconds.
+    :param mode: Execution mode of the interpreter.
+    :param workers: Number of worker threads of the interpreter.
+    :return: Dictionary describing the result of the run.
+    """
+    result = {'file': fileName, 'status': 'error', 'returnValue': None, 'returningNode': None,
+              'wallTime': 0., 'error': ''}
+    runner = getRunner(mode, workers)
+    graphID = str(os.getpid()) + '-' + str(time.time())
+    try:
+        graph = Graph()
+        errors = []
+        graph.load(fileName, callback=errors.append)
+        if errors:
+            result['error'] = '\n'.join(errors)
+            return result
+        runner.setGraph(graph, graphID)
+        executionThread = runner.getExecutionThread(graphID)
+        start = time.time()
+        runner.unpause(graphID)
+        returned = executionThread.returned.wait(timeout)
+        result['wallTime'] = time.time() - start
+        if returned:
+            result['status'] = 'returned'
+            try:
+                result['returnValue'] = json.loads(json.dumps(graph.returnValue))
+            except TypeError:
+                result['returnValue'] = str(graph.returnValue)
+            result['returningNode'] = str(graph.returningNode)
+        else:
+            result['status'] = 'timeout'
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    finally:
+        runner.drop(graphID)
+    if result['status'] == 'timeout':
+        discardRunner()
+    return result
+
+
+def runBatch(fileNames, processes=None, timeout=20., mode='Event', workers=8, callback=None):
+    """
+    Executes graph files in a pool of worker processes.
+    :param fileNames: List of paths to *.ppy files.
+    :param processes: Number of worker processes. Defaults to the number of CPUs. If 0, all graphs are executed by
+    the current process.
+    :param timeout: float; maximum execution time of every graph in seconds.
+    :param mode: Execution mode of the interpreters.
+    :param workers: Number of worker threads of every interpreter.
+    :param callback: Callable called with the result of each graph as soon as it is available.
+    :return: List of result dictionaries (see runGraphFile) in the order of 'fileNames'.
+    """
+    results = {}
+    if processes == 0:
+        loadCustomNodes()
+        for fileName in fileNames:
+            results[fileName] = runGraphFile(fileName, timeout, mode, workers)
+            if callback:
+                callback(results[fileName])
+    else:
+        with ProcessPoolExecutor(processes, mp_context=get_context('spawn'), initializer=loadCustomNodes) as pool:
+            futures = {pool.submit(runGraphFile, fileName, timeout, mode, workers): fileName
+                       for fileName in fileNames}
+            for future in as_completed(futures):
+                fileName = futures[future]
+                try:
+                    results[fileName] = future.result()
+                except Exception as e:
+                    results[fileName] = {'file': fileName, 'status': 'error', 'returnValue': None,
+                                         'returningNode': None, 'wallTime': 0.,
+                                         'error': '{}: {}'.format(type(e).__name__, e)}
+                if callback:
+                    callback(results[fileName])
+    return [results[fileName] for fileName in fileNames]
+
+
+def parseArgv(argv=None):
+    parser = argparse.ArgumentParser(description='Execute Floppy graph files without the editor.')
+    parser.add_argument('files', nargs='+', help='Graph files or glob patterns.')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help='Number of worker processes. Defaults to the number of CPUs.')
+    parser.add_argument('-t', '--timeout', type=float, default=20., help='Timeout per graph in seconds.')
+    parser.add_argument('-m', '--mode', default='Event', help='Execution mode of the graph interpreters.')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='Worker threads per graph interpreter.')
+    parser.add_argument('-o', '--output', default=None, help='File the JSON report is written to.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgv(argv)
+    fileNames = []
+    for pattern in args.files:
+        fileNames += sorted(glob.glob(pattern)) or [pattern]
+
+    def printResult(result):
+        passed = result['status'] == 'returned' and not result['returnValue']
+        print('   {1:6} -- {0:50} {2:8.2f}s {3}'.format(result['file'], 'Passed' if passed else 'Failed',
+                                                      result['wallTime'],
+                                                      '' if passed else result['error'] or result['status']),
+              file=sys.stderr)
+    start = time.time()
+    results = runBatch(fileNames, args.processes, args.timeout, args.mode, args.workers, callback=printResult)
+    report = {'wallTime': time.time() - start, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    failed = [result for result in results if not result['status'] == 'returned' or result['returnValue']]
+    return 1 if failed else 0
@@ -0,0 +1,45 @@
+"""
+Module implementing read-only buffers backed by memory mapped files.
+The content of a mapped file is not read into memory. The operating system loads the pages of the file when they are
+accessed and may drop them again at any time. Slicing a buffer returns a view of the same memory instead of a copy.
+"""
+
+import mmap
+import re
+
+LINEBREAK = re.compile(b'\n')
+
+
+def mapFile(fileName):
+    """
+    Maps a file into memory.
+    The file must not be truncated while the buffer is in use.
+    :param fileName: Path of the file.
+    :return: Read-only memoryview of the file's content.
+    """
+    with open(fileName, 'rb') as fp:
+        try:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            return memoryview(b'')
+    return memoryview(mapped)
+
+
+def iterLines(buffer):
+    """
+    Generator yielding the lines of a buffer without copying them.
+    :param buffer: memoryview instance or any other object supporting the buffer protocol.
+    :return: Generator of memoryview slices of 'buffer', one per line, without the line break.
+    """
+    buffer = memoryview(buffer)
+    start = 0
+    for match in LINEBREAK.finditer(buffer):
+        end = match.start()
+        if end > start and buffer[end - 1] == 13:
+            yield buffer[start:end - 1]
+        else:
+            yield buffer[start:end]
+        start = match.end()
+    if start < len(buffer):
+        yield buffer[start:]
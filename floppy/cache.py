@@ -0,0 +1,239 @@
+"""
+Module implementing the memoization of node outputs.
+Nodes of classes declared as 'pure' compute their outputs from nothing but their input values. The outputs of such
+nodes are stored under a key derived from the node's class and its input values. If a node with the same class and
+the same input values is executed again, the stored outputs are reused instead of running the node.
+Keys are canonical hashes of the input values (see updateHash). Equal values have equal keys in every process and
+session, no matter in which order the items of dictionaries and sets were inserted.
+The cache is disabled unless a memory limit or an on-disk store is configured.
+"""
+
+import hashlib
+import os
+import pickle
+import struct
+from collections import OrderedDict
+from threading import Lock, get_ident
+
+from floppy.sharedMemory import resolve
+
+
+class NodeCache(object):
+    """
+    Least recently used cache of pickled node outputs with an optional on-disk store.
+    Values are kept in pickled form so that nodes receiving cached values can never modify the cached objects. The
+    in-memory part is limited by the total size of the pickled values.
+    """
+    def __init__(self, maxBytes=0, directory=None):
+        self.maxBytes = maxBytes
+        self.usedBytes = 0
+        self.directory = None
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.setDirectory(directory)
+
+    def setMaxBytes(self, maxBytes):
+        """
+        Sets the maximum total size of the entries kept in memory. The on-disk store is not limited.
+        :param maxBytes: int; 0 disables the in-memory cache.
+        :return: None
+        """
+        with self.lock:
+            self.maxBytes = max(0, int(maxBytes))
+            self.evict(self.maxBytes)
+
+    def setDirectory(self, directory):
+        """
+        Sets the directory of the on-disk store.
+        :param directory: Path of a directory or None for keeping entries in memory only.
+        :return: None
+        """
+        if directory:
+            directory = os.path.join(directory, 'nodeCache')
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def isEnabled(self):
+        return bool(self.maxBytes or self.directory)
+
+    @staticmethod
+    def getKey(node):
+        """
+        Computes the key of a node's current input values.
+        :param node: Node instance.
+        :return: Hex digest string or None if the input values cannot be hashed.
+        """
+        hasher = hashlib.sha256()
+        updateHash(hasher, node.__class__.__name__)
+        try:
+            for name in sorted(node.inputs.keys()):
+                inp = node.inputs[name]
+                updateHash(hasher, name)
+                if inp.valueSet:
+                    updateHash(hasher, resolve(inp.value))
+                elif not inp.connected:
+                    updateHash(hasher, inp.default)
+                else:
+                    updateHash(hasher, None)
+        except (TypeError, RecursionError):
+            return None
+        return hasher.hexdigest()
+
+    def restore(self, node, key):
+        """
+        Sets the outputs of a node to the values stored under the given key.
+        :param node: Node instance.
+        :param key: Key returned by 'getKey'.
+        :return: True if the outputs were restored, False if no values are stored under the key.
+        """
+        data = self.lookup(key)
+        if data is None:
+            return False
+        for name, value in pickle.loads(data).items():
+            node.outputs[name](value)
+        for inp in node.inputs.values():
+            if not inp.valueSet and inp.default is not None and not inp.connected:
+                inp.usedDefault = inp.loopLevel > 0
+        return True
+
+    def lookup(self, key):
+        with self.lock:
+            try:
+                data = self.entries[key]
+            except KeyError:
+                pass
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return data
+        data = self.load(key)
+        with self.lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.add(key, data)
+        return data
+
+    def store(self, node, key):
+        """
+        Stores the outputs of a node that was executed with the input values the key was computed from.
+        Nothing is stored if the output values cannot be pickled.
+        :param node: Node instance.
+        :param key: Key returned by 'getKey'.
+        :return: None
+        """
+        try:
+            data = pickle.dumps({name: resolve(out.value) for name, out in node.outputs.items() if out.valueSet},
+                                protocol=4)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        with self.lock:
+            self.add(key, data)
+        self.save(key, data)
+
+    def add(self, key, data):
+        if len(data) > self.maxBytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.usedBytes -= len(old)
+        self.evict(self.maxBytes - len(data))
+        self.entries[key] = data
+        self.usedBytes += len(data)
+
+    def evict(self, maxBytes):
+        """
+        Drops the least recently used entries until the entries kept in memory take up no more than 'maxBytes'.
+        The caller must hold the lock.
+        """
+        while self.entries and self.usedBytes > maxBytes:
+            key, data = self.entries.popitem(last=False)
+            self.usedBytes -= len(data)
+
+    def getPath(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pickle')
+
+    def load(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self.getPath(key), 'rb') as fp:
+                return fp.read()
+        except OSError:
+            return None
+
+    def save(self, key, data):
+        if not self.directory:
+            return
+        path = self.getPath(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmpPath = '{}.{}.{}.tmp'.format(path, os.getpid(), get_ident())
+            with open(tmpPath, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmpPath, path)
+        except OSError as e:
+            print('Warning: cannot write node cache entry {}:\n{}'.format(path, e))
+
+    def getStatus(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries), 'bytes': self.usedBytes}
+
+
+def updateHash(hasher, value):
+    """
+    Feeds a canonical representation of a value into a hash object.
+    Every value is prefixed with a tag of its type, so that e.g. 1, 1.0, '1' and True differ. Dictionaries and sets are
+    hashed independently of their order by sorting the digests of their items. Arrays providing 'dtype', 'shape' and
+    'tobytes' (e.g. numpy.ndarray) are hashed by their raw data. Instances of classes declaring 'cacheable = True' are
+    hashed by their class and their attributes. Other objects cannot be hashed, because their attributes need not
+    describe their value. Nodes receiving them are not memoized.
+    :param hasher: hashlib hash object.
+    :param value: Any object.
+    :return: None
+    :raises: TypeError if the value or a part of it cannot be hashed, e.g. locks, files or streams.
+    """
+    if value is None or isinstance(value, bool):
+        hasher.update(b'N' if value is None else b'T' if value else b'F')
+    elif isinstance(value, int):
+        data = str(value).encode()
+        hasher.update(b'i' + struct.pack('>I', len(data)) + data)
+    elif isinstance(value, float):
+        hasher.update(b'f' + struct.pack('>d', value))
+    elif isinstance(value, complex):
+        hasher.update(b'c' + struct.pack('>dd', value.real, value.imag))
+    elif isinstance(value, str):
+        data = value.encode('utf-8', 'surrogatepass')
+        hasher.update(b's' + struct.pack('>Q', len(data)) + data)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        hasher.update(b'b' + struct.pack('>Q', len(data)) + data)
+    elif isinstance(value, (list, tuple)):
+        hasher.update((b'l' if isinstance(value, list) else b't') + struct.pack('>Q', len(value)))
+        for item in value:
+            updateHash(hasher, item)
+    elif isinstance(value, dict):
+        hasher.update(b'd' + struct.pack('>Q', len(value)))
+        for digest in sorted(getDigest((key, item)) for key, item in value.items()):
+            hasher.update(digest)
+    elif isinstance(value, (set, frozenset)):
+        hasher.update(b'S' + struct.pack('>Q', len(value)))
+        for digest in sorted(getDigest(item) for item in value):
+            hasher.update(digest)
+    elif all(hasattr(value, attribute) for attribute in ('dtype', 'shape', 'tobytes')):
+        updateHash(hasher, ('array', str(value.dtype), tuple(value.shape)))
+        hasher.update(value.tobytes())
+    elif getattr(type(value), 'cacheable', False) and hasattr(value, '__dict__'):
+        cls = type(value)
+        hasher.update(b'o')
+        updateHash(hasher, (cls.__module__, cls.__qualname__, vars(value)))
+    else:
+        raise TypeError('Cannot hash values of type {}.'.format(type(value).__name__))
+
+
+def getDigest(value):
+    hasher = hashlib.sha256()
+    updateHash(hasher, value)
+    return hasher.digest()
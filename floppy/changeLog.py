@@ -0,0 +1,147 @@
+"""
+Module implementing the incremental synchronisation of a graph between the editor and the graph interpreter.
+The editor's Graph instance records every structural change (spawned and deleted nodes, created and removed
+connections, changed input defaults) in a ChangeLog. Instead of sending the whole graph, the editor sends the changes
+made since the last synchronisation with the PATCH command.
+Every change increments the log's version. A patch names the version it is based on and the version it leads to. The
+interpreter only applies a patch if it is based on the version it currently has. Otherwise it answers 'RESYNC' and the
+editor sends the complete graph again.
+"""
+
+import copy
+import json
+
+
+class ChangeLog(object):
+    """
+    Editor side list of the changes made to a graph since it was last synchronised with the interpreter.
+    Nothing is recorded until the graph was synchronised once, because the first synchronisation sends the whole graph
+    anyway.
+    """
+    def __init__(self):
+        self.version = 0
+        self.syncedVersion = None
+        self.changes = []
+
+    def record(self, *change):
+        """
+        Records a change. Changes are lists of the form [kind, *arguments] (see 'applyChanges').
+        :return: None
+        """
+        if self.syncedVersion is None:
+            return
+        try:
+            json.dumps(change)
+        except TypeError:
+            # Changes that cannot be sent require sending the whole graph.
+            self.invalidate()
+            return
+        self.changes.append(list(change))
+        self.version += 1
+
+    def markSynced(self):
+        """
+        Declares that the interpreter received the current state of the whole graph.
+        :return: Current version.
+        """
+        self.changes = []
+        self.syncedVersion = self.version
+        return self.version
+
+    def invalidate(self):
+        """
+        Declares that the interpreter's graph is out of sync. The next synchronisation will send the whole graph.
+        :return: None
+        """
+        self.changes = []
+        self.syncedVersion = None
+
+    def isSynced(self):
+        return self.syncedVersion is not None
+
+    def takePatch(self):
+        """
+        Returns the recorded changes as a patch and declares them sent.
+        :return: Dictionary with the keys 'base', 'version' and 'changes'.
+        """
+        patch = {'base': self.syncedVersion, 'version': self.version, 'changes': self.changes}
+        self.markSynced()
+        return patch
+
+
+def applyChanges(data, changes):
+    """
+    Applies changes recorded by a ChangeLog to the json representation of a graph.
+    Supported changes are
+        ['spawn', nodeID, nodeData]: Adds a node. 'nodeData' is the node's 'Node.save' dictionary.
+        ['delete', nodeID]: Removes a node and all of its connections.
+        ['connect', outputNodeID, outputName, inputNodeID, inputName]: Adds a connection. Replaces the connection
+        of the input unless the input is a 'Control' input.
+        ['disconnect', pinID]: Removes all connections of an input or output pin.
+        ['default', nodeID, inputName, value]: Sets the default value of an input.
+    :param data: List of (nodeID, nodeData) tuples as created by Graph.toJson. The list is not modified.
+    :param changes: List of changes.
+    :return: New list of (nodeID, nodeData) tuples.
+    :raises: KeyError or ValueError if a change refers to an unknown node or is malformed.
+    """
+    nodes = {int(nodeID): copy.deepcopy(nodeData) for nodeID, nodeData in data}
+    for change in changes:
+        kind, args = change[0], change[1:]
+        if kind == 'spawn':
+            nodeID, nodeData = args
+            nodes[int(nodeID)] = copy.deepcopy(nodeData)
+        elif kind == 'delete':
+            nodeID = int(args[0])
+            nodeData = nodes[nodeID]
+            for inp in nodeData['inputs']:
+                disconnectInput(nodes, nodeID, inp[0])
+            for outputName in nodeData['outputConnections'].keys():
+                disconnectOutput(nodes, nodeID, outputName)
+            del nodes[nodeID]
+        elif kind == 'connect':
+            outputNodeID, outputName, inputNodeID, inputName = args
+            outputNodeID, inputNodeID = int(outputNodeID), int(inputNodeID)
+            inputID = '{}:I{}'.format(inputNodeID, inputName)
+            if not inputName == 'Control':
+                disconnectInput(nodes, inputNodeID, inputName)
+            nodes[inputNodeID]['inputConnections'].setdefault(inputName, '{}:O{}'.format(outputNodeID, outputName))
+            inputIDs = nodes[outputNodeID]['outputConnections'].setdefault(outputName, [])
+            if not inputID in inputIDs:
+                inputIDs.append(inputID)
+        elif kind == 'disconnect':
+            nodeID, pinName = args[0].split(':')
+            if pinName.startswith('I'):
+                disconnectInput(nodes, int(nodeID), pinName[1:])
+            else:
+                disconnectOutput(nodes, int(nodeID), pinName[1:])
+        elif kind == 'default':
+            nodeID, inputName, value = args
+            inputs = nodes[int(nodeID)]['inputs']
+            for i, inp in enumerate(inputs):
+                if inp[0] == inputName:
+                    inputs[i] = list(inp[:-1]) + [value]
+                    break
+            else:
+                raise KeyError(inputName)
+        else:
+            raise ValueError('Unknown change \'{}\'.'.format(kind))
+    return list(nodes.items())
+
+
+def disconnectInput(nodes, nodeID, inputName):
+    inputID = '{}:I{}'.format(nodeID, inputName)
+    nodes[nodeID]['inputConnections'].pop(inputName, None)
+    for nodeData in nodes.values():
+        for inputIDs in nodeData['outputConnections'].values():
+            if inputID in inputIDs:
+                inputIDs.remove(inputID)
+
+
+def disconnectOutput(nodes, nodeID, outputName):
+    outputID = '{}:O{}'.format(nodeID, outputName)
+    for inputID in nodes[nodeID]['outputConnections'].get(outputName, []):
+        inputNodeID, inputName = inputID.split(':I')
+        inputConnections = nodes[int(inputNodeID)]['inputConnections']
+        if inputConnections.get(inputName) == outputID:
+            del inputConnections[inputName]
+    nodes[nodeID]['outputConnections'][outputName] = []
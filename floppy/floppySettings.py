@@ -20,6 +20,13 @@ class SettingsDialog(QDialog):
                         ('Remote Interpreter Settings', None),
                         ('Frame Rate', RGIFrameRateEdit(settings, globals, self)),
                         ('Execution Mode', RGIModeEdit(settings, globals, self)),
+                        ('Worker Threads', RGIWorkersEdit(settings, globals, self)),
+                        ('Worker Processes', RGIProcessesEdit(settings, globals, self)),
+                        ('Resource Limits', RGIResourcesEdit(settings, globals, self)),
+                        ('Node Cache Memory (MiB)', RGICacheMemoryEdit(settings, globals, self)),
+                        ('Persistent Node Cache', RGIPersistentCacheEdit(settings, globals, self)),
+                        ('Checkpoint Interval', RGICheckpointIntervalEdit(settings, globals, self)),
+                        ('Event Rate', RGIEventRateEdit(settings, globals, self)),
                         ]
         super(SettingsDialog, self).__init__(*args)
         self.setStyleSheet('''SettingsDialog {
@@ -301,9 +308,117 @@ class RGIModeEdit(QComboBox):
         v = settings.value('RGIMode', type=str)
         v = v if v else 'Parallel'
         self.addItem('Parallel')
+        self.addItem('Event')
+        self.addItem('Async')
         self.addItem('Sequential')
         self.setCurrentText(v)
-        self.setToolTip('Sequential or parallel node execution.')
+        self.setToolTip('Sequential or parallel node execution. \'Event\' runs nodes in parallel but only checks nodes '
+                        'whose inputs changed. \'Async\' additionally awaits nodes with coroutine run methods on '
+                        'one event loop.')
 
     def commit(self):
-        self.settings.setValue('RGIMode', self.currentText())
\ No newline at end of file
+        self.settings.setValue('RGIMode', self.currentText())
+
+
+class RGIWorkersEdit(QSpinBox):
+    def __init__(self, settings, globals, parent):
+        self.parent = parent
+        self.globals = globals
+        self.settings = settings
+        super(RGIWorkersEdit, self).__init__()
+        v = settings.value('RGIWorkers', type=int)
+        v = v if v else 8
+        self.setRange(1, 1024)
+        self.setValue(v)
+        self.setToolTip('Maximum number of nodes executed concurrently by the interpreter.')
+
+    def commit(self):
+        self.settings.setValue('RGIWorkers', self.value())
+
+
+class RGIProcessesEdit(QSpinBox):
+    def __init__(self, settings, globals, parent):
+        self.parent = parent
+        self.globals = globals
+        self.settings = settings
+        super(RGIProcessesEdit, self).__init__()
+        v = settings.value('RGIProcesses', type=int)
+        self.setRange(0, 256)
+        self.setValue(v)
+        self.setToolTip('Number of processes for executing process safe nodes. 0 executes all nodes in threads.')
+
+    def commit(self):
+        self.settings.setValue('RGIProcesses', self.value())
+
+
+class RGIResourcesEdit(QLineEdit):
+    def __init__(self, settings, globals, parent):
+        self.parent = parent
+        self.globals = globals
+        self.settings = settings
+        super(RGIResourcesEdit, self).__init__()
+        v = settings.value('RGIResources', type=str)
+        self.setText(v)
+        self.setToolTip('Maximum number of concurrently executed nodes per resource, e.g. \'shelxl=2, pdb2ins=4\'.')
+
+    def commit(self):
+        self.settings.setValue('RGIResources', self.text())
+
+
+class RGICacheMemoryEdit(QSpinBox):
+    def __init__(self, settings, globals, parent):
+        self.parent = parent
+        self.globals = globals
+        self.settings = settings
+        super(RGICacheMemoryEdit, self).__init__()
+        v = settings.value('RGICacheMemory', 0, type=int)
+        self.setRange(0, 1000000)
+        self.setValue(v)
+        self.setToolTip('Memory in MiB for keeping outputs of pure nodes for reuse. 0 disables the in-memory cache.')
+
+    def commit(self):
+        self.settings.setValue('RGICacheMemory', self.value())
+
+
+class RGIPersistentCacheEdit(QCheckBox):
+    def __init__(self, settings, globals, parent):
+        self.parent = parent
+        self.globals = globals
+        self.settings = settings
+        super(RGIPersistentCacheEdit, self).__init__()
+        self.setChecked(settings.value('RGIPersistentCache', False, type=bool))
+        self.setToolTip('Store the outputs of pure nodes in the work file directory to reuse them across sessions.')
+
+    def commit(self):
+        self.settings.setValue('RGIPersistentCache', self.isChecked())
+
+
+class RGICheckpointIntervalEdit(QSpinBox):
+    def __init__(self, settings, globals, parent):
+        self.parent = parent
+        self.globals = globals
+        self.settings = settings
+        super(RGICheckpointIntervalEdit, self).__init__()
+        v = settings.value('RGICheckpointInterval', 0, type=int)
+        self.setRange(0, 86400)
+        self.setValue(v)
+        self.setToolTip('Seconds between checkpoints of the execution state written to the work file directory. '
+                        '0 disables checkpoints.')
+
+    def commit(self):
+        self.settings.setValue('RGICheckpointInterval', self.value())
+
+
+class RGIEventRateEdit(QSpinBox):
+    def __init__(self, settings, globals, parent):
+        self.parent = parent
+        self.globals = globals
+        self.settings = settings
+        super(RGIEventRateEdit, self).__init__()
+        v = settings.value('RGIEventRate', 20, type=int)
+        self.setRange(1, 100)
+        self.setValue(v)
+        self.setToolTip('Maximum number of execution status updates per second the interpreter pushes to the editor.')
+
+    def commit(self):
+        self.settings.setValue('RGIEventRate', self.value())
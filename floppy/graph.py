@@ -1,16 +1,25 @@
 import json
-import zlib
 import io
 import time
-from collections import OrderedDict
-from floppy.node import ControlNode, Node, MetaNode, SubGraph
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from floppy.node import ControlNode, Node, MetaNode, SubGraph, runNode
 from floppy.runner import Runner, sendCommand, RGIConnection
-from socket import AF_INET, SOCK_STREAM, socket #, SHUT_RDWR, timeout, SHUT_RDWR, SO_REUSEADDR, SOL_SOCKET
+from socket import AF_INET, SOCK_STREAM, SHUT_RDWR, socket #, timeout, SO_REUSEADDR, SOL_SOCKET
 from floppy.node import NODECLASSES
-from threading import Thread, Lock
-from queue import Queue
+from floppy.sharedMemory import SharedValue, share
+from floppy.changeLog import ChangeLog
+from floppy.FloppyTypes import Stream
+from threading import Thread, Lock, Condition
+from queue import Queue, PriorityQueue, Empty
+from itertools import count
 import struct
+import pickle
+import heapq
+import asyncio
 
+EVENTRATE = 20.
+STATUSINTERVAL = .5
 
 def dummy(nodeClass):
     return nodeClass
@@ -30,6 +39,7 @@ class Graph(object):
         self.returnValue = -1
         self.returnPriority = -1
         self.returningNode = None
+        self.graphID = None
         self.slave = False
         self._requestUpdate = False
         self._requestReport = ''
@@ -37,7 +47,10 @@ class Graph(object):
         self.currentlyRunning = []
         self.currentReport = ''
         self.runningNodes = []
-        self.statusLock = None
+        self.statusLock = Lock()
+        self.statusListener = None
+        self.lastStatusRequest = 0
+        self.statusRequest = None
         self.connected = False
         self.nextFreeNodeID = 0
         self.nodes = {}
@@ -48,8 +61,32 @@ class Graph(object):
         self.connections = {}
         self.runner = None
         self.status = None
+        self.readyQueue = None
+        self.workerPool = None
+        self.processPool = None
+        self.asyncEngine = None
+        self.runtimeStatistics = None
+        self.nodeCache = None
+        # Called with the event name and the node ID by 'reportEvent'.
+        self.eventCallback = None
+        # Called with the node and the exception if the execution of a node failed.
+        self.errorCallback = None
+        self.checkpointGate = CheckpointGate()
+        # Pickled states of running nodes captured before they started. Only recorded while 'capturePreRunStates' is
+        # set, i.e. while the graph interpreter writes checkpoints.
+        self.startedNodes = {}
+        self.capturePreRunStates = False
+        self.appliedState = None
+        self.appliedData = None
+        self.appliedVersion = None
+        self.changeLog = ChangeLog()
+        # Callables queued by other threads for the painter's thread (see callInMainThread).
+        self.mainThreadCalls = deque()
+        self.criticalPaths = None
+        self.executionPlan = None
+        self.criticalPathsVersion = -1
+        self.criticalPathsTime = 0
         self.reverseConnections = {}
-        # self.statusLock = Lock()
         if painter:
             self.painter = painter
             painter.registerGraph(self)
@@ -66,17 +103,27 @@ class Graph(object):
         self.connect2RemoteRunner(host='127.0.0.1', port=port)
         self.slave = True
 
-    def connect2RemoteRunner(self, host='127.0.0.1', port=8079):
+    def connect2RemoteRunner(self, host='127.0.0.1', port=8079, graphID=None, eventRate=EVENTRATE):
+        """
+        Establishes a TCP/IP connection to a running graph interpreter.
+        :param host: Host name or IP address of the interpreter.
+        :param port: Port the interpreter listens on.
+        :param graphID: Name under which the graph is executed by the interpreter. Interpreters can execute several
+        graphs at once. Graphs without a name replace the interpreter's default graph.
+        :param eventRate: Maximum number of execution event messages per second pushed by the interpreter.
+        :return:
+        """
+        self.graphID = graphID
         self.cmdHost = host
         self.cmdPort = int(port)
         self.slave = False
         self.rgiConnection = RGIConnection()
         self.rgiConnection.connect(self.cmdHost, self.cmdPort)
-        # self.connect2Runner(host, port)
-        # self.statusLock = Lock()
-        # self.statusQueue = Queue(100)
+        self.changeLog.invalidate()
         self.connected = True
-        # self.statusListener = StatusListener(self, self.clientSocket, self.statusQueue, self.statusLock)
+        if self.statusListener:
+            self.statusListener.kill()
+        self.statusListener = StatusListener(self, self.cmdHost, self.cmdPort, eventRate)
 
     def __getattr__(self, item):
         if item == 'newID':
@@ -103,16 +150,67 @@ class Graph(object):
         self.currentReport = {}
         return r
 
+    def applyEvents(self, events):
+        """
+        Applies a message of execution events pushed by the remote graph interpreter (see runner.EventPublisher).
+        Called by the StatusListener thread.
+        :param events: Dictionary with the keys 'started', 'ran', 'running' and optionally 'return'.
+        :return: None
+        """
+        with self.statusLock:
+            self.executedBuffer += [tuple(ran) for ran in events['ran']]
+            self.currentlyRunning = events['running']
+            if 'return' in events:
+                self.currentReport = ('RETURN', events['return'])
+        self.requestUpdate()
+        self.wakePainter()
+
+    def wakePainter(self):
+        """
+        Makes the painter check for update requests and queued calls right away instead of at its next periodic check.
+        Thread safe.
+        :return: None
+        """
+        try:
+            self.painter.updateRequested.emit()
+        except AttributeError:
+            pass
+
+    def callInMainThread(self, func, *args):
+        """
+        Executes a callable in the painter's thread. Callbacks of the interpreter connection run in its reader thread
+        and must use this method to modify the graph or its change log, which are otherwise only used by the painter's
+        thread. The callable is executed right away if the graph has no painter.
+        :param func: Callable.
+        :param args: Arguments passed to the callable.
+        :return: None
+        """
+        if self.painter is dummy:
+            func(*args)
+            return
+        self.mainThreadCalls.append((func, args))
+        self.requestUpdate()
+        self.wakePainter()
+
     def needsUpdate(self):
         """
         Called by the painter instance periodically to check whether a repaint was requested by another thread.
+        Calls queued with 'callInMainThread' are executed first.
+        Execution events are pushed by the interpreter if the status listener is subscribed. Otherwise, and for
+        reports on the requested node, the interpreter is polled with the STATUS command at most every STATUSINTERVAL
+        seconds.
         :return:
         """
+        while self.mainThreadCalls:
+            func, args = self.mainThreadCalls.popleft()
+            func(*args)
         if self.connected:
-            # IDs = self.requestRemoteStatus()
-            # status = self.requestRemoteStatus()
-            self.requestRemoteStatus()
-            status = self.status
+            subscribed = self.statusListener and self.statusListener.subscribed
+            now = time.time()
+            if (not subscribed or self._requestReport) and now - self.lastStatusRequest > STATUSINTERVAL:
+                self.lastStatusRequest = now
+                self.requestRemoteStatus()
+            status, self.status = self.status, None
             try:
                 if status['STATUS'] == 'RETURN':
                     # print(status)
@@ -122,11 +220,14 @@ class Graph(object):
                 pass
             if status:
                 IDs = status['STATUS']['ran']
-                self.currentlyRunning = status['STATUS']['running']
-                self.currentReport = status['REPORT']
-                if IDs:
-                    self.executedBuffer += IDs
-                    return True
+                with self.statusLock:
+                    if not subscribed:
+                        self.currentlyRunning = status['STATUS']['running']
+                    self.currentReport = status['REPORT']
+                    if IDs and not subscribed:
+                        # Subscribed editors already received these as events.
+                        self.executedBuffer += IDs
+                return True
         if self._requestUpdate:
             self._requestUpdate = False
             return True
@@ -142,19 +243,26 @@ class Graph(object):
         :return: newly created Node instance.
         """
         # nodeClass = self.decorator(nodeClass, position)
-        newNode = nodeClass(self.newID, self)
-        if useID:
-            newNode.ID = useID
+        if useID is not False:
+            # Pin IDs are derived from the ID passed to the constructor.
+            newNode = nodeClass(useID, self)
+            self.nextFreeNodeID = max(self.nextFreeNodeID, int(useID) + 1)
+        else:
+            newNode = nodeClass(self.newID, self)
         self.reverseConnections[newNode] = set()
         self.connections[newNode] = set()
-        if connections:
-            self._spawnConnections(connections, newNode)
         try:
             self.painter.registerNode(newNode, position, silent)
         except AttributeError:
             pass
         self.nodes[newNode.ID] = newNode
+        if self.changeLog.isSynced():
+            self.changeLog.record('spawn', newNode.ID, newNode.save())
+        if connections:
+            self._spawnConnections(connections, newNode)
         self.newestNode = newNode
+        self.criticalPaths = None
+        self.executionPlan = None
 
         return newNode
 
@@ -243,6 +351,14 @@ class Graph(object):
                                                                                                        str(outNode),
                                                                                                        inp,
                                                                                                        str(inpNode)))
+        if issubclass(outInfo.varType, Stream):
+            # Every record of a stream is consumed only once.
+            for oldCon in self.connections[outNode]:
+                if oldCon['outputName'] == out and not (oldCon['inputNode'] is inpNode and oldCon['inputName'] == inp):
+                    raise TypeError('Stream output \'{}\' of node {} is already connected to input \'{}\' of node {}. '
+                                    'Streams can only be connected to a single input.'.format(out, str(outNode),
+                                                                                              oldCon['inputName'],
+                                                                                              str(oldCon['inputNode'])))
         # print('Connect output \'{1}\' of node {0} to input \'{3}\' of node {2}'.format(str(outNode),
         #                                                                                out,
         #                                                                                str(inpNode),
@@ -258,9 +374,12 @@ class Graph(object):
         inpInfo.setConnected(True)
         self.connections[outNode].add(conn)
         self.reverseConnections[inpNode].add(conn)
+        self.criticalPaths = None
+        self.executionPlan = None
         if inp == 'Control' and inpNode.waitForAllControlls:
             # print(self.getConnectionsOfControlInput(inpInfo))
             inpInfo.setMultiConn(len(self.getConnectionsOfControlInput(inpInfo)))
+        self.changeLog.record('connect', outNode.ID, out, inpNode.ID, inp)
 
         # self.update()
 
@@ -326,14 +445,14 @@ class Graph(object):
         Returns the current execution history: a list of nodeIDs in the order they were executed in.
         :return: list of nodIDs.
         """
-        # self.statusLock.acquire()
         tT = time.time()
-        history = {i: tT-t for i, t in self.executedBuffer if tT - t < 15}
-        self.executedBuffer = [(i, t) for i, t in self.executedBuffer if tT - t < 15]
+        with self.statusLock:
+            history = {i: tT-t for i, t in self.executedBuffer if tT - t < 15}
+            self.executedBuffer = [(i, t) for i, t in self.executedBuffer if tT - t < 15]
+            last = self.executedBuffer[-1] if self.executedBuffer else ('','')
         if history:
             self.requestUpdate()
-        # self.statusLock.release()
-        return history, self.executedBuffer[-1] if self.executedBuffer else ('','')
+        return history, last
 
     def getRunningNodes(self):
         return self.currentlyRunning
@@ -358,24 +477,161 @@ class Graph(object):
         self.unpauseRunner()
 
     def selfExecute(self):
-        running = True
+        """
+        Executes the graph in the current thread.
+        Nodes outside of control node regions are executed once in topological order (see Graph.getExecutionPlan).
+        All remaining nodes are executed by repeatedly checking them until no node is ready anymore.
+        :return: None
+        """
+        static, dynamic = self.getExecutionPlan()
+        for node in static:
+            if node.check():
+                runNode(node)
+                node.notify()
+            else:
+                dynamic.append(node)
+        running = bool(dynamic)
         i = 0
         while running:
             i += 1
             print('\nExecuting iteration {}.'.format(i))
             running = False
-            for node in self.nodes.values():
+            for node in dynamic:
                 checked = node.check()
                 running = checked if not running else True
                 if checked:
-                    node.run()
+                    runNode(node)
                     node.notify()
 
+    def getExecutionPlan(self):
+        """
+        Splits the graph's nodes into a static and a dynamic part.
+        Control nodes, nodes with a custom 'check' method and everything downstream of them are dynamic and may be
+        executed any number of times. All other nodes form an acyclic graph and are executed at most once. They are
+        returned in topological order.
+        The plan is cached until the graph's nodes or connections change.
+        :return: Tuple of two lists of Node instances. The static list is sorted, the dynamic list is a new list.
+        """
+        if self.executionPlan is None:
+            dynamic = set()
+            stack = [node for node in self.nodes.values()
+                     if isinstance(node, ControlNode) or type(node).check is not Node.check]
+            while stack:
+                node = stack.pop()
+                if node in dynamic:
+                    continue
+                dynamic.add(node)
+                stack += [con.inputNode for con in self.connections[node]]
+            static = [node for node in self.nodes.values() if node not in dynamic]
+            indegree = {node: 0 for node in static}
+            for node in static:
+                for con in self.connections[node]:
+                    if con.inputNode in indegree:
+                        indegree[con.inputNode] += 1
+            ready = [node for node in static if not indegree[node]]
+            order = []
+            while ready:
+                node = ready.pop()
+                order.append(node)
+                for con in self.connections[node]:
+                    if con.inputNode not in indegree:
+                        continue
+                    indegree[con.inputNode] -= 1
+                    if not indegree[con.inputNode]:
+                        ready.append(con.inputNode)
+            ordered = set(order)
+            # Nodes on cycles without a control node are never ready in topological order.
+            self.executionPlan = (order, [node for node in self.nodes.values() if node not in ordered])
+        static, dynamic = self.executionPlan
+        return static, list(dynamic)
+
+    def wakeNode(self, node):
+        """
+        Tells an event driven graph interpreter that the given node might be ready for execution now.
+        Does nothing if the graph is not executed by an event driven interpreter.
+        :param node: Node instance.
+        :return: None
+        """
+        if self.readyQueue is not None:
+            self.readyQueue.put(node)
+
     def runNodePar(self, node, cb=None, arg=None):
+        """
+        Executes a node concurrently. If a worker pool is assigned to the graph, the node is queued for execution by
+        one of the pool's threads. Otherwise a new thread is created for the node.
+        Nodes implementing 'run' as a coroutine function are awaited by the graph's AsyncEngine if one is assigned.
+        Queued nodes with a longer critical path (see Graph.getPriority) are executed first.
+        :param node: Node instance. The node should be locked.
+        :param cb: Callable called after the node was executed.
+        :param arg: Argument passed to the callback.
+        :return: None
+        """
         self.runningNodes.append(node.ID)
-        t = NodeThread(node, cb, arg)
+        if self.asyncEngine and asyncio.iscoroutinefunction(node.run):
+            self.asyncEngine.submit(node, cb, arg)
+        elif self.workerPool:
+            self.workerPool.submit(node, cb, arg, priority=self.getPriority(node))
+        else:
+            t = NodeThread(node, cb, arg)
         # t.join()
 
+    def reportEvent(self, event, nodeID):
+        """
+        Passes an execution event of a node that was not dispatched by the graph interpreter itself, e.g. a node of a
+        loop body copy (see ParallelForEach), to the interpreter's status and event subscribers.
+        :param event: 'started' or 'ran'.
+        :param nodeID: ID of the node.
+        :return: None
+        """
+        if self.eventCallback:
+            self.eventCallback(event, nodeID)
+
+    def getPriority(self, node):
+        """
+        Returns the estimated time required to execute the given node and the longest chain of nodes depending on it.
+        The estimates are based on the run times recorded by the graph's RuntimeStatistics instance. Returns 0 if no
+        statistics are assigned to the graph.
+        :param node: Node instance.
+        :return: float; estimated critical path length in seconds.
+        """
+        stats = self.runtimeStatistics
+        if not stats:
+            return 0.
+        if self.criticalPaths is None or (not stats.version == self.criticalPathsVersion and
+                                          time.time() - self.criticalPathsTime > 1.):
+            self.updateCriticalPaths()
+        return self.criticalPaths.get(node, 0.)
+
+    def updateCriticalPaths(self):
+        """
+        Computes the critical path length of every node in a single depth first traversal of the graph.
+        Connections to 'Control' inputs are ignored because they close loops instead of leading further downstream.
+        :return: None
+        """
+        stats = self.runtimeStatistics
+        self.criticalPathsVersion = stats.version
+        self.criticalPathsTime = time.time()
+        lengths = {}
+        visiting = set()
+        for start in list(self.nodes.values()):
+            stack = [(start, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if expanded:
+                    visiting.discard(node)
+                    downstream = [lengths.get(con.inputNode, 0.) for con in self.connections[node]
+                                  if not con.inputName == 'Control']
+                    lengths[node] = stats.estimate(node) + max(downstream, default=0.)
+                    continue
+                if node in lengths or node in visiting:
+                    continue
+                visiting.add(node)
+                stack.append((node, True))
+                for con in self.connections[node]:
+                    if not con.inputName == 'Control':
+                        stack.append((con.inputNode, False))
+        self.criticalPaths = lengths
+
     # def testRun(self):
     #     if not self.runner:
     #         self.runner = Runner()
@@ -398,17 +654,63 @@ class Graph(object):
     def print(self, message):
         print(message)
 
+    def addressCommand(self, command, payload=''):
+        """
+        Creates an interpreter command addressing this graph.
+        :param command: Command name, e.g. 'PUSH'.
+        :param payload: string appended to the command.
+        :return: string of the form 'COMMAND<payload>' or 'COMMAND <graphID> <payload>' if the graph has an ID.
+        """
+        if self.graphID is None:
+            return command + payload
+        return '{} {} {}'.format(command, self.graphID, payload)
+
+    def setDefault(self, node, inputName, value):
+        """
+        Sets the default value of a node's input. Use this method instead of setting the default of the InputInfo
+        directly to make the change part of the next patch sent to the graph interpreter.
+        :param node: Node instance.
+        :param inputName: string
+        :param value: New default value. It is converted to the type of the input.
+        :return: None
+        """
+        inp = node.inputs[inputName]
+        inp.setDefault(value)
+        self.changeLog.record('default', node.ID, inputName, inp.default)
+
     def updateRunner(self):
         """
-        Serializes the graph and sends it to the connected graph interpreter telling it to load the new data.
+        Sends the changes made to the graph since the last synchronisation to the connected graph interpreter (see
+        floppy.changeLog). The whole graph is sent if the interpreter's graph is not in sync with the change log.
         :return:
         """
         # self.executedBuffer = []
-        self.rgiConnection.send('PAUSE', self.print)
-        message = self.serialize()
-        # msg = struct.pack('>I', len(message)) + message.encode('utf-8')
-        # self.sendUpdate(data)
-        self.rgiConnection.send('UPDATE'+message, self.print)
+        self.rgiConnection.send(self.addressCommand('PAUSE'), self.print)
+        if not self.changeLog.isSynced():
+            message = self.serialize(self.changeLog.markSynced())
+            self.rgiConnection.send(self.addressCommand('UPDATE', message), self.print)
+            return
+        message = json.dumps(self.changeLog.takePatch(), separators=(',', ':'))
+        self.rgiConnection.send(self.addressCommand('PATCH', message), self.patchAnswered)
+
+    def patchAnswered(self, answer):
+        """
+        Callback for the interpreter's answer to a PATCH command. Sends the whole graph if the interpreter requested it.
+        Called by the reader thread of the interpreter connection.
+        :param answer: string
+        :return: None
+        """
+        self.print(answer)
+        if answer.endswith('RESYNC'):
+            self.callInMainThread(self.resync)
+
+    def resync(self):
+        """
+        Sends the whole graph instead of a patch to the connected graph interpreter.
+        :return: None
+        """
+        self.changeLog.invalidate()
+        self.updateRunner()
 
     def push2Runner(self):
         """
@@ -417,20 +719,22 @@ class Graph(object):
         """
         self.executedBuffer = []
         self.STOREDVALUES = {}
-        self.rgiConnection.send('PAUSE', self.print)
-        message = self.serialize()
+        self.rgiConnection.send(self.addressCommand('PAUSE'), self.print)
+        message = self.serialize(self.changeLog.markSynced())
         # msg = struct.pack('>I', len(message)) + message.encode('utf-8')
         # self.sendUpdate(data)
-        self.rgiConnection.send('PUSH'+message, self.print)
+        self.rgiConnection.send(self.addressCommand('PUSH', message), self.print)
 
-    def serialize(self):
+    def serialize(self, version=None):
         """
-        Returns a serialized representation of the graph instance.
-        :return:
+        Returns a serialized representation of the graph instance for sending it to the graph interpreter.
+        Unlike 'toJson', the JSON string contains no insignificant whitespace. Compressing the string is left to the
+        connection (see floppy.protocol).
+        :param version: Version of the graph's change log the representation corresponds to.
+        :return: string
         """
-        data = self.toJson()
-        return data
-        return zlib.compress(data.encode('utf-8'))
+        return json.dumps({'version': version, 'graph': [(node.ID, node.save()) for node in self.nodes.values()]},
+                          separators=(',', ':'))
 
     def save(self, fileName):
         """
@@ -472,7 +776,7 @@ class Graph(object):
         Send PAUSE command to the graph interpreter.
         :return:
         """
-        self.rgiConnection.send('PAUSE', self.print)
+        self.rgiConnection.send(self.addressCommand('PAUSE'), self.print)
         # sendCommand('PAUSE', self.cmdHost, self.cmdPort)
 
     def unpauseRunner(self):
@@ -480,7 +784,7 @@ class Graph(object):
         Send UNPAUSE command to the graph interpreter.
         :return:
         """
-        self.rgiConnection.send('UNPAUSE', self.print)
+        self.rgiConnection.send(self.addressCommand('UNPAUSE'), self.print)
         # sendCommand('UNPAUSE', self.cmdHost, self.cmdPort)
 
     def stepRunner(self):
@@ -488,7 +792,7 @@ class Graph(object):
         Send Step command to the graph interpreter causing it to execute one node and then reenter the PAUSED state.
         :return:
         """
-        self.rgiConnection.send('STEP', self.print)
+        self.rgiConnection.send(self.addressCommand('STEP'), self.print)
 
     def gotoRunner(self, nextID):
         """
@@ -496,18 +800,31 @@ class Graph(object):
         :param nextID:
         :return:
         """
-        self.rgiConnection.send('GOTO1', self.print)
+        self.rgiConnection.send(self.addressCommand('GOTO', str(nextID)), self.print)
 
     def dropGraph(self):
-        self.rgiConnection.send('DROP', self.print)
+        self.rgiConnection.send(self.addressCommand('DROP'), self.print)
+
+    def resumeRunner(self):
+        """
+        Send RESUME command to the graph interpreter causing it to restore the graph from its latest checkpoint and to
+        continue the execution.
+        :return:
+        """
+        self.rgiConnection.send(self.addressCommand('RESUME'), self.print)
 
     def setStatus(self, status):
         self.status = json.loads(status[10:])
 
     def requestRemoteStatus(self):
         if self.connected:
+            if self.statusRequest and not self.statusRequest.done():
+                # Requests are pipelined. Do not pile up status requests behind a slow answer.
+                return []
             try:
-                self.rgiConnection.send('STATUS***{}'.format(self._requestReport), self.setStatus)
+                self.statusRequest = self.rgiConnection.send(self.addressCommand('STATUS',
+                                                                                 '***{}'.format(self._requestReport)),
+                                                             self.setStatus)
                 # status = json.loads(status[10:])
             except BrokenPipeError:
                 self.connected = False
@@ -536,6 +853,8 @@ class Graph(object):
         :param saveState:
         :return: Dictionary mapping the saved nodeIDs to the newly created nodes's IDs.
         """
+        # Loading a whole graph is not recorded change by change.
+        self.changeLog.invalidate()
         idMap = {}
         for id, nodeData in saveState:
             useID = id if reuseIDs else False
@@ -600,59 +919,178 @@ class Graph(object):
                     except KeyError:
                         print('Warning: Could not create connection due to missing node.')
 
+        if reuseIDs:
+            self.appliedData = [(int(id), nodeData) for id, nodeData in saveState]
+            self.appliedState = self.getStateSignatures(self.appliedData)
         self.update()
         return idMap
 
     def updateState(self, data, reuseIDs=False):
         """
         Updates the current the Graph instance with the json representation of another, similar Graph instance.
-        New Node instances are created for Nodes in the json data that are not already present.
-        Also, all connections are removed and re-instanciated based on the provided json data.
-        :param data:
-        :return:
+        The data is compared to the state applied by the last call of 'loadState' or 'updateState'. Nodes are dirty if
+        they are new or if their class, their input defaults or their incoming connections changed. Dirty nodes and
+        all nodes downstream of them are replaced by new instances and receive the outputs of their clean predecessors.
+        All other nodes keep their state including their outputs and are not executed again.
+        Everything is considered dirty if no state was applied before.
+        :param data: List of (nodeID, nodeData) tuples as created by 'toJson'.
+        :param reuseIDs: Not used. Nodes are always identified by the IDs in the data.
+        :return: Dictionary mapping the saved nodeIDs to the IDs of the graph's nodes.
         """
-        self.connections = {key: set() for key in self.connections.keys()}
-        self.reverseConnections = {key: set() for key in self.reverseConnections.keys()}
-        idMap = {}
-        removeNodes = set(self.nodes.keys())
+        data = [(int(id), nodeData) for id, nodeData in data]
+        idMap = {id: id for id, nodeData in data}
+        signatures = self.getStateSignatures(data)
+        for nodeID in set(self.nodes.keys()).difference(idMap.keys()):
+            self.deleteNode(self.nodes[nodeID])
+        dirty = {id for id, nodeData in data
+                 if self.appliedState is None or not self.appliedState.get(id) == signatures[id]
+                 or not id in self.nodes or not type(self.nodes[id]).__name__ == nodeData['class']}
+        edges = {edge for signature in signatures.values() for edge in signature[2]}
+        downstream = {}
+        for outputID, outputName, inputID, inputName in edges:
+            downstream.setdefault(outputID, set()).add(inputID)
+        stack = list(dirty)
+        while stack:
+            for nodeID in downstream.get(stack.pop(), ()):
+                if not nodeID in dirty:
+                    dirty.add(nodeID)
+                    stack.append(nodeID)
+
         for id, nodeData in data:
-            useID = id if reuseIDs else False
-            idMap[int(id)] = int(id)
-            if not int(id) in self.nodes.keys():
-                restoredNode = self.spawnNode(NODECLASSES[nodeData['class']],
-                                              position=nodeData['position'], silent=True, useID=useID)
-                thisNode = restoredNode
-            else:
-                thisNode = self.nodes[int(id)]
-            removeNodes.discard(thisNode.ID)
-            inputs = nodeData['inputs']
-            outputs = nodeData['outputs']
-            for input in inputs:
-                thisNode.inputs[input[0]].setDefault(input[-1])
-            for output in outputs:
-                thisNode.outputs[output[0]].setDefault(output[-1])
+            if not id in dirty:
+                continue
+            if id in self.nodes:
+                self.deleteNode(self.nodes[id])
+            restoredNode = self.spawnNode(NODECLASSES[nodeData['class']],
+                                          position=nodeData['position'], silent=True, useID=id)
+            try:
+                restoredNode.subgraph = nodeData['subgraph']
+            except KeyError:
+                restoredNode.subgraph = 'main'
+            if isinstance(restoredNode, SubGraph):
+                for inp in nodeData['inputs']:
+                    if inp[0] == 'GraphName':
+                        restoredNode.inputs[inp[0]].setDefault(inp[-1])
+                        break
+                restoredNode.probeGraph()
+            for input in nodeData['inputs']:
+                restoredNode.inputs[input[0]].setDefault(input[-1])
+            for output in nodeData['outputs']:
+                restoredNode.outputs[output[0]].setDefault(output[-1])
+
+        for outputID, outputName, inputID, inputName in sorted(edges, key=lambda edge: edge[3] == 'Control'):
+            if not inputID in dirty:
+                continue
+            self.connect(str(outputID), outputName, str(inputID), inputName)
+            outputNode = self.nodes[outputID]
+            output = outputNode.outputs[outputName]
+            if outputID in dirty or inputName == 'Control' or not output.valueSet:
+                continue
+            outputNode.buffered = False
+            self.nodes[inputID].setInput(inputName, output.value, override=True, loopLevel=outputNode.loopLevel)
+
+        if dirty:
+            self.returnValue = -1
+            self.returnPriority = -1
+            self.returningNode = None
+        self.appliedState = signatures
+        self.appliedData = data
+        self.update()
+        return idMap
+
+    @staticmethod
+    def getStateSignatures(data):
+        """
+        Extracts everything from the json representation of a graph that decides whether a node has to be executed
+        again after an update.
+        :param data: List of (nodeID, nodeData) tuples with integer IDs.
+        :return: Dictionary mapping node IDs to tuples of the node's class name, its input defaults and a frozenset of
+        its incoming connections as (outputNodeID, outputName, inputNodeID, inputName) tuples.
+        """
+        incoming = {id: set() for id, nodeData in data}
         for id, nodeData in data:
-            id = int(id)
             for inputName, outputID in nodeData['inputConnections'].items():
                 if inputName == 'Control':
                     continue
                 outputNode, outputName = outputID.split(':O')
-                outputNode = idMap[int(outputNode)]
-                # print(id, nodeData['inputConnections'], outputNode, outputName)
-                self.connect(str(outputNode), outputName, str(idMap[id]), inputName)
-
+                incoming[id].add((int(outputNode), outputName, id, inputName))
             for outputName, inputIDs in nodeData['outputConnections'].items():
                 for inputID in inputIDs:
                     if not 'Control' in inputID:
                         continue
                     inputNode, inputName = inputID.split(':I')
-                    inputNode = idMap[int(inputNode)]
-                    # print(id, nodeData['inputConnections'], outputNode, outputName)
-                    self.connect(str(idMap[id]), outputName, str(inputNode), inputName)
-        for nodeID in removeNodes:
-            self.deleteNode(self.nodes[nodeID])
-        self.update()
-        return idMap
+                    if int(inputNode) in incoming:
+                        incoming[int(inputNode)].add((id, outputName, int(inputNode), inputName))
+        return {id: (nodeData['class'], [(inp[0], inp[-1]) for inp in nodeData['inputs']], frozenset(incoming[id]))
+                for id, nodeData in data}
+
+    def getCheckpoint(self):
+        """
+        Returns the complete execution state of the graph, i.e. its structure, the states of all nodes (see
+        Node.getState), the stored values and the return value.
+        Nodes may keep running while the checkpoint is taken. Running nodes are recorded with the state they had before
+        they started and therefore run again after the checkpoint was restored. Only nodes currently notifying their
+        successors are waited for.
+        The states of the nodes and the stored values are pickled one by one. Nodes whose state cannot be pickled, e.g.
+        because they hold a stream or a memory mapped file, are left out and restart from their initial state.
+        :return: Dictionary of picklable objects. The IDs of the nodes left out are listed under 'skipped'.
+        """
+        with self.checkpointGate.closed():
+            states = {}
+            skipped = []
+            for node in list(self.nodes.values()):
+                try:
+                    state = self.startedNodes[node]
+                except KeyError:
+                    state = pickleState(node)
+                if state is None:
+                    skipped.append(node.ID)
+                else:
+                    states[node.ID] = state
+            storedValues = {}
+            for key, value in list(self.STOREDVALUES.items()):
+                try:
+                    storedValues[key] = pickle.dumps(value, protocol=4)
+                except (pickle.PicklingError, TypeError, AttributeError):
+                    skipped.append('STOREDVALUES[{!r}]'.format(key))
+            usedDefaults = [(inp, inp.usedDefault) for node in self.nodes.values() for inp in node.inputs.values()]
+            data = [(node.ID, node.save()) for node in list(self.nodes.values())]
+            # Node.save reads the inputs' values which may flag their defaults as used.
+            for inp, usedDefault in usedDefaults:
+                inp.usedDefault = usedDefault
+            returnValue = (self.returnValue, self.returnPriority, self.returningNode)
+        # The values are part of the nodes' states. The structure only needs the defaults.
+        for nodeID, nodeData in data:
+            nodeData['inputs'] = [(name, varType, None, default) for name, varType, value, default in nodeData['inputs']]
+            nodeData['outputs'] = [(name, varType, None, default) for name, varType, value, default in nodeData['outputs']]
+        return {'graph': data,
+                'nodes': states,
+                'storedValues': storedValues,
+                'return': returnValue,
+                'skipped': skipped}
+
+    def restoreCheckpoint(self, checkpoint):
+        """
+        Reconstructs the graph from a dictionary created by 'getCheckpoint'. Execution continues where it was
+        interrupted when the checkpoint was taken.
+        :param checkpoint: Dictionary returned by 'getCheckpoint'.
+        :return: None
+        """
+        self.loadState(checkpoint['graph'], reuseIDs=True)
+        for nodeID, state in checkpoint['nodes'].items():
+            self.nodes[nodeID].setState(pickle.loads(state))
+        self.STOREDVALUES = {key: pickle.loads(value) for key, value in checkpoint['storedValues'].items()}
+        self.returnValue, self.returnPriority, self.returningNode = checkpoint['return']
+
+    def nodeStarted(self, node):
+        """
+        Called by the executing thread right before a node's run method is called.
+        :param node: Node instance.
+        :return: None
+        """
+        if self.capturePreRunStates:
+            with self.checkpointGate:
+                self.startedNodes[node] = pickleState(node)
 
     def loadDict(self, saveState):
         """
@@ -660,6 +1098,7 @@ class Graph(object):
         :param saveState:
         :return: Dictionary mapping the saved nodeIDs to the newly created nodes's IDs.
         """
+        self.changeLog.invalidate()
         idMap = {}
         for id, nodeData in saveState.items():
             restoredNode = self.spawnNode(NODECLASSES[nodeData['class']], position=nodeData['position'], silent=True)
@@ -746,6 +1185,9 @@ class Graph(object):
         for thisConn in conns:
             self.connections[node].remove(thisConn)
             self.reverseConnections[thisConn.inputNode].remove(thisConn)
+        self.criticalPaths = None
+        self.executionPlan = None
+        self.changeLog.record('disconnect', pinID)
 
     def deleteNode(self, node):
         """
@@ -758,14 +1200,210 @@ class Graph(object):
         for out in node.outputs.values():
             self.removeConnection(out.ID)
         del self.nodes[node.ID]
+        node.cleanup()
+        self.criticalPaths = None
+        self.executionPlan = None
+        self.changeLog.record('delete', node.ID)
+
+    def close(self):
+        """
+        Releases the resources held by the graph's nodes (see Node.cleanup). Called by the graph interpreter when the
+        graph is discarded.
+        :return: None
+        """
+        for node in list(self.nodes.values()):
+            node.cleanup()
+
+    def copyNodes(self, nodes):
+        """
+        Creates a new graph containing copies of the given nodes and of all connections between them.
+        The copies keep the IDs and the input and output defaults of the original nodes. The new graph shares the
+        stored values and the execution resources of this graph, i.e. the worker pool, the process pool, the async
+        engine, the node cache and the runtime statistics. Nodes of the new graph submitted with 'runNodePar' are
+        therefore executed like the nodes of this graph.
+        :param nodes: Iterable of Node instances of this graph.
+        :return: Graph instance.
+        """
+        graph = Graph()
+        graph.STOREDVALUES = self.STOREDVALUES
+        graph.workerPool = self.workerPool
+        graph.processPool = self.processPool
+        graph.asyncEngine = self.asyncEngine
+        graph.nodeCache = self.nodeCache
+        graph.runtimeStatistics = self.runtimeStatistics
+        for node in nodes:
+            newNode = graph.spawnNode(type(node), silent=True, useID=node.ID)
+            newNode.subgraph = node.subgraph
+            for name, inp in node.inputs.items():
+                newNode.inputs[name].default = inp.default
+            for name, out in node.outputs.items():
+                newNode.outputs[name].default = out.default
+        for node in nodes:
+            for con in self.getConnectionsFrom(node):
+                if con['inputNode'].ID in graph.nodes:
+                    graph.connect(graph.nodes[node.ID], con['outputName'], graph.nodes[con['inputNode'].ID],
+                                  con['inputName'])
+        return graph
 
     def configureInterpreter(self, options):
         try:
-            self.rgiConnection.send('CONFIGURE{}'.format(json.dumps(options)), print)
+            self.rgiConnection.send(self.addressCommand('CONFIGURE', json.dumps(options)), print)
         except AttributeError:
             print('No Connection. Cannot send configuration.')
 
 
+def executeNode(node, cb=None, arg=None):
+    """
+    Runs a locked node, notifies its connected nodes and unlocks it again.
+    Nodes declared as 'pure' are not run if the graph's node cache holds outputs for their current input values.
+    :param node: Node instance.
+    :param cb: Callable called after the node was executed successfully.
+    :param arg: Argument passed to the callback.
+    :return: None
+    """
+    try:
+        node.runLock.acquire()
+        node.graph.nodeStarted(node)
+        start = time.time()
+        cache = node.graph.nodeCache if node.pure else None
+        key = cache.getKey(node) if cache and cache.isEnabled() else None
+        if not key or not cache.restore(node, key):
+            if node.processSafe and node.graph.processPool:
+                runInProcess(node, node.graph.processPool)
+            else:
+                runNode(node)
+            if key:
+                cache.store(node, key)
+        if node.graph.runtimeStatistics:
+            node.graph.runtimeStatistics.record(node, time.time() - start)
+    except Exception as a:
+        print('Something bad happened in when executing {}.'.format(str(node)))
+        print(a)
+        node.graph.startedNodes.pop(node, None)
+        node.unlock()
+        node.runLock.release()
+        if node.graph.errorCallback:
+            node.graph.errorCallback(node, a)
+        return
+    with node.graph.checkpointGate:
+        node.notify()
+        node.graph.startedNodes.pop(node, None)
+    if cb:
+        cb(arg)
+    node.unlock()
+    node.runLock.release()
+    node.graph.wakeNode(node)
+
+
+def pickleState(node):
+    """
+    Returns the pickled execution state of a node (see Node.getState) or None if it cannot be pickled.
+    """
+    try:
+        return pickle.dumps(node.getState(), protocol=4)
+    except (pickle.PicklingError, TypeError, AttributeError, ValueError):
+        return None
+
+
+def executeBatch(jobs):
+    """
+    Counterpart of 'executeNode' for several locked nodes of the same class implementing 'runBatch'.
+    Nodes whose outputs are found in the node cache are not run. The input values of all other nodes are passed to a
+    single call of 'runBatch'. Afterwards every node is finished like by 'executeNode'. If the call fails, none of the
+    nodes notifies its connected nodes.
+    :param jobs: List of (node, cb, arg) tuples as passed to 'executeNode'.
+    :return: None
+    """
+    pending = []
+    try:
+        for node, cb, arg in jobs:
+            node.runLock.acquire()
+            node.graph.nodeStarted(node)
+        start = time.time()
+        for node, cb, arg in jobs:
+            cache = node.graph.nodeCache if node.pure else None
+            key = cache.getKey(node) if cache and cache.isEnabled() else None
+            if not key or not cache.restore(node, key):
+                pending.append((node, key))
+        if pending:
+            batch = [{name: inp(True) for name, inp in node.inputs.items()} for node, key in pending]
+            for (node, key), outputs in zip(pending, pending[0][0].runBatch(batch)):
+                for name, value in outputs.items():
+                    node.outputs[name](value)
+                if key:
+                    node.graph.nodeCache.store(node, key)
+        duration = (time.time() - start) / len(jobs)
+        for node, cb, arg in jobs:
+            if node.graph.runtimeStatistics:
+                node.graph.runtimeStatistics.record(node, duration)
+    except Exception as a:
+        print('Something bad happened in when executing {} nodes of class {}.'.format(len(jobs),
+                                                                                       jobs[0][0].__class__.__name__))
+        print(a)
+        for node, cb, arg in jobs:
+            node.graph.startedNodes.pop(node, None)
+            node.unlock()
+            node.runLock.release()
+            if node.graph.errorCallback:
+                node.graph.errorCallback(node, a)
+        return
+    for node, cb, arg in jobs:
+        with node.graph.checkpointGate:
+            node.notify()
+            node.graph.startedNodes.pop(node, None)
+        if cb:
+            cb(arg)
+        node.unlock()
+        node.runLock.release()
+        node.graph.wakeNode(node)
+
+
+def runInProcess(node, processPool):
+    """
+    Executes a node's run method in a worker process instead of the current thread.
+    The state of the node's inputs is sent to the worker process. The resulting output values are written back to the
+    node's outputs. Falls back to running the node in the current thread if the input values cannot be pickled.
+    Large output values are returned as SharedValue handles (see floppy.sharedMemory). The current process becomes the
+    owner of their shared memory blocks.
+    :param node: Node instance with 'processSafe' set to True.
+    :param processPool: concurrent.futures.ProcessPoolExecutor instance.
+    :return: None
+    """
+    try:
+        state = pickle.dumps({name: (inp.value, inp.valueSet, inp.default, inp.connected, inp.loopLevel)
+                              for name, inp in node.inputs.items()})
+    except (pickle.PicklingError, TypeError, AttributeError):
+        runNode(node)
+        return
+    outputs, usedDefaults = processPool.submit(runDetached, node.__class__.__name__, state).result()
+    for name, (valueSet, value) in outputs.items():
+        if isinstance(value, SharedValue):
+            value.adopt()
+        if valueSet:
+            node.outputs[name](value)
+    for name, usedDefault in usedDefaults.items():
+        node.inputs[name].usedDefault = usedDefault
+
+
+def runDetached(className, state):
+    """
+    Counterpart of 'runInProcess' executed by the worker process.
+    A temporary instance of the node class is created, its inputs are restored and its run method is executed.
+    Output values exceeding floppy.sharedMemory.THRESHOLD are moved to shared memory.
+    :param className: Name of the node class.
+    :param state: Pickled dictionary mapping input names to the state of the corresponding inputs.
+    :return: Tuple of two dictionaries mapping output names to (valueSet, value) tuples and input names to the inputs'
+    'usedDefault' flags.
+    """
+    node = NODECLASSES[className](0, Graph())
+    for name, (value, valueSet, default, connected, loopLevel) in pickle.loads(state).items():
+        inp = node.inputs[name]
+        inp.value, inp.valueSet, inp.default, inp.connected, inp.loopLevel = value, valueSet, default, connected, loopLevel
+    runNode(node)
+    return ({name: (out.valueSet, share(out.value)) for name, out in node.outputs.items() if out.valueSet},
+            {name: inp.usedDefault for name, inp in node.inputs.items()})
+
+
 class NodeThread(Thread):
 
     def __init__(self, node, cb, arg):
@@ -780,20 +1418,291 @@ class NodeThread(Thread):
 
     def run(self):
         super(NodeThread, self).run()
+        executeNode(self.node, self.cb, self.arg)
+
+
+class RuntimeStatistics(object):
+    """
+    Records how long nodes took to execute.
+    Exponential moving averages of the run times are kept for each node class and for each individual node.
+    """
+    def __init__(self, smoothing=.3, default=.001):
+        self.smoothing = smoothing
+        self.default = default
+        self.byClass = {}
+        self.byNode = {}
+        self.version = 0
+        self.lock = Lock()
+
+    def record(self, node, duration):
+        with self.lock:
+            for averages, key in ((self.byClass, node.__class__.__name__), (self.byNode, str(node))):
+                try:
+                    averages[key] += self.smoothing * (duration - averages[key])
+                except KeyError:
+                    averages[key] = duration
+            self.version += 1
+
+    def estimate(self, node):
+        """
+        Returns the expected run time of a node. Falls back to the average of the node's class and then to the
+        default value if the node itself was never executed.
+        :param node: Node instance.
+        :return: float; run time in seconds.
+        """
         try:
-            self.node.runLock.acquire()
-            self.node.run()
-        except Exception as a:
-            print('Something bad happened in when executing {}.'.format(str(self.node)))
-            print(a)
-            self.node.unlock()
-            self.node.runLock.release()
-            return
-        self.node.notify()
-        if self.cb:
-            self.cb(self.arg)
-        self.node.unlock()
-        self.node.runLock.release()
+            return self.byNode[str(node)]
+        except KeyError:
+            return self.byClass.get(node.__class__.__name__, self.default)
+
+
+class CheckpointGate(object):
+    """
+    Keeps checkpoints from being taken while nodes change the state of the graph.
+    Threads notifying the successors of a node pass through the gate with a 'with' statement. Any number of threads
+    may pass at the same time. 'closed' waits for all passing threads and blocks new ones until the checkpoint was
+    taken.
+    """
+    def __init__(self):
+        self.condition = Condition()
+        self.passing = 0
+        self.isClosed = False
+
+    def __enter__(self):
+        with self.condition:
+            while self.isClosed:
+                self.condition.wait()
+            self.passing += 1
+
+    def __exit__(self, excType, excValue, traceback):
+        with self.condition:
+            self.passing -= 1
+            if not self.passing:
+                self.condition.notify_all()
+
+    @contextmanager
+    def closed(self):
+        with self.condition:
+            while self.isClosed:
+                self.condition.wait()
+            self.isClosed = True
+            while self.passing:
+                self.condition.wait()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.isClosed = False
+                self.condition.notify_all()
+
+
+class ResourceLimiter(object):
+    """
+    Limits how many nodes requiring the same named resource are executed at the same time.
+    Node classes declare required resources with tags of the form 'resource:<name>', e.g. Tag('resource:shelxl').
+    Resources without a configured limit are not restricted.
+    """
+    def __init__(self):
+        self.limits = {}
+        self.inUse = {}
+        self.acquired = {}
+        self.waiting = []
+        self.lock = Lock()
+
+    @staticmethod
+    def getResources(node):
+        return [tag.partition(':')[2] for tag in node.__tags__ if tag.startswith('resource:')]
+
+    def setLimits(self, limits):
+        """
+        Sets the maximum number of concurrently executed nodes for each given resource.
+        :param limits: Dictionary mapping resource names to int. A limit of 0 or None removes the restriction.
+        :return: None
+        """
+        with self.lock:
+            for name, limit in limits.items():
+                if limit:
+                    self.limits[name] = int(limit)
+                else:
+                    self.limits.pop(name, None)
+            waiting, self.waiting = self.waiting, []
+        for retry in waiting:
+            retry()
+
+    def acquire(self, node, retry):
+        """
+        Reserves all limited resources required by a node. If any of them is exhausted, nothing is reserved and the
+        'retry' callable is called after the next resource was released.
+        :param node: Node instance.
+        :param retry: Callable without arguments. Should hand the node back to the scheduler.
+        :return: True if the node may be executed now.
+        """
+        with self.lock:
+            resources = [name for name in self.getResources(node) if name in self.limits]
+            if not resources:
+                return True
+            if any([self.inUse.get(name, 0) >= self.limits[name] for name in resources]):
+                self.waiting.append(retry)
+                return False
+            for name in resources:
+                self.inUse[name] = self.inUse.get(name, 0) + 1
+            self.acquired[node] = resources
+        return True
+
+    def release(self, node):
+        with self.lock:
+            try:
+                resources = self.acquired.pop(node)
+            except KeyError:
+                return
+            for name in resources:
+                self.inUse[name] -= 1
+            waiting, self.waiting = self.waiting, []
+        for retry in waiting:
+            retry()
+
+
+class WorkerPool(object):
+    """
+    Fixed number of reusable threads for executing nodes handed over by Graph.runNodePar.
+    Nodes submitted while all workers are busy wait in a queue until a worker becomes available. Waiting nodes with
+    higher priority are executed first. Nodes with equal priority are executed in the order they were submitted.
+    Nodes whose resources are exhausted according to the pool's ResourceLimiter are set aside until a resource is
+    released. Workers continue with other nodes in the meantime.
+    Waiting nodes of classes implementing 'runBatch' are executed together with the next node of the same class
+    fetched by a worker (see 'takeBatch').
+    """
+    def __init__(self, size=8, limiter=None, maxBatch=256):
+        self.limiter = limiter if limiter else ResourceLimiter()
+        self.jobs = PriorityQueue()
+        self.counter = count()
+        self.maxBatch = maxBatch
+        self.size = 0
+        self.completed = 0
+        self.completion = Condition()
+        self.resize(size)
+
+    def resize(self, size):
+        """
+        Changes the number of worker threads.
+        Shrinking the pool queues one stop request per surplus worker ahead of all waiting nodes. Workers executing a
+        node are not interrupted; the next workers to fetch a job terminate instead of executing another node.
+        :param size: int; new number of workers. At least one worker is kept.
+        :return: None
+        """
+        size = max(1, int(size))
+        while self.size < size:
+            WorkerThread(self)
+            self.size += 1
+        while self.size > size:
+            # Queued nodes have priorities in (-inf, 0], so stop requests are always fetched first.
+            self.jobs.put((float('-inf'), next(self.counter), None))
+            self.size -= 1
+
+    def submit(self, node, cb=None, arg=None, priority=0.):
+        self.jobs.put((-priority, next(self.counter), (node, cb, arg)))
+
+    def takeBatch(self, node):
+        """
+        Removes the waiting jobs of nodes that can be executed together with the given node by a single call of its
+        class's 'runBatch' method. This is only done for classes overriding 'runBatch' whose nodes are executed by
+        worker threads and require no resources. At most 'maxBatch' - 1 jobs are removed.
+        :param node: Node instance fetched from the queue by a worker.
+        :return: List of (node, cb, arg) tuples.
+        """
+        if not self.isBatchable(node):
+            return []
+        cls = type(node)
+        with self.jobs.mutex:
+            queue = self.jobs.queue
+            entries = [entry for entry in queue if entry[2] is not None and type(entry[2][0]) is cls]
+            entries = sorted(entries)[:self.maxBatch - 1]
+            if not entries:
+                return []
+            taken = set(id(entry) for entry in entries)
+            queue[:] = [entry for entry in queue if id(entry) not in taken]
+            heapq.heapify(queue)
+        return [entry[2] for entry in entries]
+
+    @staticmethod
+    def isBatchable(node):
+        return (type(node).runBatch is not Node.runBatch and not (node.processSafe and node.graph.processPool)
+                and not asyncio.iscoroutinefunction(node.run) and not ResourceLimiter.getResources(node))
+
+    def shutdown(self):
+        """
+        Discards all waiting nodes and stops all workers. Workers executing a node terminate after finishing it.
+        The pool must not be used afterwards.
+        :return: None
+        """
+        while True:
+            try:
+                self.jobs.get_nowait()
+            except Empty:
+                break
+        for i in range(self.size):
+            self.jobs.put((float('-inf'), next(self.counter), None))
+        self.size = 0
+
+    def nodeCompleted(self):
+        with self.completion:
+            self.completed += 1
+            self.completion.notify_all()
+
+    def interrupt(self):
+        """
+        Wakes up all threads blocked in 'waitForCompletion'.
+        :return: None
+        """
+        with self.completion:
+            self.completion.notify_all()
+
+    def waitForCompletion(self, since, timeout):
+        """
+        Blocks until a worker finished executing a node, 'interrupt' was called or the timeout expired.
+        :param since: value of 'completed' before the caller started waiting for nodes to finish.
+        :param timeout: float; maximum time to wait in seconds.
+        :return: None
+        """
+        with self.completion:
+            if self.completed == since:
+                self.completion.wait(timeout)
+
+    def queueDepth(self):
+        """
+        Returns the number of nodes waiting for a free worker.
+        :return: int
+        """
+        return self.jobs.qsize()
+
+
+class WorkerThread(Thread):
+    """
+    Thread executing nodes from a WorkerPool's job queue until it receives None instead of a node.
+    """
+    def __init__(self, pool):
+        super(WorkerThread, self).__init__()
+        self.pool = pool
+        self.daemon = True
+        self.start()
+
+    def run(self):
+        while True:
+            entry = self.pool.jobs.get()
+            priority, position, job = entry
+            if job is None:
+                return
+            node = job[0]
+            if not self.pool.limiter.acquire(node, lambda entry=entry: self.pool.jobs.put(entry)):
+                continue
+            batch = self.pool.takeBatch(node)
+            if batch:
+                executeBatch([job] + batch)
+            else:
+                executeNode(*job)
+            self.pool.limiter.release(node)
+            for i in range(len(batch) + 1):
+                self.pool.nodeCompleted()
 
 
 class Connection(object):
@@ -815,35 +1724,51 @@ class Connection(object):
 
 class StatusListener(Thread):
     """
-    Thread for listening to the remote graph interpreter for status updates.
+    Thread listening to the remote graph interpreter for execution events.
+    The listener opens its own connection to the interpreter and subscribes to the events of the graph with the
+    SUBSCRIBE command. The interpreter pushes coalesced events at no more than 'rate' messages per second.
     """
-    def __init__(self, master, socket, statusQueue, statusLock):
+    def __init__(self, master, host, port, rate=EVENTRATE):
         Thread.__init__(self)
         self.alive = True
-        self.connection = socket
+        self.subscribed = False
         self.master = master
         self.daemon = True
-        self.statusQueue = statusQueue
-        self.statusLock = statusLock
-        self.start()
+        self.connection = socket(AF_INET, SOCK_STREAM)
+        self.connection.settimeout(5.)
+        self.connection.connect((host, port))
+        self.protocol = RGIConnection.negotiate(self.connection)
+        self.protocol.send(self.connection, master.addressCommand('SUBSCRIBE', json.dumps({'rate': rate})))
+        answer = self.protocol.receive(self.connection)
+        if answer and answer.startswith('Subscribed'):
+            # Interpreters not knowing the SUBSCRIBE command are polled with the STATUS command instead.
+            self.subscribed = True
+            self.connection.settimeout(None)
+            self.start()
+        else:
+            self.connection.close()
 
-    # def kill(self):
-    #     self.alive = False
-    #     time.sleep(.1)
-    #     self.listenSocket.shutdown(SHUT_RDWR)
+    def kill(self):
+        self.alive = False
+        try:
+            self.connection.shutdown(SHUT_RDWR)
+        except OSError:
+            pass
 
     def run(self):
         while self.alive:
             try:
-                message = self.connection.recv(1024).decode()
-            except:
+                message = self.protocol.receive(self.connection)
+            except OSError:
+                break
+            if message is None:
+                break
+            try:
+                self.master.applyEvents(json.loads(message))
+            except ValueError:
                 pass
-            else:
-                self.statusLock.acquire()
-                for ID in [i for i in message.split('#')if i]:
-                    self.master.executedBuffer.append(int(ID))
-                self.statusLock.release()
-                self.master.requestUpdate()
+        self.subscribed = False
+        self.connection.close()
 
 
 
@@ -0,0 +1,47 @@
+"""
+Module implementing the search for pairs of close points used by the PairsWithinCutoff and AtomPairsWithinCutoff
+nodes. Requires NumPy.
+"""
+
+# Half of the 26 cells adjacent to a cell. Comparing each cell with these visits every pair of cells once.
+NEIGHBOURCELLS = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+                  if (dx, dy, dz) > (0, 0, 0)]
+
+
+def getPairsWithinCutoff(points, cutoff):
+    """
+    Finds all pairs of points whose distance does not exceed the cutoff.
+    The points are sorted into cubic cells with an edge length equal to the cutoff. Only points in the same or in
+    adjacent cells are compared, which makes the search scale linearly with the number of points.
+    :param points: Nx3 array-like of Cartesian coordinates.
+    :param cutoff: float; maximum distance.
+    :return: Tuple of a Mx2 integer array of point indices (i < j, sorted) and an array of the M distances.
+    """
+    import numpy as np
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    first, second, distances = [np.zeros(0, dtype=int)], [np.zeros(0, dtype=int)], [np.zeros(0)]
+    if len(points) > 1 and cutoff > 0:
+        keys = np.floor((points - points.min(axis=0)) / cutoff).astype(int)
+        cells = {}
+        for index, key in enumerate(map(tuple, keys.tolist())):
+            cells.setdefault(key, []).append(index)
+        cells = {key: np.array(indices) for key, indices in cells.items()}
+        for (x, y, z), a in cells.items():
+            d = np.linalg.norm(points[a][:, None] - points[a][None], axis=2)
+            i, j = np.nonzero(np.triu(d <= cutoff, 1))
+            first.append(a[i])
+            second.append(a[j])
+            distances.append(d[i, j])
+            for dx, dy, dz in NEIGHBOURCELLS:
+                b = cells.get((x+dx, y+dy, z+dz))
+                if b is None:
+                    continue
+                d = np.linalg.norm(points[a][:, None] - points[b][None], axis=2)
+                i, j = np.nonzero(d <= cutoff)
+                first.append(a[i])
+                second.append(b[j])
+                distances.append(d[i, j])
+    first, second, distances = np.concatenate(first), np.concatenate(second), np.concatenate(distances)
+    pairs = np.sort(np.stack((first, second), axis=1), axis=1)
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    return pairs[order], distances[order]
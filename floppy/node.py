@@ -1,8 +1,13 @@
 from collections import OrderedDict
 from copy import copy
-from floppy.FloppyTypes import Type, MetaType
-from threading import Lock
+from floppy.FloppyTypes import Type, MetaType, Stream, Buffer
+from floppy.buffer import mapFile, iterLines
+from floppy.sharedMemory import resolve
+from floppy.stream import StreamBuffer, StreamProducer, readChunks
+from threading import Lock, RLock
 from os.path import isfile
+from inspect import iscoroutine
+import asyncio
 import floppy.graph
 
 NODECLASSES = {}
@@ -29,6 +34,18 @@ def abstractNode(cls: type):
     return cls
 
 
+def runNode(node):
+    """
+    Executes a node's run method in the current thread.
+    If the node implements 'run' as a coroutine function, the coroutine is driven to completion by a new event loop.
+    :param node: Node instance.
+    :return: None
+    """
+    result = node.run()
+    if iscoroutine(result):
+        asyncio.run(result)
+
+
 def Input(*args, **kwargs):
     pass
 
@@ -73,7 +90,8 @@ class Info(object):
         if not self.varType == object and not issubclass(self.varType, Type):
             try:
                 self.default = self.varType(value)
-            except ValueError:
+            except (ValueError, TypeError):
+                # E.g. None, the default of an input after it was reset.
                 self.default = ''
             if self.varType == bool:
                 try:
@@ -103,17 +121,18 @@ class Info(object):
 class InputInfo(Info):
     def __call__(self, noException=False):
         if self.valueSet:
+            value = resolve(self.value)
             if not self.varType == object:
                 if isinstance(self.varType, MetaType):
                     if self.list:
-                        return [self.varType.checkType(i) for i in self.value]
-                    return self.varType.checkType(self.value)
+                        return [self.varType.checkType(i) for i in value]
+                    return self.varType.checkType(value)
                 else:
                     if self.list:
-                        return [self.varType(i) for i in self.value]
-                    return self.varType(self.value)
+                        return [self.varType(i) for i in value]
+                    return self.varType(value)
             else:
-                return self.value
+                return value
         elif self.default != None and not self.connected:
             self.usedDefault = True if self.loopLevel > 0 else False
             if not self.varType == object and self.default:
@@ -303,9 +322,18 @@ class Node(object, metaclass=MetaNode):
 
     To access the value of an input during the Node's 'run' method or 'check' method use
     'myNodeInstance._myStringInput'. An 'InputNotAvailable' Exception is raised is the input is not set yet.
+
+    Set 'processSafe' to True in a custom Node class if its 'run' method only depends on the node's inputs and only
+    changes the node's outputs. Such nodes are executed in a separate process if the graph interpreter is configured
+    to use worker processes.
+
+    Set 'pure' to True if the node's outputs are determined by nothing but its input values. The graph interpreter
+    will then reuse the outputs of earlier executions with equal input values instead of running the node again.
     """
     Input('TRIGGER', object, optional=True)
     Tag('Node')
+    processSafe = False
+    pure = False
 
     def __init__(self, nodeID, graph):
         self.waitForAllControlls = False
@@ -381,6 +409,8 @@ class Node(object, metaclass=MetaNode):
     def run(self) -> None:
         """
         Execute the node. Override this to implement logic.
+        The method may be overridden by a coroutine function ('async def run(self)') if the node spends most of its
+        time waiting for I/O. Such nodes are awaited on the interpreter's event loop in the 'Async' execution mode.
         :rtype: None
         """
         print('Executing node {}'.format(self))
@@ -423,8 +453,37 @@ class Node(object, metaclass=MetaNode):
         with self.inputLock:
             self.loopLevel = max([self.loopLevel, loopLevel])
             self.inputs[inputName].set(value, override=override, loopLevel=loopLevel)
+        self.graph.wakeNode(self)
         # print('%%%%%%%%%%%%%%%%', str(self), inputName, value)
 
+    def cleanup(self):
+        """
+        Called when the node is deleted from its graph or the graph is discarded by the graph interpreter.
+        Override this to release resources the node keeps between two executions, e.g. threads or open files.
+        :return: None
+        """
+        pass
+
+    def runBatch(self, batch):
+        """
+        Executes the node for many sets of input values at once.
+        Override this with a vectorized counterpart of 'run' if the node is executed very often with little work per
+        execution, e.g. in the body of a ParallelForEach loop. Worker threads then combine the queued executions of
+        all nodes of the class into a single call (see WorkerPool.takeBatch).
+        The method may be called on any instance of the node class and must only depend on the given input values.
+        The default implementation calls 'run' of a temporary instance for each set of input values.
+        :param batch: List of dictionaries mapping input names to input values; one dictionary per execution.
+        :return: List of dictionaries mapping output names to output values in the order of 'batch'.
+        """
+        results = []
+        for values in batch:
+            node = self.__class__(self.ID, floppy.graph.Graph())
+            for name, value in values.items():
+                node.inputs[name].value, node.inputs[name].valueSet = value, True
+            runNode(node)
+            results.append({name: out.value for name, out in node.outputs.items() if out.valueSet})
+        return results
+
     def check(self) -> bool:
         """
         Checks whether all prerequisites for executing the node instance are met.
@@ -610,6 +669,37 @@ class Node(object, metaclass=MetaNode):
                 'outputConnections': outputConns,
                 'subgraph': self.subgraph}
 
+    def getState(self):
+        """
+        Returns the execution state of the node instance, i.e. the values and flags of its inputs and outputs and its
+        loop level. The graph interpreter writes this state to checkpoint files (see Graph.getCheckpoint).
+        Override this together with 'setState' if a custom node keeps additional state between two executions.
+        :return: Dictionary of picklable objects.
+        """
+        return {'inputs': {name: (resolve(inp.value), inp.valueSet, inp.default, inp.usedDefault, inp.loopLevel,
+                                  inp.multiCounter, inp.pure) for name, inp in self.inputs.items()},
+                'outputs': {name: (resolve(out.value), out.valueSet, out.default) for name, out in self.outputs.items()},
+                'loopLevel': self.loopLevel,
+                'buffered': self.buffered,
+                'outputBuffer': self.outputBuffer.copy()}
+
+    def setState(self, state):
+        """
+        Restores an execution state returned by 'getState'.
+        :param state: Dictionary returned by 'getState'.
+        :return: None
+        """
+        for name, (value, valueSet, default, usedDefault, loopLevel, multiCounter, pure) in state['inputs'].items():
+            inp = self.inputs[name]
+            inp.value, inp.valueSet, inp.default, inp.usedDefault = value, valueSet, default, usedDefault
+            inp.loopLevel, inp.multiCounter, inp.pure = loopLevel, multiCounter, pure
+        for name, (value, valueSet, default) in state['outputs'].items():
+            out = self.outputs[name]
+            out.value, out.valueSet, out.default = value, valueSet, default
+        self.loopLevel = state['loopLevel']
+        self.buffered = state['buffered']
+        self.outputBuffer = state['outputBuffer']
+
     @classmethod
     def matchHint(cls, text: str):
         return cls.matchInputHint(text) or cls.matchOutputHint(text) or cls.matchClassTag(text)
@@ -712,6 +802,8 @@ class Switch(ControlNode):
         self.fresh = True
 
     def check(self):
+        if self.locked:
+            return False
         if self.fresh:
             for inp in self.inputs.values():
                 if inp.name == 'Control':
@@ -758,6 +850,15 @@ class Switch(ControlNode):
         self.inputs['Control'].reset()
         [Info.reset(inp, self.loopLevel) for inp in self.inputs.values()]
 
+    def getState(self):
+        state = super(Switch, self).getState()
+        state['fresh'] = self.fresh
+        return state
+
+    def setState(self, state):
+        super(Switch, self).setState(state)
+        self.fresh = state['fresh']
+
 #
 # class Loop(ControlNode):
 #     """
@@ -957,6 +1058,49 @@ class ReadFile(Node):
         self._Content(c)
 
 
+class MapFile(Node):
+    """
+    Node for mapping a file into memory.
+    Unlike ReadFile, the content of the file is not copied into a string. Pages of the file are only loaded when nodes
+    connected to the 'Buffer' output access them.
+    """
+    Input('Name', str)
+    Output('Buffer', Buffer)
+
+    def run(self):
+        super(MapFile, self).run()
+        self._Buffer(mapFile(self._Name))
+
+
+class StreamFile(Node):
+    """
+    Node for reading a file as a stream of chunks of lines.
+    The file is read by a separate thread while the stream is consumed (e.g. by a ForEachInStream node). At most
+    'BufferSize' chunks are kept in memory; reading pauses while the buffer is full.
+    A stream that was not consumed completely is cancelled and its file closed when the node runs again, is deleted
+    or its graph is discarded.
+    """
+    Input('Name', str)
+    Input('LinesPerChunk', int, default=1)
+    Input('BufferSize', int, default=64)
+    Output('Stream', Stream)
+
+    def setup(self):
+        self.stream = None
+
+    def run(self):
+        super(StreamFile, self).run()
+        self.cleanup()
+        self.stream = StreamBuffer(self._BufferSize)
+        StreamProducer(self.stream, readChunks(open(self._Name, 'r'), self._LinesPerChunk))
+        self._Stream(self.stream)
+
+    def cleanup(self):
+        if self.stream is not None:
+            self.stream.cancel()
+            self.stream = None
+
+
 class WriteFile(Node):
     Input('Name', str)
     Input('Content', str)
@@ -991,6 +1135,8 @@ class ForLoop(ControlNode):
         # print('                                   XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX')
 
     def check(self):
+        if self.locked:
+            return False
         if self.fresh:
             for inp in self.inputs.values():
                 if inp.name == 'Control':
@@ -1008,7 +1154,10 @@ class ForLoop(ControlNode):
 
 
     def notify(self):
+        # Inputs are reset before notifying other nodes. In the parallel execution modes these might set them again
+        # before this method returns.
         if not self.done:
+            self.inputs['Control'].reset(force=True)
             for oName in self.outputs.keys():
                 if oName == 'Final':
                     continue
@@ -1019,23 +1168,30 @@ class ForLoop(ControlNode):
                     nextInput = con['inputName']
                     # nextNode.prepare()
                     nextNode.setInput(nextInput, self.outputs[outputName].value, override=True, loopLevel=self.loopLevel+1)
-            self.inputs['Control'].reset(force=True)
 
         else:
-            output = self.outputs['Final']
-            for con in self.graph.getConnectionsOfOutput(output):
-                outputName = con['outputName']
-                nextNode = con['inputNode']
-                nextInput = con['inputName']
-                nextNode.setInput(nextInput, self.outputs[outputName].value, loopLevel=self.loopLevel)
             # self.prepare()
-            self.fresh = True
             for inp in self.inputs.values():
-                if not inp.name == 'Iterations':
+                if not inp.name in ('Iterations', 'MaxInFlight'):
                     inp.reset()
             self.counter = 0
             self.fresh = True
             self.done = False
+            output = self.outputs['Final']
+            for con in self.graph.getConnectionsOfOutput(output):
+                outputName = con['outputName']
+                nextNode = con['inputNode']
+                nextInput = con['inputName']
+                nextNode.setInput(nextInput, self.outputs[outputName].value, loopLevel=self.loopLevel)
+
+    def getState(self):
+        state = super(ForLoop, self).getState()
+        state.update(fresh=self.fresh, counter=self.counter, done=self.done)
+        return state
+
+    def setState(self, state):
+        super(ForLoop, self).setState(state)
+        self.fresh, self.counter, self.done = state['fresh'], state['counter'], state['done']
 
     def report(self):
         r = super(ForLoop, self).report()
@@ -1059,6 +1215,268 @@ class ForEach(ForLoop):
         self.counter += 1
 
 
+class ForEachInStream(ForLoop):
+    """
+    Loop node sending one record of a stream at a time through the nodes of the loop body.
+    Records are taken out of the stream's buffer only when the loop body finished the previous record. A full buffer
+    throttles the producer of the stream. The 'Final' output is set to the number of records when the stream ended.
+    """
+    Input('Start', Stream)
+    Output('Record', object)
+    Tag('Stream')
+
+    def run(self):
+        super(ForLoop, self).run()
+        self.fresh = False
+        try:
+            record = next(self._Start)
+        except StopIteration:
+            self._Final(self.counter)
+            self.done = True
+        else:
+            self._Record(record)
+            self.counter += 1
+
+
+class LoopBodyCopy(object):
+    """
+    Copy of the loop body of a ParallelForEach node processing a single element.
+    The instance is assigned to the copy's graph as its ready queue. Nodes of the copy that finished their execution
+    are therefore passed back to the loop node, which dispatches the nodes that became ready.
+    """
+    def __init__(self, loop, index, graph):
+        self.loop = loop
+        self.index = index
+        self.graph = graph
+        self.running = 0
+        self.result = None
+        self.finished = False
+        self.failed = False
+        self.done = False
+        graph.readyQueue = self
+
+    def put(self, node):
+        self.loop.advance(self)
+
+
+class ParallelForEach(ForEach):
+    """
+    Parallel-map variant of the ForEach loop.
+    Instead of sending one element at a time through the loop body and waiting for the 'Control' input, every element
+    is processed by a private copy of the nodes downstream of the 'ListElement' output (see Graph.copyNodes). The nodes
+    of the copies are executed by the graph interpreter like any other node, i.e. by the worker pool, the process pool
+    or the event loop, using the node cache, the resource limits and the runtime statistics. Up to 'MaxInFlight'
+    copies are in progress at the same time.
+    The loop node itself runs twice: the first execution starts the copies and returns immediately, the second one
+    is triggered when all copies finished and sets the values the copies sent to the 'Control' input to the 'Final'
+    output as a list in the order of the elements.
+    Inputs of the loop body that are connected to nodes outside of the loop receive the values these nodes sent to the
+    original body nodes. The loop waits until all of these values are available and resets them when it finishes.
+    """
+    Input('MaxInFlight', int, default=8)
+    Tag('Parallel')
+    Tag('Map')
+
+    def setup(self):
+        self.copyLock = RLock()
+        self.body = []
+        self.controls = {}
+        self.elements = []
+        self.results = []
+        self.nextElement = 0
+        self.inFlight = 0
+        self.remaining = 0
+        self.error = None
+
+    def check(self):
+        if not self.fresh:
+            return not self.locked and not self.remaining
+        if not super(ParallelForEach, self).check():
+            return False
+        return all(node.inputs[inputName].valueSet for node, inputName in self.getExternalInputs(self.getBody()))
+
+    def run(self):
+        super(ForLoop, self).run()
+        if self.fresh:
+            self.fresh = False
+            self.startLoop()
+        else:
+            self.finishLoop()
+
+    def notify(self):
+        # The copies receive the list elements directly. Nothing is sent before the loop finished.
+        if self.done:
+            super(ParallelForEach, self).notify()
+
+    def startLoop(self):
+        """
+        Starts the copies of the loop body for the first 'MaxInFlight' elements.
+        :return: None
+        """
+        with self.copyLock:
+            self.body = self.getBody()
+            self.controls = self.getControls()
+            self.elements = list(self._Start)
+            self.results = [None] * len(self.elements)
+            self.nextElement = 0
+            self.inFlight = 0
+            self.remaining = len(self.elements)
+            self.error = None
+            self.startCopies()
+
+    def finishLoop(self):
+        """
+        Sets the 'Final' output after all copies finished and resets the inputs of the loop body that were set by
+        nodes outside of the loop.
+        :return: None
+        """
+        for node, inputName in self.getExternalInputs(self.body):
+            node.inputs[inputName].reset(force=True)
+        if self.error:
+            raise self.error
+        self._Final(self.results)
+        self.body, self.controls, self.elements, self.results = [], {}, [], []
+        self.done = True
+
+    def startCopies(self):
+        """
+        Starts copies of the loop body for pending elements until 'MaxInFlight' copies are in progress. Wakes up the
+        loop node once the copies of all elements finished. The caller must hold the copy lock.
+        :return: None
+        """
+        limit = max(1, self._MaxInFlight)
+        while self.inFlight < limit and self.nextElement < len(self.elements):
+            index = self.nextElement
+            self.nextElement += 1
+            self.inFlight += 1
+            self.dispatch(LoopBodyCopy(self, index, self.copyBody(self.body, self.elements[index])))
+        if not self.remaining:
+            self.graph.wakeNode(self)
+
+    def advance(self, bodyCopy):
+        """
+        Dispatches the nodes of a copy that became ready and starts the next copies if the copy finished.
+        Called whenever a node of the copy finished its execution.
+        :param bodyCopy: LoopBodyCopy instance.
+        :return: None
+        """
+        with self.copyLock:
+            if bodyCopy.done:
+                return
+            self.dispatch(bodyCopy)
+            if bodyCopy.done:
+                self.startCopies()
+
+    def dispatch(self, bodyCopy):
+        """
+        Submits all ready nodes of a copy to the graph interpreter. The copy is finished if none of its nodes is
+        running or ready. The caller must hold the copy lock.
+        :param bodyCopy: LoopBodyCopy instance.
+        :return: None
+        """
+        for node in list(bodyCopy.graph.nodes.values()):
+            if bodyCopy.failed or node.locked or node.buffered or not node.check():
+                continue
+            node.lock()
+            bodyCopy.running += 1
+            self.graph.reportEvent('started', node.ID)
+            bodyCopy.graph.runNodePar(node, cb=self.bodyNodeRan, arg=(bodyCopy, node))
+        if bodyCopy.running:
+            return
+        bodyCopy.done = True
+        self.inFlight -= 1
+        self.remaining -= 1
+        graph = bodyCopy.graph
+        if not graph.returnValue == -1:
+            self.graph.setReturnValue(graph.returnValue, graph.returnPriority, graph.returningNode)
+        if bodyCopy.finished:
+            self.results[bodyCopy.index] = bodyCopy.result
+        elif not self.error:
+            self.error = RuntimeError('Loop body of {} did not set the \'Control\' input for element {}.'
+                                      .format(self, self.elements[bodyCopy.index]))
+
+    def bodyNodeRan(self, arg):
+        bodyCopy, node = arg
+        with self.copyLock:
+            for outputName in self.controls.get(node.ID, ()):
+                bodyCopy.result = node.outputs[outputName].value
+                bodyCopy.finished = True
+            bodyCopy.running -= 1
+        self.graph.reportEvent('ran', node.ID)
+
+    def bodyNodeFailed(self, node, error):
+        bodyCopy = node.graph.readyQueue
+        with self.copyLock:
+            bodyCopy.running -= 1
+            bodyCopy.failed = True
+            if not self.error:
+                self.error = error
+        self.advance(bodyCopy)
+
+    def cleanup(self):
+        with self.copyLock:
+            # Copies in progress finish, but no further copies are started.
+            self.nextElement = len(self.elements)
+
+    def getState(self):
+        state = super(ParallelForEach, self).getState()
+        if not self.fresh and not self.done:
+            # The copies of the loop body are not part of the checkpoint. The loop starts over when it is restored.
+            state.update(fresh=True)
+        return state
+
+    def getBody(self):
+        """
+        Returns all nodes reachable from the 'ListElement' output without passing the loop node itself.
+        :return: List of Node instances.
+        """
+        body = []
+        stack = [con['inputNode'] for con in self.graph.getConnectionsOfOutput(self.outputs['ListElement'])]
+        while stack:
+            node = stack.pop()
+            if node is self or node in body:
+                continue
+            body.append(node)
+            stack += [con['inputNode'] for con in self.graph.getConnectionsFrom(node)]
+        return body
+
+    def getExternalInputs(self, body):
+        """
+        Returns the inputs of the loop body connected to nodes outside of the loop.
+        :param body: List of Node instances returned by 'getBody'.
+        :return: List of (Node instance, input name) tuples.
+        """
+        return [(node, con['inputName']) for node in body for con in self.graph.getConnectionsTo(node)
+                if con['outputNode'] is not self and con['outputNode'] not in body]
+
+    def getControls(self):
+        """
+        Returns the outputs connected to the 'Control' input.
+        :return: Dictionary mapping node IDs to lists of output names.
+        """
+        controls = {}
+        for con in self.graph.getConnectionsOfControlInput(self.inputs['Control']):
+            controls.setdefault(con['outputNode'].ID, []).append(con['outputName'])
+        return controls
+
+    def copyBody(self, body, element):
+        """
+        Creates a copy of the loop body for one element and sets the inputs of the copy.
+        :param body: List of Node instances returned by 'getBody'.
+        :param element: List element passed to the nodes connected to the 'ListElement' output.
+        :return: Graph instance containing the copy.
+        """
+        graph = self.graph.copyNodes(body)
+        graph.errorCallback = self.bodyNodeFailed
+        for con in self.graph.getConnectionsOfOutput(self.outputs['ListElement']):
+            graph.nodes[con['inputNode'].ID].setInput(con['inputName'], element, override=True,
+                                                      loopLevel=self.loopLevel+1)
+        for node, inputName in self.getExternalInputs(body):
+            inp = node.inputs[inputName]
+            graph.nodes[node.ID].setInput(inputName, inp.value, override=True, loopLevel=inp.loopLevel)
+        return graph
+
+
 class IsEqual(Node):
     """
     Sets output to object1 == object2.
@@ -1066,6 +1484,8 @@ class IsEqual(Node):
     Input('object1', object)
     Input('object2', object)
     Output('Equal', bool)
+    processSafe = True
+    pure = True
 
     def run(self):
         super(IsEqual, self).run()
@@ -1119,6 +1539,8 @@ class Join(Node):
     Input('Str1', str)
     Input('Str2', str)
     Output('Joined', str)
+    processSafe = True
+    pure = True
 
     def run(self):
         super(Join, self).run()
@@ -1187,6 +1609,8 @@ class Split(Node):
     Input('String', str)
     Input('Separator', str)
     Output('List', str, list=True)
+    processSafe = True
+    pure = True
 
     def run(self):
         super(Split, self).run()
@@ -1196,12 +1620,39 @@ class Split(Node):
 class SplitLines(Node):
     Input('String', str)
     Output('List', str, list=True)
+    processSafe = True
+    pure = True
 
     def run(self):
         super(SplitLines, self).run()
         self._List(self._String.splitlines())
 
 
+class SplitBufferLines(Node):
+    """
+    Splits a buffer into lines. The lines are views of the buffer's memory, not copies.
+    """
+    Input('Buffer', Buffer)
+    Output('List', Buffer, list=True)
+
+    def run(self):
+        super(SplitBufferLines, self).run()
+        self._List(list(iterLines(self._Buffer)))
+
+
+class DecodeBuffer(Node):
+    """
+    Decodes a buffer into a string.
+    """
+    Input('Buffer', Buffer)
+    Input('Encoding', str, default='utf-8')
+    Output('String', str)
+
+    def run(self):
+        super(DecodeBuffer, self).run()
+        self._String(str(self._Buffer, self._Encoding))
+
+
 class ShowValues(Node):
     # Input('Trigger', object)
     Output('Output', object)
@@ -1249,6 +1700,8 @@ class AppendValue(Node):
 class ToString(Node):
     Input('Value', object)
     Output('String', str)
+    processSafe = True
+    pure = True
 
     def run(self):
         super(ToString, self).run()
@@ -1314,6 +1767,8 @@ class SimpleReturn(Node):
 class Int2Float(Node):
     Input('Integer', int)
     Output('Float', float)
+    processSafe = True
+    pure = True
 
     def run(self):
         self._Float(float(self._Integer))
@@ -1322,6 +1777,8 @@ class Int2Float(Node):
 class String2Float(Node):
     Input('String', str)
     Output('Float', float)
+    processSafe = True
+    pure = True
 
     def run(self):
         self._Float(float(self._String))
@@ -6,7 +6,7 @@ from floppy.mainwindow import Ui_MainWindow
 from floppy.floppySettings import SettingsDialog
 from floppy.nodeLib import ContextNodeFilter, ContextNodeList
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt, QPoint, QSettings
+from PyQt5.QtCore import Qt, QPoint, QSettings, pyqtSignal
 from PyQt5.QtGui import *
 from PyQt5.Qt import QTimer
 import platform
@@ -47,6 +47,7 @@ class Painter2D(Painter):
     clickedPin = None
     clickedNode = None
     nodePoints = []
+    updateRequested = pyqtSignal()
     downOverNode = False
     
     def __init__(self, parent=None):
@@ -55,6 +56,8 @@ class Painter2D(Painter):
         self.timer = QTimer()
         self.timer.timeout.connect(self.checkGraph)
         self.timer.start(500)
+        # Emitted by Graph.wakePainter from other threads.
+        self.updateRequested.connect(self.checkGraph)
         self.setFocusPolicy(Qt.ClickFocus)
         self.graph = None
         self.shiftDown = False
@@ -973,6 +976,11 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.dropAction.setIconVisibleInMenu(True)
         self.addAction(self.dropAction)
 
+        self.resumeAction = QAction('Resume', self)
+        self.resumeAction.setToolTip('Restore the graph from its latest checkpoint and continue its execution.')
+        self.resumeAction.triggered.connect(self.resumeGraph)
+        self.addAction(self.resumeAction)
+
         self.pushAction = QAction(QIcon(os.path.join(self.iconRoot, 'push.png')), 'Push', self)
         self.pushAction.setShortcut('Ctrl+X')
         self.pushAction.triggered.connect(self.pushGraph)
@@ -1033,6 +1041,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.mainToolBar.addAction(self.connectAction)
         # self.mainToolBar.addAction(self.statusAction)
         self.mainToolBar.addAction(self.dropAction)
+        self.mainToolBar.addAction(self.resumeAction)
 
 
 
@@ -1065,9 +1074,26 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.DrawArea.setTabText(currentIndex, self.DrawArea.tabText(currentIndex)+'*')
 
     def configureInterpreter(self):
+        self.getGraph().configureInterpreter(self.getInterpreterOptions())
+
+    def getInterpreterOptions(self):
         frameRate = self.settings.value('FrameRate', type=float)
         mode = self.settings.value('RGIMode', type=str)
-        self.getGraph().configureInterpreter({'framerate': frameRate, 'mode': mode})
+        workers = self.settings.value('RGIWorkers', type=int)
+        processes = self.settings.value('RGIProcesses', type=int)
+        resources = {}
+        for limit in self.settings.value('RGIResources', type=str).split(','):
+            name, _, value = limit.partition('=')
+            try:
+                resources[name.strip()] = int(value)
+            except ValueError:
+                continue
+        options = {'framerate': frameRate, 'mode': mode, 'workers': workers, 'processes': processes,
+                   'resources': resources, 'cacheMemory': self.settings.value('RGICacheMemory', 0, type=int),
+                   'workdir': self.settings.value('WorkDir', type=str),
+                   'persistentCache': self.settings.value('RGIPersistentCache', False, type=bool),
+                   'checkpoint': self.settings.value('RGICheckpointInterval', 0, type=int)}
+        return options
 
     def getSubgraphList(self):
         new = self.getPainter().getAllSubgraphs()
@@ -1112,10 +1138,15 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         text = ''
         while not text:
             text, ok = QInputDialog.getItem(self, 'Connect to remote Interpreter',
-                                            'IP Address/Port: (xxx.xxx.xxx:Port)',
+                                            'IP Address/Port: (xxx.xxx.xxx:Port[/GraphName])',
                                             [self.connectHint])
             if not ok:
                 return
+        self.connectHint = text
+        graphID = None
+        if '/' in text:
+            text, graphID = text.split('/', 1)
+            graphID = graphID.strip() or None
         if not ':' in text:
             ip = text
             port = ''
@@ -1126,10 +1157,10 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                     return
         else:
             ip, port = text.split(':')
-        self.connectHint = text
         import socket
         try:
-            self.getGraph().connect2RemoteRunner(ip, port)
+            self.getGraph().connect2RemoteRunner(ip, port, graphID,
+                                                 eventRate=self.settings.value('RGIEventRate', 20, type=int))
         except ConnectionRefusedError:
             err = QErrorMessage(self)
             err.showMessage('Connection to {} on port {} refused.'.format(ip, port))
@@ -1165,6 +1196,12 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         except AttributeError:
             self.statusBar.showMessage('Cannot Drop Graph. No Interpreter Available..', 2000)
 
+    def resumeGraph(self):
+        try:
+            self.activeGraph.resumeRunner()
+        except AttributeError:
+            self.statusBar.showMessage('Cannot Resume Graph. No Interpreter Available.', 2000)
+
     def pushGraph(self):
         try:
             self.activeGraph.push2Runner()
@@ -1227,9 +1264,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         logger.debug('Connected to Runner.')
 
     def runCode(self, *args):
-        frameRate = self.settings.value('FrameRate', type=float)
-        mode = self.settings.value('RGIMode', type=str)
-        self.activeGraph.execute(options={'framerate': frameRate, 'mode': mode})
+        self.activeGraph.execute(options=self.getInterpreterOptions())
         self.statusBar.showMessage('Code execution started.', 2000)
 
     def loadGraph(self, *args, override=False, makeActive=False):
@@ -1393,7 +1428,7 @@ class Selector(DrawItem):
 
     def watchDown(self, pos):
         self.select = str(self.items[self.highlight-1])
-        self.parent.inputs[self.data.name].setDefault(self.select)
+        self.parent.graph.setDefault(self.parent, self.data.name, self.select)
         # self.parent._Boolean.setDefault(self.select)
         # self.painter.removeWatchingItem(self)
 
@@ -1545,7 +1580,7 @@ class LineEdit(DrawItem):
         else:
             self.text += self.sanitizeInputString(event.text())
         self.painter.update()
-        self.parent.inputs[self.data.name].setDefault(self.text)
+        self.parent.graph.setDefault(self.parent, self.data.name, self.text)
         super(LineEdit, self).keyPressEvent(event)
         # print(event.key())
 
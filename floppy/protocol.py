@@ -0,0 +1,247 @@
+"""
+Module implementing the framing of messages exchanged between the editor and the graph interpreter.
+
+Version 1 (text protocol): Every message is a UTF-8 string preceded by its length as a 4-byte big-endian integer.
+
+Version 2 (binary protocol): The length is followed by a flag byte. The flags name the codec the message was
+compressed with. Messages shorter than COMPRESSIONTHRESHOLD bytes are sent uncompressed.
+
+Frames and decompressed messages larger than MAXMESSAGESIZE bytes are rejected with a ProtocolError.
+
+Version 3 (tagged protocol): The flag byte is followed by a request ID as a 4-byte big-endian integer. The interpreter
+tags every answer with the ID of the request it answers, which allows clients to send further requests before the
+answers to previous requests arrived. Messages that do not answer a request (e.g. pushed events) carry the ID 0.
+
+A connection starts with the text protocol. The client may send 'PROTOCOL <offer>', where the offer is a JSON object
+containing the highest supported version and the supported codecs in order of preference. The interpreter answers
+'PROTOCOL <agreement>' containing the chosen version and codec. Both sides use the agreed protocol for all following
+messages. Interpreters not knowing the PROTOCOL command reject it, and the client keeps using the text protocol.
+"""
+
+import asyncio
+import json
+import struct
+import zlib
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+PROTOCOLVERSION = 3
+COMPRESSIONTHRESHOLD = 1024
+MAXMESSAGESIZE = 256 << 20
+
+
+class ProtocolError(ConnectionError):
+    """
+    Raised for frames violating the protocol. The connection is closed like a broken connection.
+    """
+    pass
+
+
+def zlibDecompress(data, maxLength):
+    decompressor = zlib.decompressobj()
+    try:
+        message = decompressor.decompress(data, maxLength + 1)
+    except zlib.error as e:
+        raise ProtocolError('Corrupt zlib frame: {}'.format(e))
+    if len(message) > maxLength:
+        raise ProtocolError('Decompressed message exceeds {} bytes.'.format(maxLength))
+    if not decompressor.eof:
+        raise ProtocolError('Truncated zlib frame.')
+    return message
+
+
+def lz4Decompress(data, maxLength):
+    decompressor = lz4.frame.LZ4FrameDecompressor()
+    try:
+        message = decompressor.decompress(data, max_length=maxLength + 1)
+    except RuntimeError as e:
+        raise ProtocolError('Corrupt lz4 frame: {}'.format(e))
+    if len(message) > maxLength:
+        raise ProtocolError('Decompressed message exceeds {} bytes.'.format(maxLength))
+    if not decompressor.eof:
+        raise ProtocolError('Truncated lz4 frame.')
+    return message
+
+
+CODECS = {}
+if lz4:
+    CODECS['lz4'] = (0x02, lz4.frame.compress, lz4Decompress)
+CODECS['zlib'] = (0x01, zlib.compress, zlibDecompress)
+DECOMPRESSORS = {flag: decompress for flag, compress, decompress in CODECS.values()}
+
+
+class Protocol(object):
+    """
+    Framing state of one end of a connection.
+    """
+    def __init__(self, maxLength=MAXMESSAGESIZE):
+        """
+        :param maxLength: int; maximum size of received frames and decompressed messages in bytes.
+        """
+        self.version = 1
+        self.codec = None
+        self.maxLength = maxLength
+
+    def offer(self):
+        """
+        Returns the PROTOCOL command a client sends to negotiate the protocol.
+        :return: string
+        """
+        return 'PROTOCOL ' + json.dumps({'version': PROTOCOLVERSION, 'compression': list(CODECS.keys())},
+                                        separators=(',', ':'))
+
+    def negotiate(self, offer):
+        """
+        Chooses the protocol for an offer received by the interpreter.
+        The chosen protocol must only be used after the answer was sent with the current protocol (see 'use').
+        :param offer: JSON string sent by the client.
+        :return: Tuple of the answer to send to the client, the chosen version and the chosen codec.
+        """
+        try:
+            offer = json.loads(offer)
+            version = min(int(offer['version']), PROTOCOLVERSION)
+            codecs = offer.get('compression', [])
+        except (ValueError, TypeError, KeyError):
+            version, codecs = 1, []
+        codec = next((codec for codec in codecs if codec in CODECS), None) if version > 1 else None
+        answer = json.dumps({'version': version, 'compression': codec}, separators=(',', ':'))
+        return 'PROTOCOL ' + answer, version, codec
+
+    def agree(self, answer):
+        """
+        Applies the interpreter's answer to an offer. The text protocol is kept if the answer is not a valid agreement.
+        :param answer: Message received from the interpreter.
+        :return: bool; True if the answer is a valid agreement.
+        """
+        if not answer or not answer.startswith('PROTOCOL '):
+            return False
+        try:
+            agreement = json.loads(answer[9:])
+            version, codec = int(agreement['version']), agreement['compression']
+        except (ValueError, TypeError, KeyError):
+            return False
+        if codec is not None and codec not in CODECS:
+            return False
+        self.use(version, codec)
+        return True
+
+    def use(self, version, codec):
+        self.version = version
+        self.codec = codec if version > 1 else None
+
+    @property
+    def tagged(self):
+        return self.version >= 3
+
+    def encode(self, message, requestID=0):
+        """
+        Frames a message.
+        :param message: string
+        :param requestID: int; ID of the request the message belongs to. Ignored by protocols older than version 3.
+        :return: bytes
+        """
+        data = message.encode('utf-8')
+        if self.version < 2:
+            return struct.pack('>I', len(data)) + data
+        flag = 0
+        if self.codec and len(data) >= COMPRESSIONTHRESHOLD:
+            flag, compress, decompress = CODECS[self.codec]
+            data = compress(data)
+        if self.version < 3:
+            return struct.pack('>IB', len(data) + 1, flag) + data
+        return struct.pack('>IBI', len(data) + 5, flag, requestID) + data
+
+    def decode(self, data):
+        """
+        Returns the message of a frame's body, i.e. of the frame without the length.
+        :param data: bytes
+        :return: string
+        """
+        return self.unpack(data)[1]
+
+    def unpack(self, data):
+        """
+        Returns the request ID and the message of a frame's body.
+        :param data: bytes
+        :return: Tuple of the request ID (0 for protocols older than version 3) and the message.
+        :raises: ProtocolError if the frame is corrupt or the message exceeds the maximum length.
+        """
+        if self.version < 2:
+            return 0, data.decode('utf-8')
+        if self.version < 3:
+            flag, requestID, data = data[0], 0, data[1:]
+        else:
+            flag, requestID = struct.unpack('>BI', data[:5])
+            data = data[5:]
+        if flag:
+            try:
+                decompress = DECOMPRESSORS[flag]
+            except KeyError:
+                raise ProtocolError('Unknown codec flag {}.'.format(flag))
+            data = decompress(data, self.maxLength)
+        return requestID, data.decode('utf-8')
+
+    def checkLength(self, length):
+        if length > self.maxLength:
+            raise ProtocolError('Frame of {} bytes exceeds {} bytes.'.format(length, self.maxLength))
+        return length
+
+    def send(self, sock, message, requestID=0):
+        sock.sendall(self.encode(message, requestID))
+
+    def receive(self, sock):
+        """
+        Receives a message.
+        :param sock: Connected socket.
+        :return: string or None if the connection was closed.
+        """
+        tagged = self.receiveTagged(sock)
+        if tagged is None:
+            return None
+        return tagged[1]
+
+    def receiveTagged(self, sock):
+        """
+        Receives a message and the ID of the request it belongs to.
+        :param sock: Connected socket.
+        :return: Tuple of the request ID and the message or None if the connection was closed.
+        """
+        rawLength = recvall(sock, 4)
+        if not rawLength:
+            return None
+        data = recvall(sock, self.checkLength(struct.unpack('>I', rawLength)[0]))
+        if data is None:
+            return None
+        return self.unpack(data)
+
+    async def receiveAsync(self, reader):
+        """
+        Receives a message and the ID of the request it belongs to from an asyncio stream.
+        :param reader: asyncio.StreamReader instance.
+        :return: Tuple of the request ID and the message or None if the connection was closed.
+        """
+        try:
+            rawLength = await reader.readexactly(4)
+            data = await reader.readexactly(self.checkLength(struct.unpack('>I', rawLength)[0]))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+        return self.unpack(data)
+
+
+def recvall(sock, n):
+    """
+    Receives exactly n bytes.
+    :param sock: Connected socket.
+    :param n: int; number of bytes.
+    :return: bytes or None if the connection was closed before n bytes were received.
+    """
+    data = bytearray()
+    while len(data) < n:
+        packet = sock.recv(n - len(data))
+        if not packet:
+            return None
+        data += packet
+    return bytes(data)
@@ -5,13 +5,23 @@ Communication between the editor and the runner is realized via Sockets.
 The runner will report its status to the editor and the editor is able to send commands to the runner.
 """
 
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition, Event
+from concurrent.futures import ProcessPoolExecutor, Future
+from multiprocessing import get_context
 import time
+from collections import OrderedDict, deque
+from itertools import count
 from queue import Queue
 from socket import AF_INET, SOCK_STREAM, socket, SHUT_RDWR, timeout, SHUT_RDWR, SO_REUSEADDR, SOL_SOCKET
 import json
-import struct
+import os
+import pickle
+import re
 import logging
+import asyncio
+import select
+
+from floppy.protocol import Protocol
 
 logger = logging.getLogger('Floppy-Interpreter')
 logger.setLevel(logging.DEBUG)
@@ -26,27 +36,48 @@ logger.addHandler(fh)
 # host = '10.76.64.86'
 host = ''
 port = 8079
+# Seconds after the last STATUS command during which executed nodes are still collected for polling clients.
+STATUSPOLLTIMEOUT = 10.
 
 
 # updatePort = 7237
 
-xLock = Lock()
-
-
 class Runner(object):
-
-    def __init__(self):
+    """
+    Graph interpreter hosting any number of graphs at the same time.
+    Every graph is executed by its own ExecutionThread and is addressed by an ID chosen by the client. Commands without
+    an ID address the default graph. All graphs share the interpreter's worker pool, process pool and AsyncEngine.
+    Execution threads for new IDs are only created by pushing or patching a graph (or by resuming one from its
+    checkpoint). All other commands addressing an unknown ID are rejected.
+    """
+    def __init__(self, listen=True, asyncServer=True):
+        """
+        :param listen: Accept commands via TCP/IP. Interpreters used from within the same process (e.g. by the batch
+        runner in floppy.batch) can be created with 'listen=False'.
+        :param asyncServer: Serve all clients on one asyncio event loop (AsyncListener). If False, every client is
+        served by its own thread (Listener).
+        """
+        from floppy.graph import WorkerPool, RuntimeStatistics, ResourceLimiter
+        from floppy.cache import NodeCache
         logger.info('Creating new interpreter.')
-        self.status = []
-        self.runningNodes = []
+        self.resourceLimiter = ResourceLimiter()
+        self.workerPool = WorkerPool(limiter=self.resourceLimiter)
+        self.runtimeStatistics = RuntimeStatistics()
+        self.nodeCache = NodeCache()
+        self.processPool = None
+        self.asyncEngine = None
+        self.workDir = None
+        self.persistentCache = False
+        self.checkpointInterval = 0
         self.conn = None
-        self.nextNodePointer = None
-        self.currentNodePointer = None
-        self.lastNodePointer = None
-        self.graphData = {}
-        self.cmdQueue = Queue(1)
-        self.listener = Listener(self)
-        self.executionThread = ExecutionThread(self.cmdQueue, self)
+        self.executionThreads = {}
+        self.executionThreadsLock = Lock()
+        self.subscribers = {}
+        self.subscribersLock = Lock()
+        self.listener = None
+        if listen:
+            self.listener = AsyncListener(self) if asyncServer else Listener(self)
+        self.executionThread = self.getExecutionThread(None, create=True)
 
         # self.updateSocket = socket(AF_INET, SOCK_STREAM)
         # self.updateSocket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
@@ -60,131 +91,478 @@ class Runner(object):
     def join(self):
         self.executionThread.join()
 
-    def resetPointers(self):
-        self.nextNodePointer = None
-        self.currentNodePointer = None
-        self.lastNodePointer = None
-
-    # def recvall(self, sock, n, retry=5):
-    #     # Helper function to recv n bytes or return None if EOF is hit
-    #     data = b''
-    #     while len(data) < n:
-    #         packet = sock.recv(n - len(data))
-    #         if not packet:
-    #             if retry>0:
-    #                 time.sleep(.1)
-    #                 self.recvall(sock, n, retry-1)
-    #             else:
-    #                 self.conn , address = self.updateSocket.accept()
-    #                 return self.loadGraph('[]')
-    #         data += packet
-    #     return data
-
-    def loadGraph(self, data):
-        data = json.loads(data)
-
-        self.graphData = data
-        xLock.acquire()
-        if not self.cmdQueue.empty():
-            self.cmdQueue.get()
-        self.cmdQueue.put(ExecutionThread.loadGraph)
-        xLock.release()
-
-    def updateGraph(self, data):
-        data = json.loads(data)
-
-        self.graphData = data
-        xLock.acquire()
-        if not self.cmdQueue.empty():
-            self.cmdQueue.get()
-        self.cmdQueue.put(ExecutionThread.updateGraph)
-        xLock.release()
+    def getExecutionThread(self, graphID, create=False):
+        """
+        Returns the ExecutionThread executing the graph with the given ID.
+        New threads inherit the frame rate and execution mode of the default graph.
+        :param graphID: string or None for the default graph.
+        :param create: Create a new execution thread if the ID is unknown. Only used for commands loading a graph.
+        :return: ExecutionThread instance or None if the ID is unknown and 'create' is False.
+        """
+        with self.executionThreadsLock:
+            try:
+                return self.executionThreads[graphID]
+            except KeyError:
+                if not create:
+                    return None
+            logger.info('Creating execution context for graph {}.'.format(graphID))
+            executionThread = ExecutionThread(self, graphID)
+            default = self.executionThreads.get(None)
+            if default:
+                executionThread.setFrameRate(default.framerate)
+                executionThread.setMode(default.mode)
+            self.executionThreads[graphID] = executionThread
+            return executionThread
+
+    def getGraphIDs(self):
+        return [graphID for graphID in self.executionThreads.keys() if graphID is not None]
+
+    def loadGraph(self, data, graphID=None):
+        data, version = unpackGraph(json.loads(data))
+        executionThread = self.getExecutionThread(graphID, create=True)
+        executionThread.returned.clear()
+        executionThread.graphVersion = version
+        executionThread.command(ExecutionThread.loadGraph, data, version)
+
+    def setGraph(self, graph, graphID=None):
+        """
+        Hands an existing Graph instance over to the interpreter. The graph is executed after unpausing.
+        :param graph: Graph instance.
+        :param graphID: string or None for the default graph.
+        :return: None
+        """
+        executionThread = self.getExecutionThread(graphID, create=True)
+        executionThread.returned.clear()
+        executionThread.graphVersion = None
+        executionThread.command(ExecutionThread.setGraph, graph)
+
+    def updateGraph(self, data, graphID=None):
+        data, version = unpackGraph(json.loads(data))
+        executionThread = self.getExecutionThread(graphID)
+        executionThread.returned.clear()
+        executionThread.graphVersion = version
+        executionThread.command(ExecutionThread.updateGraph, data, version)
+
+    def patchGraph(self, data, graphID=None):
+        """
+        Applies the changes made to a graph by the editor (see floppy.changeLog).
+        :param data: JSON string of a patch created by ChangeLog.takePatch.
+        :param graphID: string or None for the default graph.
+        :return: False if the patch is not based on the graph's current version and the editor has to send the whole
+        graph instead. True otherwise.
+        """
+        patch = json.loads(data)
+        executionThread = self.getExecutionThread(graphID, create=True)
+        if executionThread.graphVersion is None or not executionThread.graphVersion == patch['base']:
+            return False
+        executionThread.returned.clear()
+        executionThread.graphVersion = patch['version']
+        executionThread.command(ExecutionThread.patchGraph, patch)
+        return True
 
-    def pause(self):
-        xLock.acquire()
-        if not self.cmdQueue.empty():
-            self.cmdQueue.get()
-        self.cmdQueue.put(ExecutionThread.pause)
-        xLock.release()
+    def pause(self, graphID=None):
+        self.getExecutionThread(graphID).command(ExecutionThread.pause)
 
-    def drop(self):
-        self.pause()
-        self.loadGraph('[]')
+    def drop(self, graphID=None):
+        """
+        Drops a graph. The default graph is replaced by an empty graph, all other graphs are removed together with
+        their execution thread.
+        :param graphID: string or None for the default graph.
+        :return: None
+        """
+        if graphID is None:
+            self.pause()
+            self.loadGraph('[]')
+            return
+        with self.executionThreadsLock:
+            executionThread = self.executionThreads.pop(graphID, None)
+        if executionThread:
+            executionThread.command(ExecutionThread.kill)
+            logger.info('Dropped execution context for graph {}.'.format(graphID))
 
     def kill(self):
         # self.updateSocket.close()
-        xLock.acquire()
-        if not self.cmdQueue.empty():
-            self.cmdQueue.get()
-        self.cmdQueue.put(ExecutionThread.kill)
-        xLock.release()
+        with self.executionThreadsLock:
+            for executionThread in self.executionThreads.values():
+                executionThread.command(ExecutionThread.kill)
 
-    def configure(self, options):
+    def configure(self, options, graphID=None):
+        """
+        Applies configuration options. The frame rate and the execution mode are set for the addressed graph only,
+        all other options affect the whole interpreter.
+        :param options: Dictionary of options.
+        :param graphID: string or None for the default graph.
+        :return: None
+        """
         # print(options)
         try:
             framerate = options['framerate']
         except KeyError:
             pass
         else:
-            self.executionThread.setFrameRate(framerate)
+            self.getExecutionThread(graphID).setFrameRate(framerate)
 
         try:
             mode = options['mode']
         except KeyError:
             pass
         else:
-            self.executionThread.setMode(mode)
+            self.getExecutionThread(graphID).setMode(mode)
 
-    def unpause(self):
-        xLock.acquire()
-        if not self.cmdQueue.empty():
-            self.cmdQueue.get()
-        self.cmdQueue.put(ExecutionThread.unpause)
-        xLock.release()
+        try:
+            workers = options['workers']
+        except KeyError:
+            pass
+        else:
+            if workers:
+                self.workerPool.resize(workers)
+                logger.info('Worker pool resized to {}'.format(workers))
 
-    def goto(self, nextID):
-        self.nextNodePointer = nextID
+        try:
+            resources = options['resources']
+        except KeyError:
+            pass
+        else:
+            self.resourceLimiter.setLimits(resources)
+            logger.info('Resource limits set to {}'.format(resources))
 
-    def step(self):
-        xLock.acquire()
-        if not self.cmdQueue.empty():
-            self.cmdQueue.get()
-        self.cmdQueue.put(ExecutionThread.step)
-        xLock.release()
+        try:
+            cacheMemory = options['cacheMemory']
+        except KeyError:
+            pass
+        else:
+            self.nodeCache.setMaxBytes(float(cacheMemory) * (1 << 20))
+            logger.info('Node cache memory set to {} MiB'.format(cacheMemory))
 
-    def updateStatus(self, ID):
-        nodeID = ID
-        self.status.append((nodeID, time.time()))# '{:12.1f}'.format(time.time())))
+        try:
+            workDir = options['workdir']
+        except KeyError:
+            pass
+        else:
+            self.workDir = workDir
+            logger.info('Work directory set to {}'.format(workDir))
+
+        try:
+            persistentCache = options['persistentCache']
+        except KeyError:
+            pass
+        else:
+            self.persistentCache = persistentCache
+
+        if 'workdir' in options or 'persistentCache' in options:
+            cacheDir = self.workDir if self.persistentCache else None
+            try:
+                self.nodeCache.setDirectory(cacheDir)
+            except OSError as e:
+                logger.error('Cannot use {} as node cache directory: {}'.format(cacheDir, e))
+            else:
+                logger.info('Node cache directory set to {}'.format(self.nodeCache.directory))
+
+        try:
+            checkpointInterval = options['checkpoint']
+        except KeyError:
+            pass
+        else:
+            self.checkpointInterval = checkpointInterval
+            logger.info('Checkpoint interval set to {}'.format(checkpointInterval))
+
+        try:
+            processes = options['processes']
+        except KeyError:
+            pass
+        else:
+            self.setProcessPool(processes)
+
+    def setProcessPool(self, processes):
+        """
+        Replaces the pool of worker processes used for executing nodes declared as 'processSafe'.
+        :param processes: int; number of processes. No pool is used if 0 or None.
+        :return: None
+        """
+        if self.processPool:
+            self.processPool.shutdown(wait=False)
+        self.processPool = None
+        if processes:
+            self.processPool = ProcessPoolExecutor(processes, mp_context=get_context('spawn'),
+                                                   initializer=loadCustomNodes)
+        with self.executionThreadsLock:
+            for executionThread in self.executionThreads.values():
+                if executionThread.graph:
+                    executionThread.graph.processPool = self.processPool
+        logger.info('Process pool size set to {}'.format(processes))
+
+    def getAsyncEngine(self):
+        """
+        Returns the interpreter's AsyncEngine. The engine is created on first use.
+        :return: AsyncEngine instance.
+        """
+        if not self.asyncEngine:
+            self.asyncEngine = AsyncEngine(self.resourceLimiter)
+        return self.asyncEngine
+
+    def unpause(self, graphID=None):
+        self.getExecutionThread(graphID).command(ExecutionThread.unpause)
+
+    def getCheckpointPath(self, graphID=None):
+        """
+        Returns the path of the checkpoint file of a graph.
+        :param graphID: string or None for the default graph.
+        :return: Path inside the work directory or None if no work directory is configured.
+        """
+        if not self.workDir:
+            return None
+        return os.path.join(self.workDir, 'checkpoints', '{}.checkpoint'.format('default' if graphID is None
+                                                                                else graphID))
+
+    def resume(self, graphID=None):
+        """
+        Replaces a graph by the state stored in its latest checkpoint and continues its execution.
+        :param graphID: string or None for the default graph.
+        :return: True if the checkpoint was read, False if no valid checkpoint exists.
+        """
+        path = self.getCheckpointPath(graphID)
+        if not path:
+            logger.error('Cannot resume graph {}: No work directory configured.'.format(graphID))
+            return False
+        try:
+            with open(path, 'rb') as fp:
+                checkpoint = pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+            logger.error('Cannot read checkpoint {}: {}'.format(path, e))
+            return False
+        executionThread = self.getExecutionThread(graphID, create=True)
+        executionThread.returned.clear()
+        executionThread.graphVersion = None
+        executionThread.command(ExecutionThread.resume, checkpoint)
+        executionThread.command(ExecutionThread.unpause)
+        return True
+
+    def goto(self, nextID, graphID=None):
+        self.getExecutionThread(graphID).nextNodePointer = nextID
 
-    def updateRunningNodes(self, running):
-        self.runningNodes = running
+    def step(self, graphID=None):
+        self.getExecutionThread(graphID).command(ExecutionThread.step)
 
-    def getStatus(self):
+    def getStatus(self, graphID=None):
         # string = '#'.join([str(i) for i in self.status])
-        state = {'ran': self.status,
-                            'running': self.runningNodes}
-        self.status = []
+        executionThread = self.getExecutionThread(graphID)
+        executionThread.lastStatusPoll = time.time()
+        state = {'ran': executionThread.status,
+                 'running': executionThread.runningNodes,
+                 'queued': self.workerPool.queueDepth(),
+                 'awaiting': self.asyncEngine.pending if self.asyncEngine else 0,
+                 'cache': self.nodeCache.getStatus()}
+        executionThread.status = []
         return state
 
-    def getReport(self, nodeID):
-        if self.executionThread.graph and nodeID in self.executionThread.graph.nodes:
-            report = self.executionThread.graph.nodes[nodeID].report()
+    def getReport(self, nodeID, graphID=None):
+        graph = self.getExecutionThread(graphID).graph
+        if graph and nodeID in graph.nodes:
+            report = graph.nodes[nodeID].report()
             logger.debug('Generated node instance report: {}'.format(report))
             return report
         else:
             return ''
 
+    def subscribe(self, graphID, subscriber):
+        """
+        Registers an EventBuffer for the execution events of a graph. Subscriptions belong to the interpreter, not to
+        the graph's execution thread. Editors can therefore subscribe before they push a new graph and keep their
+        subscription when the graph is dropped and pushed again.
+        :param graphID: string or None for the default graph.
+        :param subscriber: EventBuffer instance.
+        :return: None
+        """
+        with self.subscribersLock:
+            self.subscribers.setdefault(graphID, []).append(subscriber)
+
+    def unsubscribe(self, graphID, subscriber):
+        with self.subscribersLock:
+            subscribers = self.subscribers.get(graphID, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            if not subscribers:
+                self.subscribers.pop(graphID, None)
+
+    def publish(self, graphID, event, *args):
+        """
+        Passes an execution event of a graph to all EventBuffer instances subscribed to the graph.
+        :param graphID: string or None for the default graph.
+        :param event: 'started', 'ran' or 'return'.
+        :param args: Arguments of the event (see EventBuffer.put).
+        :return: bool; True if the event was passed to at least one subscriber.
+        """
+        if not self.subscribers:
+            return False
+        with self.subscribersLock:
+            subscribers = self.subscribers.get(graphID)
+            if not subscribers:
+                return False
+            for subscriber in subscribers:
+                subscriber.put(event, *args)
+            return True
+
+
+class CommandQueue(object):
+    """
+    Unbounded, ordered channel of commands sent to an ExecutionThread.
+    A command is an ExecutionThread method which is called with the thread and the arguments given to 'put'.
+    The condition is shared with the thread's ReadyQueue so that a new command also ends any wait for nodes to become
+    ready.
+    """
+    def __init__(self, condition=None):
+        self.condition = condition if condition else Condition()
+        self.commands = deque()
+
+    def put(self, cmd, *args):
+        with self.condition:
+            self.commands.append((cmd, args))
+            self.condition.notify_all()
+
+    def get(self):
+        """
+        Returns the oldest command and its arguments without blocking.
+        :return: Tuple of the command and a tuple of arguments or None if no command is pending.
+        """
+        with self.condition:
+            if self.commands:
+                return self.commands.popleft()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until a command is pending, the shared condition is notified otherwise or the timeout expired.
+        :param timeout: float; maximum time to wait in seconds. Wait indefinitely if None.
+        :return: None
+        """
+        with self.condition:
+            if not self.commands:
+                self.condition.wait(timeout)
+
+
+class ReadyQueue(object):
+    """
+    Thread safe queue of nodes that might have become ready for execution.
+    Nodes are put into the queue whenever one of their inputs is set or when they finished running. Each node is
+    contained at most once, no matter how often it was woken up before the scheduler fetched it.
+    """
+    def __init__(self, condition=None):
+        self.condition = condition if condition else Condition()
+        self.pending = OrderedDict()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def put(self, node):
+        with self.condition:
+            self.pending[node] = None
+            self.condition.notify_all()
+
+    def putAll(self, nodes):
+        with self.condition:
+            for node in nodes:
+                self.pending[node] = None
+            self.condition.notify_all()
+
+    def get(self, timeout=None):
+        """
+        Returns all pending nodes in the order they were woken up. Blocks until at least one node is pending, the
+        condition is notified otherwise (e.g. by a new command) or the timeout expired.
+        :param timeout: float; maximum time to wait in seconds.
+        :return: list of Node instances. Empty if no node is pending.
+        """
+        with self.condition:
+            if not self.pending:
+                self.condition.wait(timeout)
+            nodes = list(self.pending.keys())
+            self.pending.clear()
+        return nodes
+
+
+class AsyncEngine(Thread):
+    """
+    Thread running an asyncio event loop on which nodes with a coroutine 'run' method are awaited.
+    Any number of such nodes can wait for I/O at the same time without occupying a worker thread each.
+    Nodes requiring an exhausted resource are resubmitted by the ResourceLimiter once the resource is released.
+    """
+    def __init__(self, limiter):
+        super(AsyncEngine, self).__init__()
+        self.limiter = limiter
+        self.daemon = True
+        self.loop = asyncio.new_event_loop()
+        self.pending = 0
+        self.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, node, cb=None, arg=None):
+        """
+        Schedules the execution of a locked node on the event loop. Thread safe.
+        :param node: Node instance with a coroutine 'run' method.
+        :param cb: Callable called after the node was executed successfully.
+        :param arg: Argument passed to the callback.
+        :return: None
+        """
+        asyncio.run_coroutine_threadsafe(self.execute(node, cb, arg), self.loop)
+
+    async def execute(self, node, cb, arg):
+        if not self.limiter.acquire(node, lambda: self.submit(node, cb, arg)):
+            return
+        self.pending += 1
+        node.runLock.acquire()
+        try:
+            node.graph.nodeStarted(node)
+            start = time.time()
+            await node.run()
+            if node.graph.runtimeStatistics:
+                node.graph.runtimeStatistics.record(node, time.time() - start)
+        except Exception as a:
+            print('Something bad happened in when executing {}.'.format(str(node)))
+            print(a)
+            node.graph.startedNodes.pop(node, None)
+            node.unlock()
+            node.runLock.release()
+            self.pending -= 1
+            self.limiter.release(node)
+            if node.graph.errorCallback:
+                node.graph.errorCallback(node, a)
+            return
+        with node.graph.checkpointGate:
+            node.notify()
+            node.graph.startedNodes.pop(node, None)
+        if cb:
+            cb(arg)
+        node.unlock()
+        node.runLock.release()
+        self.pending -= 1
+        self.limiter.release(node)
+        node.graph.wakeNode(node)
+
 
 class ExecutionThread(Thread):
-    def __init__(self, cmdQueue, master):
+    def __init__(self, master, graphID=None):
         logger.debug('Creating new ExecutionThread.')
         self.graph = None
+        self.graphID = graphID
         self.framerate = 0.1
+        self.mode = 'Parallel'
         self.master = master
         self.paused = True
         self.alive = True
+        self.readyQueue = None
+        self.asyncEngine = None
+        self.polledNodes = []
+        self.status = []
+        self.runningNodes = []
+        self.nextNodePointer = None
+        self.returned = Event()
+        # Version of the editor's change log the graph will be in after all queued commands were executed.
+        self.graphVersion = None
+        self.lastCheckpoint = time.time()
+        self.lastStatusPoll = 0
         self._executeGraphStep = self.executeGraphStepPar
-        self.cmdQueue = cmdQueue
+        self.cmdQueue = CommandQueue()
         super(ExecutionThread, self).__init__()
         self.daemon = True
         # self.updateGraph()
@@ -194,41 +572,146 @@ class ExecutionThread(Thread):
         self.framerate = framerate
         logger.info('Framerate set to {}'.format(framerate))
 
+    def command(self, cmd, *args):
+        """
+        Queues a command for execution by this thread. Ends waiting for running nodes in 'Parallel' mode.
+        :param cmd: ExecutionThread method.
+        :param args: Arguments passed to the method.
+        :return: None
+        """
+        self.cmdQueue.put(cmd, *args)
+        if self._executeGraphStep == self.executeGraphStepPar:
+            self.master.workerPool.interrupt()
+
+    def updateStatus(self, ID):
+        nodeID = ID
+        t = time.time()
+        # Subscribed editors receive the event directly. It is still collected for the STATUS command as long as other
+        # clients poll it.
+        if not self.publish('ran', nodeID, t) or t - self.lastStatusPoll < STATUSPOLLTIMEOUT:
+            self.status.append((nodeID, t))# '{:12.1f}'.format(time.time())))
+
+    def reportEvent(self, event, nodeID):
+        if event == 'ran':
+            self.updateStatus(nodeID)
+        else:
+            self.publish(event, nodeID)
+
+    def publish(self, event, *args):
+        """
+        Passes an execution event of the graph to the clients subscribed to it (see Runner.publish).
+        :param event: 'started', 'ran' or 'return'.
+        :param args: Arguments of the event (see EventBuffer.put).
+        :return: bool; True if the event was passed to at least one subscriber.
+        """
+        return self.master.publish(self.graphID, event, *args)
+
     def setMode(self, mode):
-        if mode == 'Parallel':
+        self.mode = mode
+        self.asyncEngine = None
+        if mode == 'Event':
+            self._executeGraphStep = self.executeGraphStepEvent
+            self.readyQueue = ReadyQueue(self.cmdQueue.condition)
+        elif mode == 'Async':
+            self._executeGraphStep = self.executeGraphStepEvent
+            self.readyQueue = ReadyQueue(self.cmdQueue.condition)
+            self.asyncEngine = self.master.getAsyncEngine()
+        elif mode == 'Parallel':
             self._executeGraphStep = self.executeGraphStepPar
+            self.readyQueue = None
         else:
             self._executeGraphStep = self.executeGraphStep
+            self.readyQueue = None
+        logger.info('Execution mode set to {}'.format(mode))
+        if self.graph:
+            self.attachScheduler()
+
+    def attachScheduler(self):
+        """
+        Hands the ready queue and the async engine to the current graph so that its nodes can wake up the scheduler
+        and queues all nodes once to find the initially executable ones.
+        Nodes implementing a custom 'check' method may become ready without any of their inputs changing. These are
+        remembered and re-checked whenever nothing happened for the duration of one frame.
+        """
+        from floppy.node import Node
+        self.graph.readyQueue = self.readyQueue
+        self.graph.asyncEngine = self.asyncEngine
+        self.graph.eventCallback = self.reportEvent
+        if self.readyQueue is None:
+            self.polledNodes = []
+            return
+        self.polledNodes = [node for node in self.graph.nodes.values() if type(node).check is not Node.check]
+        self.readyQueue.putAll(self.graph.nodes.values())
 
     def run(self):
         while self.alive:
-            xLock.acquire()
-            cmd = None
-            if not self.cmdQueue.empty():
+            cmd = self.cmdQueue.get()
+            while cmd and self.alive:
+                # print(cmd)
+                cmd, args = cmd
+                cmd(self, *args)
                 cmd = self.cmdQueue.get()
-            xLock.release()
-            # print(cmd)
-            if cmd:
-                cmd(self)
+            if not self.alive:
+                break
             if self.paused:
                 # print('Sleeping')
-                time.sleep(1)
+                self.cmdQueue.wait()
                 continue
             if self.alive and self.graph:
                 if not self.graph.returnValue == -1:
                     # print(self.graph.returnPriority)
                     self.pause()
+                    self.returned.set()
+                    self.publish('return', self.graph.returnValue, self.graph.returningNode)
+                self.graph.capturePreRunStates = self.checkpointsEnabled()
+                if self.checkpointDue():
+                    self.writeCheckpoint()
                 # print(self.graph.nodes)
                 #print('Doing stuff.')
                 # self.executeGraphStep()
                 # self.executeGraphStepPar()
                 self._executeGraphStep()
-                self.master.updateRunningNodes(self.graph.runningNodes)
+                self.runningNodes = self.graph.runningNodes
             else:
-                time.sleep(self.framerate)
+                self.cmdQueue.wait(self.framerate)
         print('That\'s it. I\'m dead.')
         logger.info('ExecutionThread terminating')
 
+    def checkpointsEnabled(self):
+        return bool(self.master.checkpointInterval and self.master.workDir)
+
+    def checkpointDue(self):
+        return self.checkpointsEnabled() and time.time() - self.lastCheckpoint >= self.master.checkpointInterval
+
+    def writeCheckpoint(self):
+        """
+        Writes the execution state of the graph (see Graph.getCheckpoint) to the graph's checkpoint file in the work
+        directory. The file is replaced atomically and therefore always holds a complete checkpoint.
+        :return: None
+        """
+        self.lastCheckpoint = time.time()
+        path = self.master.getCheckpointPath(self.graphID)
+        try:
+            checkpoint = self.graph.getCheckpoint()
+            data = pickle.dumps(checkpoint, protocol=4)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.error('Cannot create checkpoint of graph {}: {}'.format(self.graphID, e))
+            return
+        if checkpoint['skipped']:
+            logger.warning('Checkpoint of graph {} does not include {}: their state cannot be pickled. They restart '
+                           'from their initial state when the checkpoint is restored.'
+                           .format(self.graphID, ', '.join(str(item) for item in checkpoint['skipped'])))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmpPath = path + '.tmp'
+            with open(tmpPath, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmpPath, path)
+        except OSError as e:
+            logger.error('Cannot write checkpoint {}: {}'.format(path, e))
+            return
+        logger.debug('Checkpoint of graph {} written to {}.'.format(self.graphID, path))
+
     def pause(self):
         logger.info('Pausing')
         self.paused = True
@@ -236,48 +719,102 @@ class ExecutionThread(Thread):
     def unpause(self):
         logger.info('Unpausing')
         self.paused = False
+        if self.readyQueue is not None and self.graph:
+            self.readyQueue.putAll(self.graph.nodes.values())
 
     def kill(self):
         logger.info('Exiting')
         self.alive = False
+        if self.graph:
+            self.graph.close()
 
     def step(self):
         print('Stepping up.')
         logger.debug('Performing single step')
         if self.executeGraphStep():
-            self.master.updateRunningNodes(self.graph.runningNodes)
+            self.runningNodes = self.graph.runningNodes
         # self.executeGraphStepPar()
 
-    def loadGraph(self):
+    def loadGraph(self, data, version=None):
         from floppy.graph import Graph
         logger.debug('Attempting to load graph instance.')
-        self.graph = Graph()
+        graph = Graph()
         # print(type(self.master.graph))
-        self.graph.loadState(self.master.graphData, reuseIDs=True)
+        graph.loadState(data, reuseIDs=True)
+        graph.appliedVersion = version
+        self.setGraph(graph)
         logger.info('Successfully loaded graph instance.')
         #self.resetPointers()
 
-    def updateGraph(self):
+    def setGraph(self, graph):
+        if self.graph and self.graph is not graph:
+            self.graph.close()
+        self.graph = graph
+        self.graph.workerPool = self.master.workerPool
+        self.graph.processPool = self.master.processPool
+        self.graph.runtimeStatistics = self.master.runtimeStatistics
+        self.graph.nodeCache = self.master.nodeCache
+        self.returned.clear()
+        self.attachScheduler()
+
+    def resume(self, checkpoint):
+        from floppy.graph import Graph
+        logger.debug('Attempting to restore graph instance from checkpoint.')
+        graph = Graph()
+        graph.restoreCheckpoint(checkpoint)
+        self.setGraph(graph)
+        self.lastCheckpoint = time.time()
+        logger.info('Successfully restored graph instance from checkpoint.')
+
+    def updateGraph(self, data, version=None):
         from floppy.graph import Graph
         # self.graph = Graph()
         # print(type(self.master.graph))
+        if not self.graph:
+            # The execution thread was created by a patch that had to be answered with 'RESYNC'.
+            return self.loadGraph(data, version)
         logger.debug('Attempting to update graph instance.')
-        self.graph.updateState(self.master.graphData, reuseIDs=True)
+        self.graph.updateState(data, reuseIDs=True)
+        self.graph.appliedVersion = version
+        self.attachScheduler()
         logger.info('Successfully updated graph instance.')
         #self.resetPointers()
 
+    def patchGraph(self, patch):
+        """
+        Applies a patch to the graph like an update with the patched json representation of the graph. Patches not based
+        on the applied version are dropped. The next patch is then answered with 'RESYNC'.
+        :param patch: Dictionary created by ChangeLog.takePatch.
+        :return: None
+        """
+        from floppy.changeLog import applyChanges
+        logger.debug('Attempting to patch graph instance.')
+        if not self.graph or self.graph.appliedVersion is None or not self.graph.appliedVersion == patch['base']:
+            logger.error('Cannot apply patch to version {}: graph is at version {}.'.format(
+                patch['base'], self.graph.appliedVersion if self.graph else None))
+            self.graphVersion = None
+            return
+        try:
+            data = applyChanges(self.graph.appliedData, patch['changes'])
+        except (KeyError, ValueError, TypeError) as e:
+            logger.error('Cannot apply patch: {}'.format(e))
+            self.graphVersion = None
+            return
+        self.updateGraph(data, patch['version'])
+
     def executeGraphStep(self):
+        from floppy.node import runNode
         if not self.graph:
             return
-        if self.master.nextNodePointer:
-            print(self.master.nextNodePointer, self.graph.nodes.keys())
-            nextNode = self.graph.nodes[self.master.nextNodePointer]
-            self.master.nextNodePointer = None
+        if self.nextNodePointer:
+            print(self.nextNodePointer, self.graph.nodes.keys())
+            nextNode = self.graph.nodes[self.nextNodePointer]
+            self.nextNodePointer = None
             if nextNode.check():
                 with nextNode.runLock:
-                    nextNode.run()
+                    runNode(nextNode)
                     nextNode.notify()
-                    self.master.sendStatus(nextNode.ID)
+                    self.updateStatus(nextNode.ID)
         else:
             running = False
             for node in self.graph.nodes.values():
@@ -285,31 +822,33 @@ class ExecutionThread(Thread):
                 running = checked if not running else True
                 if checked:
                     with node.runLock:
-                        node.run()
+                        runNode(node)
                         # self.graph.runNodePar(node)
                         # raise RuntimeError('Uncaught exception while executing node {}.'.format(node))
                         node.notify()
                         # self.master.sendStatus(node.ID)
-                        self.master.updateStatus(node.ID)
+                        self.updateStatus(node.ID)
                     break
             if not running:
                 # print('Nothing to do here @ {}'.format(time.time()))
-                time.sleep(self.framerate)
+                self.cmdQueue.wait(self.framerate)
         return True
 
     def executeGraphStepPar(self):
-        if self.master.nextNodePointer:
-            # print(self.master.nextNodePointer, self.graph.nodes.keys())
-            nextNode = self.graph.nodes[self.master.nextNodePointer]
-            self.master.nextNodePointer = None
+        if self.nextNodePointer:
+            from floppy.node import runNode
+            # print(self.nextNodePointer, self.graph.nodes.keys())
+            nextNode = self.graph.nodes[self.nextNodePointer]
+            self.nextNodePointer = None
             if nextNode.check():
                 with nextNode.runLock:
-                    nextNode.run()
+                    runNode(nextNode)
                     nextNode.notify()
-                self.master.sendStatus(nextNode.ID)
+                self.updateStatus(nextNode.ID)
         else:
             running = False
             readyNodes = []
+            completed = self.master.workerPool.completed
             for node in self.graph.nodes.values():
                 checked = node.check()
                 running = checked if not running else True
@@ -318,11 +857,31 @@ class ExecutionThread(Thread):
                     readyNodes.append(node)
             # print([str(node) for node in readyNodes])
             for node in readyNodes:
-                self.graph.runNodePar(node, cb=self.master.updateStatus, arg=node.ID)
+                self.publish('started', node.ID)
+                self.graph.runNodePar(node, cb=self.updateStatus, arg=node.ID)
             if not running:
                 # print('Nothing to do here @ {}'.format(time.time()))
-                time.sleep(self.framerate)
+                self.master.workerPool.waitForCompletion(completed, self.framerate)
 
+    def executeGraphStepEvent(self):
+        """
+        Event driven counterpart of 'executeGraphStepPar'.
+        Instead of checking every node of the graph in each step, only nodes that were woken up by a change of their
+        inputs or by finishing their own execution are checked. The method blocks until such a node exists, which makes
+        the dispatch cost proportional to the number of connections of the executed nodes.
+        """
+        if self.nextNodePointer:
+            return self.executeGraphStepPar()
+        readyNodes = self.readyQueue.get(self.framerate)
+        if not readyNodes:
+            readyNodes = self.polledNodes
+        for node in readyNodes:
+            if not self.graph.nodes.get(node.ID) is node:
+                continue
+            if node.check() and not node.locked:
+                node.lock()
+                self.publish('started', node.ID)
+                self.graph.runNodePar(node, cb=self.updateStatus, arg=node.ID)
 
 
 class Listener(Thread):
@@ -359,177 +918,576 @@ class Listener(Thread):
                 CommandProcessor(cSocket, address, self.master, self)
 
 
+COMMANDS = ('KILL', 'READY?', 'GRAPHS', 'UNPAUSE', 'PAUSE', 'UPDATE', 'PATCH', 'PUSH', 'DROP', 'GOTO', 'CONFIGURE',
+            'STEP', 'STATUS', 'RESUME', 'PROTOCOL', 'SUBSCRIBE')
+# Commands addressing a graph that must already exist. PUSH, PATCH and RESUME may create a new graph.
+GRAPHCOMMANDS = ('KILL', 'UNPAUSE', 'PAUSE', 'UPDATE', 'DROP', 'GOTO', 'CONFIGURE', 'STEP', 'STATUS')
+# Commands that require a payload. A single token following one of these is the payload, not a graph ID, e.g. 'GOTO 5'.
+PAYLOADCOMMANDS = ('UPDATE', 'PATCH', 'PUSH', 'GOTO', 'CONFIGURE')
+GRAPHID = re.compile(r' ([\w.\-]+)(?=\s|\*|$) ?')
+
+
+def unpackGraph(data):
+    """
+    Splits the decoded payload of a PUSH or UPDATE command into the graph and its version.
+    :param data: Either a list of (nodeID, nodeData) tuples or a dictionary holding such a list under 'graph' and the
+    version of the editor's change log under 'version'.
+    :return: Tuple of the list and the version. The version is None if the payload is a plain list.
+    """
+    if isinstance(data, dict):
+        return data['graph'], data['version']
+    return data, None
+
+
+def parseCommand(message):
+    """
+    Splits a message of the form 'COMMAND<payload>' or 'COMMAND <graphID> <payload>' into its parts.
+    Graph IDs may consist of letters, digits, '_', '.' and '-'. Commands in PAYLOADCOMMANDS only address a graph if
+    the ID is followed by a payload. 'GOTO 5' therefore addresses node 5 of the default graph.
+    :param message: string
+    :return: Tuple of the command, the graph ID (None if omitted) and the payload. None if the command is unknown.
+    """
+    for command in COMMANDS:
+        if message.startswith(command):
+            break
+    else:
+        return None
+    payload = message[len(command):]
+    match = GRAPHID.match(payload)
+    if not match or (command in PAYLOADCOMMANDS and not payload[match.end():]):
+        return command, None, payload
+    return command, match.group(1), payload[match.end():]
+
+
+def handleCommand(master, message):
+    """
+    Executes a command received by an interpreter server and returns the answer. Shared by the thread based Listener
+    and the AsyncListener.
+    The commands PROTOCOL, SUBSCRIBE and KILL without a graph ID affect the connection or the server itself and are
+    handled by the servers.
+    :param master: Runner instance.
+    :param message: Message received from the client.
+    :return: Answer string.
+    """
+    command = parseCommand(message)
+    if not command:
+        return 'Command \'{}...\' not understood.'.format(message[:50])
+    command, graphID, payload = command
+    if command in GRAPHCOMMANDS and not master.getExecutionThread(graphID):
+        return 'Graph \'{}\' not found.'.format(graphID)
+    try:
+        if command == 'KILL':
+            master.drop(graphID)
+            return 'Runner is dropping graph {}.'.format(graphID)
+        elif command == 'READY?':
+            return 'READY'
+        elif command == 'GRAPHS':
+            return json.dumps(master.getGraphIDs())
+        elif command == 'PAUSE':
+            master.pause(graphID)
+            return 'Runner is pausing.'
+        elif command == 'UNPAUSE':
+            master.unpause(graphID)
+            return 'Runner is unpausing.'
+        elif command == 'UPDATE':
+            master.updateGraph(payload, graphID)
+            return 'Runner is updating.'
+        elif command == 'PATCH':
+            if master.patchGraph(payload, graphID):
+                return 'Runner is patching.'
+            return 'RESYNC'
+        elif command == 'PUSH':
+            master.loadGraph(payload, graphID)
+            return 'Accepted pushed Graph. Runner is updating.'
+        elif command == 'DROP':
+            master.drop(graphID)
+            return 'Runner is dropping current graph.'
+        elif command == 'GOTO':
+            nextID = int(payload)
+            master.goto(nextID, graphID)
+            return 'Runner jumping to node {}.'.format(nextID)
+        elif command == 'CONFIGURE':
+            master.configure(json.loads(payload), graphID)
+            return 'Configuration accepted.'
+        elif command == 'STEP':
+            master.step(graphID)
+            return 'Runner is performing one step.'
+        elif command == 'RESUME':
+            if master.resume(graphID):
+                return 'Runner is resuming from checkpoint.'
+            return 'No checkpoint found.'
+        elif command == 'STATUS':
+            executionThread = master.getExecutionThread(graphID)
+            if executionThread.graph:
+                if not executionThread.graph.returnValue == -1:
+                    return json.dumps({'STATUS': 'RETURN', 'REPORT': (executionThread.graph.returnValue,
+                                                                      executionThread.graph.returningNode)},
+                                      separators=(',', ':'))
+            reportNode = payload.split('***')[-1]
+            report = ''
+            if reportNode:
+                report = master.getReport(int(reportNode), graphID)
+            status = master.getStatus(graphID)
+            return json.dumps({'STATUS': status, 'REPORT': report}, separators=(',', ':'))
+    except (ValueError, TypeError, KeyError) as e:
+        logger.error('Command {} failed: {}'.format(command, e))
+        return 'Command {} failed: {}'.format(command, e)
+    return 'Command \'{}\' not supported.'.format(command)
+
+
+def subscriptionRate(payload):
+    """
+    Returns the maximum event rate requested by the payload of a SUBSCRIBE command.
+    :param payload: JSON string of the form '{"rate": <messages per second>}'.
+    :return: float; 20 if the payload does not specify a rate.
+    """
+    try:
+        return float(json.loads(payload)['rate'])
+    except (ValueError, TypeError, KeyError):
+        return 20.
+
+
 class CommandProcessor(Thread):
+    """
+    Thread processing the commands of one client connected to the Listener.
+    The thread ends when the client closes the connection.
+    """
     def __init__(self, cSocket, Adress, master, listener):
         super(CommandProcessor, self).__init__()
         self.master = master
         self.cSocket = cSocket
+        self.address = Adress
         self.listener = listener
+        self.protocol = Protocol()
+        self.requestID = 0
         self.daemon = True
         self.start()
 
     def send(self, message):
-        msg = struct.pack('>I', len(message)) + message.encode('utf-8')
-        self.cSocket.sendall(msg)
+        # Answers are tagged with the ID of the request being processed.
+        self.protocol.send(self.cSocket, message, self.requestID)
 
     def run(self):
         while True:
-            # message = self.cSocket.recv(1024).decode()
-            message = self.receive()
-            if message:
-                # logger.debug('Received command: {}...'.format(message[:10]))
-                if message == 'KILL':
-                    # print('Killing myself')
-                    self.send('Runner is terminating.')
-                    self.listener.kill()
+            try:
+                message = self.receive()
+            except OSError:
+                message = None
+            if message is None:
+                break
+            command = parseCommand(message)
+            if command and command[0] == 'KILL' and command[1] is None:
+                self.send('Runner is terminating.')
+                self.listener.kill()
+                self.master.kill()
+                return
+            elif command and command[0] == 'SUBSCRIBE':
+                self.send('Subscribed.')
+                # The connection is used for pushing events from now on.
+                EventPublisher(self.cSocket, self.protocol, self.master, command[1], subscriptionRate(command[2]))
+                return
+            elif command and command[0] == 'PROTOCOL':
+                answer, version, codec = self.protocol.negotiate(command[2])
+                self.send(answer)
+                self.protocol.use(version, codec)
+            else:
+                self.send(handleCommand(self.master, message))
+        self.cSocket.close()
+        logger.info('Client {} disconnected.'.format(self.address))
+
+    def receive(self):
+        tagged = self.protocol.receiveTagged(self.cSocket)
+        if tagged is None:
+            return None
+        self.requestID, message = tagged
+        return message
+
+
+class EventBuffer(object):
+    """
+    Collects the execution events of a graph for a client that sent the SUBSCRIBE command.
+    Events are collected while the previous message is sent and coalesced into the next message. A message is a JSON
+    object with the keys
+        'started': IDs of nodes whose execution started,
+        'ran': (nodeID, time) pairs of executed nodes,
+        'running': IDs of all nodes running at the time the message was created
+    and, if the graph returned a value, 'return': the return value and the returning node.
+    """
+    def __init__(self, master, graphID, wake):
+        """
+        :param master: Runner instance.
+        :param graphID: ID of the graph publishing the events or None for the default graph.
+        :param wake: Callable called after an event was added. Must not block.
+        """
+        self.master = master
+        self.graphID = graphID
+        self.wake = wake
+        self.lock = Lock()
+        self.started = []
+        self.ran = []
+        self.returned = None
+
+    def put(self, event, *args):
+        """
+        Adds an event to the next message.
+        :param event: 'started' with a node ID, 'ran' with a node ID and a time or 'return' with the return value and
+        the returning node.
+        :return: None
+        """
+        with self.lock:
+            if event == 'started':
+                self.started.append(args[0])
+            elif event == 'ran':
+                self.ran.append(args)
+            else:
+                self.returned = args
+        self.wake()
+
+    def take(self):
+        """
+        Returns the message of all events collected since the last call.
+        :return: JSON string or None if no event was collected.
+        """
+        with self.lock:
+            if not (self.started or self.ran or self.returned):
+                return None
+            message = {'started': self.started, 'ran': self.ran}
+            if self.returned:
+                message['return'] = self.returned
+            self.started, self.ran, self.returned = [], [], None
+        executionThread = self.master.getExecutionThread(self.graphID)
+        graph = executionThread.graph if executionThread else None
+        message['running'] = list(graph.runningNodes) if graph else []
+        try:
+            return json.dumps(message, separators=(',', ':'))
+        except TypeError:
+            message['return'] = [str(value) for value in message['return']]
+            return json.dumps(message, separators=(',', ':'))
+
+
+class EventPublisher(Thread):
+    """
+    Thread pushing the execution events of a graph to a client of the Listener that sent the SUBSCRIBE command.
+    At most 'rate' messages per second are sent (see EventBuffer). The thread ends when the client closes the
+    connection.
+    """
+    def __init__(self, cSocket, protocol, master, graphID, rate=20.):
+        super(EventPublisher, self).__init__()
+        self.cSocket = cSocket
+        self.protocol = protocol
+        self.master = master
+        self.graphID = graphID
+        self.interval = 1. / rate if rate > 0 else 0.
+        self.condition = Condition()
+        self.events = EventBuffer(master, graphID, self.notify)
+        self.daemon = True
+        master.subscribe(graphID, self.events)
+        self.start()
+
+    def notify(self):
+        with self.condition:
+            self.condition.notify()
+
+    def disconnected(self):
+        """
+        Checks whether the client closed the connection. Subscribed clients do not send anything, so a readable
+        socket means that the connection was closed.
+        :return: bool
+        """
+        try:
+            readable, _, _ = select.select([self.cSocket], [], [], 0)
+            return bool(readable) and not self.cSocket.recv(1)
+        except OSError:
+            return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                data = self.events.take()
+                if data is None:
+                    self.condition.wait(1.)
+                    if self.disconnected():
+                        break
+                    continue
+            try:
+                self.protocol.send(self.cSocket, data)
+            except OSError:
+                break
+            time.sleep(self.interval)
+        self.master.unsubscribe(self.graphID, self.events)
+        self.cSocket.close()
+        logger.info('Event subscription of graph {} ended.'.format(self.graphID))
+
+
+class AsyncListener(Thread):
+    """
+    Interpreter server handling all client connections on a single asyncio event loop.
+    The server accepts the same commands as the Listener, but does not need a thread per client. This makes it
+    suitable for interpreters observed by many editors or monitors at the same time. Commands are executed on the
+    event loop in the order they are received.
+    """
+    def __init__(self, master):
+        Thread.__init__(self)
+        self.alive = True
+        self.master = master
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(self.startServer())
+        logger.info('Interpreter listening on {}:{}'.format(host, port))
+        self.daemon = True
+        self.start()
+
+    async def startServer(self):
+        return await asyncio.start_server(self.serve, host or None, port, reuse_address=True, backlog=128)
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def kill(self):
+        """
+        Stops accepting connections and closes all open connections. Thread safe.
+        :return: None
+        """
+        self.alive = False
+        self.loop.call_soon_threadsafe(self.stop)
+
+    def stop(self):
+        self.server.close()
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+        self.loop.call_soon(self.loop.stop)
+
+    async def serve(self, reader, writer):
+        """
+        Processes the commands of one client until the client closes the connection.
+        :param reader: asyncio.StreamReader of the connection.
+        :param writer: asyncio.StreamWriter of the connection.
+        :return: None
+        """
+        address = writer.get_extra_info('peername')
+        logger.info('Client Connection from {} accepted'.format(address))
+        protocol = Protocol()
+        subscription = None
+        try:
+            while True:
+                tagged = await protocol.receiveAsync(reader)
+                if tagged is None:
+                    break
+                if subscription:
+                    # Subscribed clients do not send commands. Only the end of the connection is of interest.
+                    continue
+                requestID, message = tagged
+                command = parseCommand(message)
+                if command and command[0] == 'KILL' and command[1] is None:
+                    writer.write(protocol.encode('Runner is terminating.', requestID))
+                    await writer.drain()
                     self.master.kill()
+                    self.kill()
                     return
-                elif message == 'READY?':
-                    self.send('READY')
-                elif message == 'PAUSE':
-                    self.send('Runner is pausing.')
-                    self.master.pause()
-                elif message == 'UNPAUSE':
-                    self.send('Runner is unpausing.')
-                    self.master.unpause()
-                elif message.startswith('UPDATE'):
-                    self.send('Runner is updating.')
-                    self.master.updateGraph(message[6:])
-                elif message.startswith('PUSH'):
-                    self.send('Accepted pushed Graph. Runner is updating.')
-                    self.master.loadGraph(message[4:])
-                elif message.startswith('DROP'):
-                    self.send('Runner is dropping current graph.')
-                    self.master.drop()
-                elif message.startswith('GOTO'):
-                    nextID = int(message[4:])
-                    self.send('Runner jumping to node {}.'.format(nextID))
-                    self.master.goto(nextID)
-                elif message.startswith('CONFIGURE'):
-                    msg = message[9:]
-                    self.send('Configuration accepted.')
-                    self.master.configure(json.loads(msg))
-                elif message == 'STEP':
-                    self.send('Runner is performing one step.')
-                    self.master.step()
-                elif message.startswith('STATUS'):
-                    if self.master.executionThread.graph:
-                        if not self.master.executionThread.graph.returnValue == -1:
-
-                            self.send(json.dumps({'STATUS': 'RETURN', 'REPORT': (self.master.executionThread.graph.returnValue, self.master.executionThread.graph.returningNode)}))
-                            continue
-                    reportNode = message.split('***')[-1]
-                    report = ''
-                    if reportNode:
-                        report = self.master.getReport(int(reportNode))
-                    status = self.master.getStatus()
-                    self.send(json.dumps({'STATUS': status, 'REPORT': report}))
+                elif command and command[0] == 'SUBSCRIBE':
+                    writer.write(protocol.encode('Subscribed.', requestID))
+                    subscription = self.loop.create_task(self.publish(writer, protocol, command[1],
+                                                                      subscriptionRate(command[2])))
+                elif command and command[0] == 'PROTOCOL':
+                    answer, version, codec = protocol.negotiate(command[2])
+                    writer.write(protocol.encode(answer, requestID))
+                    protocol.use(version, codec)
                 else:
-                    self.send('Command \'{}...\' not understood.'.format(message[:50]))
-
-    def recvall(self, sock, n,):
-        # Helper function to recv n bytes or return None if EOF is hit
-        data = b''
-        while len(data) < n:
-            packet = sock.recv(n - len(data))
-            if not packet:
-                return False
-            data += packet
-        return data
+                    writer.write(protocol.encode(handleCommand(self.master, message), requestID))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if subscription:
+                subscription.cancel()
+            writer.close()
+            logger.info('Client {} disconnected.'.format(address))
 
-    def receive(self):
-        data = None
-        raw_msglen = self.recvall(self.cSocket, 4)
-        if not raw_msglen:
-            return None
-        msglen = struct.unpack('>I', raw_msglen)[0]
-        # Read the message data
+    async def publish(self, writer, protocol, graphID, rate):
+        """
+        Pushes the execution events of a graph to a subscribed client. At most 'rate' messages per second are sent.
+        :param writer: asyncio.StreamWriter of the connection.
+        :param protocol: Protocol instance negotiated for the connection.
+        :param graphID: ID of the graph or None for the default graph.
+        :param rate: Maximum number of messages per second.
+        :return: None
+        """
+        ready = asyncio.Event()
+        interval = 1. / rate if rate > 0 else 0.
+
+        def wake():
+            # Called by the threads executing the graph.
+            try:
+                self.loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                pass
+
+        events = EventBuffer(self.master, graphID, wake)
+        self.master.subscribe(graphID, events)
         try:
-            data = self.recvall(self.cSocket, msglen).decode('utf-8')
-        except AttributeError:
-            print('[ERROR] No data received.')
-        return data
+            while True:
+                try:
+                    await asyncio.wait_for(ready.wait(), 1.)
+                except asyncio.TimeoutError:
+                    continue
+                ready.clear()
+                data = events.take()
+                if data is None:
+                    continue
+                writer.write(protocol.encode(data))
+                await writer.drain()
+                await asyncio.sleep(interval)
+        except ConnectionError:
+            pass
+        finally:
+            self.master.unsubscribe(graphID, events)
+            logger.info('Event subscription of graph {} ended.'.format(graphID))
 
 
 class RGIConnection(Thread):
+    """
+    Editor side connection to a graph interpreter.
+    Requests are queued by 'send' and written to the socket by this thread without waiting for the answers to
+    previous requests. A separate reader thread receives the answers and resolves the Future returned by 'send'.
+    If the interpreter supports the tagged protocol (see floppy.protocol), answers are matched to requests by their
+    request ID. Otherwise the interpreter answers in the order of the requests and answers are matched first in, first
+    out.
+    """
     def __init__(self, verbose=True):
         super(RGIConnection, self).__init__()
         self.daemon = True
-        self.cmdQueue = []
+        self.cmdQueue = Queue()
+        self.pending = OrderedDict()
+        self.pendingLock = Lock()
+        self.requestIDs = count()
         self.socket = None
         self.host = None
         self.port = None
+        self.protocol = Protocol()
         self.alive = True
         self.start()
-        
+
     def run(self):
-        super(RGIConnection, self).run()
         while self.alive:
+            cmd = self.cmdQueue.get()
+            if cmd is None:
+                continue
+            message, future = cmd
+            # IDs are 4-byte integers. 0 is reserved for messages that do not answer a request.
+            requestID = next(self.requestIDs) % 0xFFFFFFFF + 1
+            with self.pendingLock:
+                pending = self.pending
+                sock, protocol = self.socket, self.protocol
+                # Register the request before sending it. The answer may arrive before 'sendall' returns.
+                pending[requestID] = future
             try:
-                cmd = self.cmdQueue.pop(0)
-            except IndexError:
-                time.sleep(.1)
-            else:
-                answer = self._send(cmd[0])
-                cmd[1](answer)
+                protocol.send(sock, message, requestID)
+            except (OSError, AttributeError) as e:
+                with self.pendingLock:
+                    pending.pop(requestID, None)
+                future.set_exception(ConnectionError(str(e)))
+
+    def read(self, sock, protocol, pending):
+        """
+        Receives the answers of a connection and resolves the Futures of the corresponding requests.
+        Runs in its own thread for every connection.
+        :param sock: Connected socket.
+        :param protocol: Protocol instance negotiated for the socket.
+        :param pending: Dictionary mapping the IDs of requests sent over the socket to their Futures.
+        :return: None
+        """
+        while True:
+            try:
+                tagged = protocol.receiveTagged(sock)
+            except OSError:
+                tagged = None
+            if tagged is None:
+                break
+            requestID, answer = tagged
+            with self.pendingLock:
+                if protocol.tagged:
+                    future = pending.pop(requestID, None)
+                else:
+                    future = pending.popitem(last=False)[1] if pending else None
+            if future is None:
+                logger.warning('Received answer to unknown request {}.'.format(requestID))
+                continue
+            future.set_result(answer)
+        with self.pendingLock:
+            futures = list(pending.values())
+            pending.clear()
+        for future in futures:
+            future.set_exception(ConnectionError('Connection to {}:{} closed.'.format(self.host, self.port)))
 
     def connect(self, host, port, validate=True):
         self.host = host
         self.port = port
-        self.socket = socket(AF_INET, SOCK_STREAM)
-        self.socket.settimeout(5.)
-        self.socket.connect((host, port))
+        clientSocket = socket(AF_INET, SOCK_STREAM)
+        clientSocket.settimeout(5.)
+        clientSocket.connect((host, port))
+        protocol = self.negotiate(clientSocket)
+        # The reader thread waits for answers for as long as the connection is open.
+        clientSocket.settimeout(None)
+        pending = OrderedDict()
+        with self.pendingLock:
+            self.socket, self.protocol, self.pending = clientSocket, protocol, pending
+        reader = Thread(target=self.read, args=(clientSocket, protocol, pending))
+        reader.daemon = True
+        reader.start()
         if validate:
             self.send('READY?', print)
 
+    @staticmethod
+    def negotiate(clientSocket):
+        """
+        Negotiates the framing of all further messages with the interpreter (see floppy.protocol).
+        :param clientSocket: Socket connected to the interpreter.
+        :return: Protocol instance. Uses the text protocol if the interpreter does not support negotiation.
+        """
+        protocol = Protocol()
+        protocol.send(clientSocket, protocol.offer())
+        protocol.agree(protocol.receive(clientSocket))
+        return protocol
+
     def disconnect(self):
+        try:
+            self.socket.shutdown(SHUT_RDWR)
+        except OSError:
+            pass
         self.socket.close()
 
     def reconnect(self):
         self.disconnect()
         time.sleep(.5)
-        self.socket.connect((self.host, self.port))
-
-    def send(self, message, target):
-        self.cmdQueue.append((message, target))
+        self.connect(self.host, self.port, validate=False)
 
-    def _send(self, message):
-        # print('[REQUEST] ' + message)
-        msg = struct.pack('>I', len(message)) + message.encode('utf-8')
-        self.socket.sendall(msg)
-        try:
-            answer = '[ANSWER]  '+self._receive()
-        except TypeError:
-            answer = ''
-        return answer
+    def send(self, message, target=None):
+        """
+        Queues a request.
+        :param message: Command to send.
+        :param target: Optional callable. Called with the answer prefixed with '[ANSWER]  ' once the answer arrived,
+        or with an empty string if the connection was closed before.
+        :return: concurrent.futures.Future resolving to the answer.
+        """
+        future = Future()
+        if target:
+            future.add_done_callback(lambda f: target('' if f.exception() else '[ANSWER]  ' + f.result()))
+        self.cmdQueue.put((message, future))
+        return future
 
-    def _recvall(self, sock, n,):
+    def request(self, message, timeout=None):
         """
-        Helper function to recv n bytes or return None if EOF is hit
-        :param sock:
-        :param n:
-        :return:
+        Sends a request and waits for the answer.
+        :param message: Command to send.
+        :param timeout: Seconds to wait. Waits forever if None.
+        :return: Answer string.
+        :raises: ConnectionError if the connection was closed before the answer arrived.
         """
-        data = b''
-        while len(data) < n:
-            packet = sock.recv(n - len(data))
-            if not packet:
-                return False
-            data += packet
-        return data
+        return self.send(message).result(timeout)
 
-    def _receive(self):
-        data = None
-        raw_msglen = self._recvall(self.socket, 4)
-        if not raw_msglen:
-            return None
-        msglen = struct.unpack('>I', raw_msglen)[0]
-        # Read the message data
-        try:
-            data = self._recvall(self.socket, msglen).decode('utf-8')
-        except AttributeError:
-            print('[ERROR] No data received.')
-        return data
+    def kill(self):
+        self.alive = False
+        self.cmdQueue.put(None)
 
 
 def terminate(clientSocket):
@@ -564,11 +1522,15 @@ def sendCommand(cmd, host, port):
     clientSocket.close()
 
 
-def spawnRunner(listenPort):
-    global port
-    port = listenPort
+def loadCustomNodes():
+    """
+    Imports all modules in the 'CustomNodes' directory to make the node classes defined there available.
+    :return: None
+    """
     import os
     from importlib.machinery import SourceFileLoader
+    # Custom nodes import floppy.node which can only be imported after floppy.graph.
+    import floppy.graph
     customNodesPath = os.path.join(os.path.realpath(__file__)[:-10], 'CustomNodes')
     for i, path in enumerate(os.listdir(customNodesPath)):
         if path.endswith('py'):
@@ -576,7 +1538,13 @@ def spawnRunner(listenPort):
                 SourceFileLoader(str(i), os.path.join(customNodesPath, path)).load_module()
             except Exception as e:
                 print('Warning: error in custom node:\n{}'.format(str(e)))
-    r = Runner()
+
+
+def spawnRunner(listenPort, asyncServer=True):
+    global port
+    port = listenPort
+    loadCustomNodes()
+    r = Runner(asyncServer=asyncServer)
     print('Remote Graph Interpreter Initialized.'
           'Listening on port {}'.format(port))
     r.join()
@@ -0,0 +1,113 @@
+"""
+Module implementing the transport of large values between the graph interpreter and its worker processes.
+Output values of nodes executed by a worker process (see graph.runInProcess) whose pickled size exceeds THRESHOLD are
+written to a shared memory block. Only a small SharedValue handle naming the block is sent back to the interpreter and
+passed on to the inputs of connected nodes. Nodes read the value from the block when they access the input.
+The interpreter owns the blocks it received from its worker processes. All outputs and inputs holding a value share
+the interpreter's handle object. The block is freed when this handle is garbage collected, i.e. after the last output
+or input referring to it was reset or deleted. Worker processes never free blocks.
+"""
+
+import pickle
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock
+
+THRESHOLD = 1 << 20
+
+
+class SharedValue(object):
+    """
+    Handle of a pickled value stored in a shared memory block.
+    Pickling a handle only transfers the block's name. The unpickled copy does not own the block.
+    """
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.lock = Lock()
+        self.value = None
+        self.loaded = False
+        self.finalizer = None
+
+    @classmethod
+    def create(cls, data):
+        """
+        Copies pickled data into a new shared memory block.
+        :param data: bytes object.
+        :return: SharedValue instance.
+        """
+        block = SharedMemory(create=True, size=len(data))
+        block.buf[:len(data)] = data
+        block.close()
+        return cls(block.name, len(data))
+
+    def load(self):
+        """
+        Returns the value stored in the block. The value is unpickled once per process and handle.
+        :return: Stored object.
+        """
+        with self.lock:
+            if not self.loaded:
+                block = SharedMemory(self.name)
+                try:
+                    with block.buf[:self.size] as data:
+                        self.value = pickle.loads(data)
+                finally:
+                    block.close()
+                self.loaded = True
+            return self.value
+
+    def adopt(self):
+        """
+        Makes the current process the owner of the block. The block is freed when this handle is garbage collected or
+        the process terminates. Only the process that keeps the handle for as long as the value is used, i.e. the
+        graph interpreter, may adopt it, and only once.
+        :return: None
+        """
+        if self.finalizer is None:
+            self.finalizer = weakref.finalize(self, unlinkBlock, self.name)
+
+    def __getstate__(self):
+        return {'name': self.name, 'size': self.size}
+
+    def __setstate__(self, state):
+        self.__init__(state['name'], state['size'])
+
+    def __str__(self):
+        return 'SharedValue({} bytes)'.format(self.size)
+
+
+def unlinkBlock(name):
+    try:
+        block = SharedMemory(name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def share(value, threshold=THRESHOLD):
+    """
+    Moves a value to shared memory if its pickled size exceeds a threshold.
+    :param value: Any object.
+    :param threshold: int; minimum size in bytes.
+    :return: SharedValue instance or the unmodified value if it is small or cannot be pickled.
+    """
+    try:
+        data = pickle.dumps(value, protocol=4)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return value
+    if len(data) < threshold:
+        return value
+    return SharedValue.create(data)
+
+
+def resolve(value):
+    """
+    Returns the value a SharedValue handle refers to. Any other object is returned unmodified.
+    :param value: Any object.
+    :return: Object.
+    """
+    if isinstance(value, SharedValue):
+        return value.load()
+    return value
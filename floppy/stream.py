@@ -0,0 +1,145 @@
+"""
+Module implementing streaming connections between nodes.
+A producer node sets a StreamBuffer instance to its output instead of a complete value. The records of the stream are
+put into the buffer by a StreamProducer thread while a consumer node (e.g. ForEachInStream) takes them out one at a
+time. The buffer holds a limited number of records. If it is full, the producer waits until the consumer took a record
+out of it. Only a bounded part of the data is therefore kept in memory, no matter how large the stream is.
+Every record is taken out of the buffer exactly once. A stream output can therefore only be connected to a single
+input (see Graph.connect).
+"""
+
+from queue import Queue, Empty, Full
+from threading import Thread
+
+# Seconds after which a producer waiting for space in a full buffer checks whether the stream was cancelled.
+CANCELCHECKINTERVAL = .05
+
+
+class StreamClosed(object):
+    """
+    Marker put into a StreamBuffer after its last record.
+    """
+    def __init__(self, error=None):
+        self.error = error
+
+
+class StreamBuffer(object):
+    """
+    Bounded first-in-first-out buffer between the producer and the consumer of a stream.
+    Iterating over the buffer yields the records in the order they were put into it and blocks until the next record
+    is available. The iteration ends when the producer closed the buffer. An exception raised by the producer is
+    re-raised in the consumer.
+    """
+    def __init__(self, size=64):
+        self.queue = Queue(max(1, int(size)))
+        self.closed = False
+        self.cancelled = False
+        self.count = 0
+
+    def put(self, record):
+        """
+        Appends a record to the stream. Blocks while the buffer is full. Records put into a cancelled stream are
+        dropped. A producer waiting for space returns when the stream is cancelled.
+        :param record: Any object.
+        :return: None
+        """
+        while not self.cancelled:
+            try:
+                self.queue.put(record, timeout=CANCELCHECKINTERVAL)
+            except Full:
+                continue
+            return
+
+    def cancel(self):
+        """
+        Ends the stream before all records were consumed. Buffered records are discarded and the producer stops
+        reading, which closes the stream's source (see StreamProducer).
+        :return: None
+        """
+        self.cancelled = True
+        self.closed = True
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Empty:
+                break
+        try:
+            # Wakes up a consumer waiting for the next record.
+            self.queue.put_nowait(StreamClosed())
+        except Full:
+            pass
+
+    def close(self, error=None):
+        """
+        Marks the end of the stream.
+        :param error: Exception instance re-raised in the consumer or None if the stream ended regularly.
+        :return: None
+        """
+        self.put(StreamClosed(error))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        record = self.queue.get()
+        if isinstance(record, StreamClosed):
+            self.closed = True
+            if record.error:
+                raise record.error
+            raise StopIteration
+        self.count += 1
+        return record
+
+    def __len__(self):
+        return self.queue.qsize()
+
+
+def readChunks(fp, linesPerChunk=1):
+    """
+    Generator reading a text file in chunks of lines. The file is closed when the generator is exhausted.
+    :param fp: File object opened in text mode.
+    :param linesPerChunk: int; number of lines per chunk.
+    :return: Generator of strings containing up to 'linesPerChunk' lines without the trailing line break.
+    """
+    linesPerChunk = max(1, int(linesPerChunk))
+    with fp:
+        chunk = []
+        for line in fp:
+            chunk.append(line.rstrip('\r\n'))
+            if len(chunk) == linesPerChunk:
+                yield '\n'.join(chunk)
+                chunk = []
+        if chunk:
+            yield '\n'.join(chunk)
+
+
+class StreamProducer(Thread):
+    """
+    Thread putting all records of an iterable into a StreamBuffer and closing the buffer afterwards.
+    The thread stops early if the buffer is cancelled. Generators are closed in either case, so that a file read by
+    'readChunks' is closed as well.
+    """
+    def __init__(self, buffer, records):
+        super(StreamProducer, self).__init__()
+        self.daemon = True
+        self.buffer = buffer
+        self.records = records
+        self.start()
+
+    def run(self):
+        try:
+            for record in self.records:
+                if self.buffer.cancelled:
+                    break
+                self.buffer.put(record)
+        except Exception as e:
+            self.buffer.close(e)
+        else:
+            if not self.buffer.cancelled:
+                self.buffer.close()
+        finally:
+            close = getattr(self.records, 'close', None)
+            if close:
+                close()
@@ -0,0 +1,111 @@
+import os
+import pickle
+
+import floppy.graph
+from floppy.graph import Graph
+from floppy.CustomNodes.mathNodes import Add
+from floppy.cache import NodeCache, getDigest
+
+
+class Plain(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class Cacheable(Plain):
+    cacheable = True
+
+
+def raisesTypeError(value):
+    try:
+        getDigest(value)
+    except TypeError:
+        return True
+    return False
+
+
+def makeNode(f1, f2):
+    node = Graph().spawnNode(Add)
+    node.inputs['F1'].set(f1)
+    node.inputs['F2'].set(f2)
+    return node
+
+
+def testKeysIgnoreInsertionOrder():
+    assert getDigest({'a': 1, 'b': [1, 2]}) == getDigest({'b': [1, 2], 'a': 1})
+    assert getDigest({3, 1, 2}) == getDigest({2, 3, 1})
+    assert getDigest(frozenset('abc')) == getDigest(frozenset('cba'))
+    assert getDigest({'x': {1, 2}, 'y': {'z': None}}) == getDigest({'y': {'z': None}, 'x': {2, 1}})
+    assert not getDigest([1, 2]) == getDigest([2, 1])
+
+
+def testKeysAreTagged():
+    digests = [getDigest(value) for value in (1, 1.0, '1', True, b'1', None, 0, False, '', [1], (1,), {1}, 1j)]
+    assert len(set(digests)) == len(digests)
+    assert not getDigest(['ab', 'c']) == getDigest(['a', 'bc'])
+    assert not getDigest({'a': 1}) == getDigest({('a', 1)})
+
+
+def testOnlyCacheableObjectsAreHashed():
+    assert raisesTypeError(Plain(1))
+    assert raisesTypeError(open)
+    assert raisesTypeError([1, Plain(1)])
+    assert not raisesTypeError(Cacheable(1))
+    assert getDigest(Cacheable({'a': 1, 'b': 2})) == getDigest(Cacheable({'b': 2, 'a': 1}))
+    assert not getDigest(Cacheable(1)) == getDigest(Cacheable(2))
+    assert not getDigest(Cacheable(1)) == getDigest((__name__, 'Cacheable', {'value': 1}))
+
+
+def testNodeKeys():
+    assert NodeCache.getKey(makeNode(1.0, 2.0)) == NodeCache.getKey(makeNode(1.0, 2.0))
+    assert not NodeCache.getKey(makeNode(1.0, 2.0)) == NodeCache.getKey(makeNode(2.0, 1.0))
+    assert not NodeCache.getKey(makeNode(1.0, 2.0)) == NodeCache.getKey(makeNode(1, 2))
+    assert NodeCache.getKey(makeNode(1.0, Plain(2.0))) is None
+
+
+def testEvictionIsLeastRecentlyUsedByBytes():
+    cache = NodeCache(maxBytes=30)
+    for key in 'abc':
+        with cache.lock:
+            cache.add(key, key.encode() * 10)
+    assert list(cache.entries.keys()) == ['a', 'b', 'c'] and cache.usedBytes == 30
+    assert cache.lookup('a') == b'a' * 10
+    with cache.lock:
+        cache.add('d', b'd' * 15)
+    assert list(cache.entries.keys()) == ['a', 'd'] and cache.usedBytes == 25
+    with cache.lock:
+        cache.add('e', b'e' * 31)
+    assert 'e' not in cache.entries
+    assert cache.lookup('b') is None
+    cache.setMaxBytes(20)
+    assert list(cache.entries.keys()) == ['d'] and cache.usedBytes == 15
+    assert cache.getStatus() == {'hits': 1, 'misses': 1, 'entries': 1, 'bytes': 15}
+
+
+def testStoreAndRestore():
+    cache = NodeCache(maxBytes=1 << 20)
+    node = makeNode(1.0, 2.0)
+    key = NodeCache.getKey(node)
+    node.outputs['Sum'](3.0)
+    cache.store(node, key)
+    other = makeNode(1.0, 2.0)
+    assert cache.restore(other, key)
+    assert other.outputs['Sum'].value == 3.0
+    assert not cache.restore(other, getDigest('unknown'))
+
+
+def testDiskRoundTrip(tmp_path):
+    node = makeNode(1.0, 2.0)
+    key = NodeCache.getKey(node)
+    node.outputs['Sum'](3.0)
+    NodeCache(directory=str(tmp_path)).store(node, key)
+    path = os.path.join(str(tmp_path), 'nodeCache', key[:2], key + '.pickle')
+    with open(path, 'rb') as fp:
+        assert pickle.loads(fp.read()) == {'Sum': 3.0}
+    assert [name for name in os.listdir(os.path.dirname(path)) if name.endswith('.tmp')] == []
+    cache = NodeCache(directory=str(tmp_path))
+    assert cache.isEnabled() and not cache.entries
+    other = makeNode(1.0, 2.0)
+    assert cache.restore(other, key)
+    assert other.outputs['Sum'].value == 3.0
+    assert cache.getStatus()['hits'] == 1
@@ -0,0 +1,127 @@
+import json
+
+import floppy.graph
+from floppy.changeLog import ChangeLog, applyChanges
+from floppy.runner import Runner, handleCommand
+
+
+def makeNode(inputs=(), outputs=()):
+    return {'class': 'TestNode',
+            'position': (0, 0),
+            'inputs': [(name, 'int', 0, 0) for name in inputs],
+            'inputConnections': {},
+            'outputs': [(name, 'int', 0, 0) for name in outputs],
+            'outputConnections': {name: [] for name in outputs},
+            'subgraph': 'main'}
+
+
+def makeGraph():
+    """
+    Returns the json representation of a graph in which the output 'Out' of node 1 is connected to the input 'In' of
+    node 2.
+    """
+    source = makeNode(outputs=('Out',))
+    sink = makeNode(inputs=('In', 'Other'), outputs=('Out',))
+    source['outputConnections']['Out'] = ['2:IIn']
+    sink['inputConnections']['In'] = '1:OOut'
+    return [(1, source), (2, sink)]
+
+
+def testSpawn():
+    data = dict(applyChanges(makeGraph(), [['spawn', 3, makeNode(inputs=('In',))]]))
+    assert sorted(data.keys()) == [1, 2, 3]
+    assert data[3]['inputs'] == [('In', 'int', 0, 0)]
+
+
+def testDeleteRemovesConnections():
+    data = dict(applyChanges(makeGraph(), [['delete', 2]]))
+    assert list(data.keys()) == [1]
+    assert data[1]['outputConnections'] == {'Out': []}
+    data = dict(applyChanges(makeGraph(), [['delete', 1]]))
+    assert list(data.keys()) == [2]
+    assert data[2]['inputConnections'] == {}
+
+
+def testConnectReplacesInputConnection():
+    changes = [['spawn', 3, makeNode(outputs=('Out',))], ['connect', 3, 'Out', 2, 'In']]
+    data = dict(applyChanges(makeGraph(), changes))
+    assert data[2]['inputConnections'] == {'In': '3:OOut'}
+    assert data[3]['outputConnections'] == {'Out': ['2:IIn']}
+    assert data[1]['outputConnections'] == {'Out': []}
+
+
+def testConnectControlInputKeepsConnections():
+    changes = [['spawn', 3, makeNode(inputs=('Control',))],
+               ['connect', 1, 'Out', 3, 'Control'],
+               ['connect', 2, 'Out', 3, 'Control']]
+    data = dict(applyChanges(makeGraph(), changes))
+    assert data[1]['outputConnections'] == {'Out': ['2:IIn', '3:IControl']}
+    assert data[2]['outputConnections'] == {'Out': ['3:IControl']}
+
+
+def testDisconnect():
+    data = dict(applyChanges(makeGraph(), [['disconnect', '2:IIn']]))
+    assert data[2]['inputConnections'] == {}
+    assert data[1]['outputConnections'] == {'Out': []}
+    data = dict(applyChanges(makeGraph(), [['disconnect', '1:OOut']]))
+    assert data[2]['inputConnections'] == {}
+    assert data[1]['outputConnections'] == {'Out': []}
+
+
+def testDefault():
+    data = dict(applyChanges(makeGraph(), [['default', 2, 'Other', 5]]))
+    assert data[2]['inputs'] == [('In', 'int', 0, 0), ['Other', 'int', 0, 5]]
+
+
+def testInvalidChanges():
+    for changes in ([['default', 2, 'Missing', 5]], [['delete', 7]], [['rename', 1, 'Source']]):
+        try:
+            applyChanges(makeGraph(), changes)
+        except (KeyError, ValueError):
+            pass
+        else:
+            assert False, changes
+
+
+def testApplyChangesDoesNotModifyData():
+    data = makeGraph()
+    original = json.dumps(data)
+    applyChanges(data, [['delete', 1], ['default', 2, 'Other', 5]])
+    assert json.dumps(data) == original
+
+
+def testChangeLog():
+    log = ChangeLog()
+    log.record('delete', 1)
+    assert not log.isSynced() and log.changes == []
+    assert log.markSynced() == 0
+    log.record('delete', 1)
+    log.record('default', 2, 'Other', 5)
+    patch = json.loads(json.dumps(log.takePatch()))
+    assert patch == {'base': 0, 'version': 2, 'changes': [['delete', 1], ['default', 2, 'Other', 5]]}
+    assert log.takePatch() == {'base': 2, 'version': 2, 'changes': []}
+    data = dict(applyChanges(makeGraph(), patch['changes']))
+    assert list(data.keys()) == [2]
+
+
+def testUnsendableChangeInvalidatesLog():
+    log = ChangeLog()
+    log.markSynced()
+    log.record('default', 2, 'Other', object())
+    assert not log.isSynced()
+
+
+def testStalePatchIsAnsweredWithResync():
+    runner = Runner(listen=False)
+    try:
+        patch = {'base': 2, 'version': 3, 'changes': [['delete', 1]]}
+        assert handleCommand(runner, 'PATCH job ' + json.dumps(patch)) == 'RESYNC'
+        handleCommand(runner, 'PUSH job ' + json.dumps({'graph': [], 'version': 1}))
+        assert handleCommand(runner, 'PATCH job ' + json.dumps(patch)) == 'RESYNC'
+        patch['base'] = 1
+        assert handleCommand(runner, 'PATCH job ' + json.dumps(patch)) == 'Runner is patching.'
+        assert runner.getExecutionThread('job').graphVersion == 3
+        patch['base'], patch['version'] = 1, 4
+        assert handleCommand(runner, 'PATCH job ' + json.dumps(patch)) == 'RESYNC'
+    finally:
+        runner.kill()
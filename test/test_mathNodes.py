@@ -0,0 +1,68 @@
+import pytest
+
+import floppy.graph
+from floppy.graph import Graph
+from floppy.CustomNodes.mathNodes import (Add, CrossProduct, CrossProductArray, Distance, DotProduct, DotProductArray,
+                                          Normalize, NormalizeArray, RotateAbout, RotateArrayAbout, ArrayToVectors,
+                                          VectorsToArray)
+
+np = pytest.importorskip('numpy')
+
+VECTORS1 = [[1., 2., 3.], [-.5, 0., 4.], [0., 0., -2.], [3.5, -1., .25]]
+VECTORS2 = [[4., 5., 6.], [1., 1., 1.], [2., 0., 0.], [-7., .5, 1.]]
+
+
+def runNode(nodeClass, **inputs):
+    node = Graph().spawnNode(nodeClass)
+    for name, value in inputs.items():
+        node.inputs[name].set(value)
+    node.run()
+    return {name: out.value for name, out in node.outputs.items()}
+
+
+def testCrossProductArray():
+    result = runNode(CrossProductArray, Array1=np.array(VECTORS1), Array2=np.array(VECTORS2))['XProducts']
+    expected = [runNode(CrossProduct, Vector1=v1, Vector2=v2)['XProduct'] for v1, v2 in zip(VECTORS1, VECTORS2)]
+    assert np.allclose(result, expected)
+
+
+def testDotProductArray():
+    result = runNode(DotProductArray, Array1=np.array(VECTORS1), Array2=np.array(VECTORS2))['DotProducts']
+    expected = [runNode(DotProduct, Vector1=v1, Vector2=v2)['DotProduct'] for v1, v2 in zip(VECTORS1, VECTORS2)]
+    assert np.allclose(result, expected)
+
+
+def testNormalizeArray():
+    result = runNode(NormalizeArray, Array=np.array(VECTORS1))['NArray']
+    expected = [runNode(Normalize, Vector=v)['NVector'] for v in VECTORS1]
+    assert np.allclose(result, expected)
+
+
+def testNormalizeArrayRaisesForZeroRows():
+    with pytest.raises(ZeroDivisionError):
+        runNode(Normalize, Vector=[0., 0., 0.])
+    with pytest.raises(ZeroDivisionError, match=r'rows \[1\]'):
+        runNode(NormalizeArray, Array=np.array([[1., 0., 0.], [0., 0., 0.]]))
+
+
+def testRotateArrayAbout():
+    axis = {'PointOnAxis': [0., 0., 1.], 'AxisDirection': [0., 1., 1.], 'Degree': 30.}
+    result = runNode(RotateArrayAbout, Points=np.array(VECTORS1), **axis)['RotatedPoints']
+    expected = [runNode(RotateAbout, Point=v, **axis)['RotatedPoint'] for v in VECTORS1]
+    assert np.allclose(result, expected)
+
+
+def testArrayConversion():
+    array = runNode(VectorsToArray, Vectors=VECTORS1)['Array']
+    assert array.shape == (4, 3)
+    assert runNode(ArrayToVectors, Array=array)['Vectors'] == VECTORS1
+
+
+def testRunBatch():
+    batch = [{'F1': 1., 'F2': 2.}, {'F1': -3., 'F2': .5}]
+    node = Graph().spawnNode(Add)
+    assert node.runBatch(batch) == [runNode(Add, **inputs) for inputs in batch]
+    batch = [{'Position1': v1, 'Position2': v2} for v1, v2 in zip(VECTORS1, VECTORS2)]
+    node = Graph().spawnNode(Distance)
+    result = [outputs['Distance'] for outputs in node.runBatch(batch)]
+    assert np.allclose(result, [runNode(Distance, **inputs)['Distance'] for inputs in batch])
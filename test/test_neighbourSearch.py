@@ -0,0 +1,64 @@
+import itertools
+
+import pytest
+
+import floppy.graph
+from floppy.neighbourSearch import getPairsWithinCutoff
+
+np = pytest.importorskip('numpy')
+
+
+def getPairsBruteForce(points, cutoff):
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    pairs, distances = [], []
+    for i, j in itertools.combinations(range(len(points)), 2):
+        d = np.linalg.norm(points[i] - points[j])
+        if d <= cutoff:
+            pairs.append((i, j))
+            distances.append(d)
+    return pairs, distances
+
+
+def checkPairs(points, cutoff):
+    pairs, distances = getPairsWithinCutoff(points, cutoff)
+    expectedPairs, expectedDistances = getPairsBruteForce(points, cutoff)
+    assert pairs.shape == (len(expectedPairs), 2)
+    assert [tuple(pair) for pair in pairs.tolist()] == expectedPairs
+    assert np.allclose(distances, expectedDistances)
+
+
+def testRandomPoints():
+    random = np.random.RandomState(42)
+    for n, scale, cutoff in ((50, 1., .3), (300, 10., 1.5), (200, 100., 2.), (100, 1., 5.), (80, 3., .01)):
+        checkPairs(random.uniform(-scale, scale, (n, 3)), cutoff)
+
+
+def testClusteredPoints():
+    random = np.random.RandomState(7)
+    centers = random.uniform(-20, 20, (5, 3))
+    points = np.concatenate([center + random.normal(0, .5, (40, 3)) for center in centers])
+    checkPairs(points, 1.)
+
+
+def testLatticePoints():
+    # Neighbours on a lattice with a spacing equal to the cutoff lie exactly on cell boundaries.
+    lattice = np.array(list(itertools.product(range(5), repeat=3)), dtype=float)
+    for spacing in (1., .1, .3, 1.7):
+        checkPairs(lattice * spacing, spacing)
+        checkPairs(lattice * spacing + 1e3, spacing)
+
+
+def testDegeneratePoints():
+    checkPairs(np.zeros((10, 3)), 1.)
+    checkPairs([[1., 2., 3.]] * 3 + [[1., 2., 4.]], 1.)
+    checkPairs([[float(i), 0., 0.] for i in range(20)], 1.)
+    checkPairs([[0., 0., float(i)] for i in range(20)], .5)
+    checkPairs([[-1., -1., -1.], [1., 1., 1.]], 10.)
+
+
+def testEmptyResults():
+    for points, cutoff in (([], 1.), ([[1., 2., 3.]], 1.), ([[0., 0., 0.], [1., 0., 0.]], 0.),
+                           ([[0., 0., 0.], [0., 0., 0.]], -1.), ([[0., 0., 0.], [2., 0., 0.]], 1.)):
+        pairs, distances = getPairsWithinCutoff(points, cutoff)
+        assert pairs.shape == (0, 2)
+        assert distances.shape == (0,)
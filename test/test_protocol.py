@@ -0,0 +1,128 @@
+import json
+import struct
+import zlib
+from socket import socketpair
+
+import floppy.graph
+from floppy.protocol import Protocol, ProtocolError, CODECS, COMPRESSIONTHRESHOLD, PROTOCOLVERSION
+
+
+def connect(offer):
+    """
+    Negotiates a protocol between a client and an interpreter.
+    :param offer: JSON string sent by the client.
+    :return: Tuple of the client's and the interpreter's Protocol instances.
+    """
+    client, server = Protocol(), Protocol()
+    answer, version, codec = server.negotiate(offer)
+    assert client.agree(answer)
+    server.use(version, codec)
+    return client, server
+
+
+def raisesProtocolError(protocol, data):
+    try:
+        protocol.unpack(data)
+    except ProtocolError:
+        return True
+    return False
+
+
+def testOffer():
+    offer = json.loads(Protocol().offer()[9:])
+    assert offer == {'version': PROTOCOLVERSION, 'compression': list(CODECS.keys())}
+
+
+def testNegotiation():
+    for version in (1, 2, 3):
+        client, server = connect(json.dumps({'version': version, 'compression': ['zlib']}))
+        assert client.version == server.version == version
+        assert client.codec == server.codec == (None if version == 1 else 'zlib')
+        assert client.tagged == server.tagged == (version == 3)
+    client, server = connect(json.dumps({'version': 99, 'compression': ['brotli', 'zlib']}))
+    assert (server.version, server.codec) == (PROTOCOLVERSION, 'zlib')
+    client, server = connect(json.dumps({'version': 3, 'compression': ['brotli']}))
+    assert (server.version, server.codec) == (3, None)
+    client, server = connect('nonsense')
+    assert (server.version, server.codec) == (1, None)
+
+
+def testAgreeRejectsInvalidAnswers():
+    protocol = Protocol()
+    for answer in (None, 'Command not understood.', 'PROTOCOL {', 'PROTOCOL {"version": 2, "compression": "brotli"}'):
+        assert not protocol.agree(answer)
+    assert (protocol.version, protocol.codec) == (1, None)
+
+
+def testRoundTrips():
+    messages = ['READY?', 'x' * (COMPRESSIONTHRESHOLD - 1), 'PUSH ' + json.dumps([[i, 'Node ä'] for i in range(500)])]
+    for version in (1, 2, 3):
+        for codecs in ([], list(CODECS.keys())):
+            client, server = connect(json.dumps({'version': version, 'compression': codecs}))
+            for message in messages:
+                frame = client.encode(message, 7)
+                length, = struct.unpack('>I', frame[:4])
+                assert length == len(frame) - 4
+                assert server.unpack(frame[4:]) == (7 if version == 3 else 0, message)
+                assert server.decode(frame[4:]) == message
+
+
+def testLongMessagesAreCompressed():
+    message = 'x' * COMPRESSIONTHRESHOLD
+    for codec in CODECS.keys():
+        client, server = connect(json.dumps({'version': 3, 'compression': [codec]}))
+        frame = client.encode(message, 1)
+        assert frame[4] == CODECS[codec][0]
+        assert len(frame) < len(message)
+        assert server.unpack(frame[4:]) == (1, message)
+
+
+def testSocketRoundTrip():
+    a, b = socketpair()
+    try:
+        client, server = connect(json.dumps({'version': 3, 'compression': ['zlib']}))
+        message = 'y' * 10 * COMPRESSIONTHRESHOLD
+        client.send(a, message, 5)
+        assert server.receiveTagged(b) == (5, message)
+        a.close()
+        assert server.receive(b) is None
+    finally:
+        a.close()
+        b.close()
+
+
+def testOversizedMessagesAreRejected():
+    client, server = connect(json.dumps({'version': 3, 'compression': ['zlib']}))
+    server.maxLength = 10 * COMPRESSIONTHRESHOLD
+    frame = client.encode('z' * server.maxLength, 1)
+    assert server.unpack(frame[4:]) == (1, 'z' * server.maxLength)
+    frame = client.encode('z' * (server.maxLength + 1), 1)
+    assert len(frame) < server.maxLength
+    assert raisesProtocolError(server, frame[4:])
+    bomb = struct.pack('>BI', CODECS['zlib'][0], 1) + zlib.compress(b'\0' * (1 << 24))
+    assert raisesProtocolError(server, bomb)
+
+
+def testCorruptFramesAreRejected():
+    client, server = connect(json.dumps({'version': 3, 'compression': ['zlib']}))
+    frame = client.encode('z' * COMPRESSIONTHRESHOLD, 1)[4:]
+    assert raisesProtocolError(server, frame[:-5])
+    assert raisesProtocolError(server, frame[:5] + b'garbage')
+    assert raisesProtocolError(server, struct.pack('>BI', 0x7f, 1) + b'data')
+
+
+def testOversizedFramesAreNotReceived():
+    a, b = socketpair()
+    try:
+        server = Protocol(maxLength=100)
+        a.sendall(struct.pack('>I', 101) + b'x' * 101)
+        try:
+            server.receive(b)
+        except ProtocolError:
+            pass
+        else:
+            assert False
+        assert issubclass(ProtocolError, OSError)
+    finally:
+        a.close()
+        b.close()
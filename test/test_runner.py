@@ -0,0 +1,38 @@
+import floppy.graph
+from floppy.runner import parseCommand
+
+
+def testGotoWithoutGraphID():
+    command, graphID, payload = parseCommand('GOTO5')
+    assert (command, graphID, int(payload)) == ('GOTO', None, 5)
+
+
+def testGotoWithSpaceIsNotAGraphID():
+    command, graphID, payload = parseCommand('GOTO 5')
+    assert (command, graphID, int(payload)) == ('GOTO', None, 5)
+
+
+def testGotoWithGraphID():
+    command, graphID, payload = parseCommand('GOTO job 5')
+    assert (command, graphID, int(payload)) == ('GOTO', 'job', 5)
+
+
+def testCommandsWithoutPayload():
+    assert parseCommand('PAUSE') == ('PAUSE', None, '')
+    assert parseCommand('PAUSE job-1.a ') == ('PAUSE', 'job-1.a', '')
+    assert parseCommand('STATUS job') == ('STATUS', 'job', '')
+
+
+def testStatusReportRequest():
+    assert parseCommand('STATUS***5') == ('STATUS', None, '***5')
+    assert parseCommand('STATUS job ***5') == ('STATUS', 'job', '***5')
+
+
+def testJsonPayloads():
+    assert parseCommand('PUSH[]') == ('PUSH', None, '[]')
+    assert parseCommand('PUSH job []') == ('PUSH', 'job', '[]')
+    assert parseCommand('CONFIGURE job {"framerate": 0.1}') == ('CONFIGURE', 'job', '{"framerate": 0.1}')
+
+
+def testUnknownCommand():
+    assert parseCommand('JUMP 5') is None
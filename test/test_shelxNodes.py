@@ -0,0 +1,55 @@
+import asyncio
+import os
+import stat
+import sys
+
+import pytest
+
+import floppy.graph
+pytest.importorskip('lauescript')
+from floppy.graph import Graph
+from floppy.CustomNodes.shelxNodes import RunShelxl
+
+# Stand-in for SHELXL: copies the .ins file to the result files after a delay, so that overlapping runs would read
+# each other's results if they shared a working directory.
+FAKESHELXL = '''#!{python}
+import sys, time
+name = sys.argv[1]
+ins = open(name + '.ins').read()
+time.sleep(.3)
+for extension in ('res', 'fcf'):
+    open(name + '.' + extension, 'w').write(ins)
+open(name + '.lst', 'w').write(ins + '\\n R1 =  0.0{{}} for  100 Fo > 4sig(Fo)\\n'.format(ins[-1]))
+'''
+
+
+@pytest.fixture
+def fakeShelxl(tmp_path, monkeypatch):
+    script = tmp_path / 'shelxl'
+    script.write_text(FAKESHELXL.format(python=sys.executable))
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+    workDir = tmp_path / 'work'
+    workDir.mkdir()
+    monkeypatch.chdir(workDir)
+    return workDir
+
+
+def createNode(ins):
+    node = RunShelxl(0, Graph())
+    for name, value in (('INS', ins), ('HKL', 'hkl'), ('Cycles', 1), ('DAMP', 0), ('Type', 'CGLS')):
+        node.inputs[name].value, node.inputs[name].valueSet = value, True
+    return node
+
+
+def testConcurrentRunsUseSeparateFiles(fakeShelxl):
+    nodes = [createNode('structure {}'.format(i)) for i in range(1, 4)]
+
+    async def runAll():
+        await asyncio.gather(*(node.run() for node in nodes))
+    asyncio.run(runAll())
+    for i, node in enumerate(nodes, 1):
+        assert node.outputs['RES'].value == 'structure {}'.format(i)
+        assert node.outputs['FCF'].value == 'structure {}'.format(i)
+        assert node.outputs['R1'].value == float('0.0{}'.format(i))
+    assert os.listdir(str(fakeShelxl)) == []
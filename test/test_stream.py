@@ -0,0 +1,70 @@
+import os
+import tempfile
+import time
+from threading import Event
+
+import floppy.graph
+from floppy.stream import StreamBuffer, StreamProducer, readChunks
+
+
+def endlessRecords(closed):
+    try:
+        i = 0
+        while True:
+            yield i
+            i += 1
+    finally:
+        closed.set()
+
+
+def testCancelStopsProducerBlockedOnFullBuffer():
+    producers = []
+    for i in range(200):
+        closed = Event()
+        stream = StreamBuffer(1)
+        producers.append((StreamProducer(stream, endlessRecords(closed)), stream, closed))
+    time.sleep(.1)
+    for producer, stream, closed in producers:
+        stream.cancel()
+    for producer, stream, closed in producers:
+        producer.join(2.)
+        assert not producer.is_alive()
+        assert closed.is_set()
+
+
+def testCancelClosesFile():
+    with tempfile.TemporaryDirectory() as directory:
+        fileName = os.path.join(directory, 'lines.txt')
+        with open(fileName, 'w') as fp:
+            fp.write('\n'.join(str(i) for i in range(1000)))
+        fp = open(fileName, 'r')
+        stream = StreamBuffer(1)
+        producer = StreamProducer(stream, readChunks(fp))
+        assert next(stream) == '0'
+        stream.cancel()
+        producer.join(2.)
+        assert not producer.is_alive()
+        assert fp.closed
+        assert list(stream) == []
+
+
+def testConsumerReceivesAllRecords():
+    stream = StreamBuffer(1)
+    StreamProducer(stream, iter(range(100)))
+    assert list(stream) == list(range(100))
+    assert stream.count == 100
+
+
+def testProducerErrorIsRaisedInConsumer():
+    def failing():
+        yield 1
+        raise ValueError('broken')
+    stream = StreamBuffer(1)
+    StreamProducer(stream, failing())
+    assert next(stream) == 1
+    try:
+        next(stream)
+    except ValueError as e:
+        assert str(e) == 'broken'
+    else:
+        assert False, 'ValueError not raised'